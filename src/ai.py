@@ -1,7 +1,113 @@
-from src.env import initialize_gemini_client
+from src.env import LazyClient, GEMINI_MODEL_NAME
+from src.database.lyric_attributes_cache import get_lyric_attribute_cache
+from src.recommendations import RECOMMENDATION_FORMAT, ERROR_FORMAT
+from functools import lru_cache
 import json
 
-model = initialize_gemini_client()  # Initialize the Gemini model
+model = LazyClient("gemini")  # the shared Gemini model, created on first use
+
+BATCH_TOKEN_BUDGET = 24000  # estimated input tokens per batched analysis request
+BATCH_MAX_TRACKS = 25       # more tracks per request make the answers less reliable
+CHARS_PER_TOKEN = 4         # rough estimate, good enough for packing
+
+@lru_cache(maxsize=1)
+def load_lyric_attributes_schema():
+    """
+    The lyric attribute schema from data/prod/lyric_attributes.json.
+    The file is read on the first call only (lru_cache), every call returns the same dict, don't modify it.
+    """
+    with open('data/prod/lyric_attributes.json', 'r') as l:
+        return json.load(l)
+
+def clean_json_response(text):
+    """Remove markdown code block markers around a JSON answer"""
+    return text.strip().replace("```json", "").replace("```", "").strip()
+
+def lyrics_to_text(lyrics):
+    """Genius lyrics come as a list of sections ("[Chorus]\n..."), the prompts need one string"""
+    if isinstance(lyrics, (list, tuple)):
+        return "".join(lyrics)
+    return str(lyrics)
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def pack_batches(texts, token_budget=BATCH_TOKEN_BUDGET, max_tracks=BATCH_MAX_TRACKS, overhead=0):
+    """
+    Split texts into batches that fit into the token budget
+    Args:
+        texts (dict): index -> text
+        overhead (int): tokens every request needs besides the texts (instructions, schema)
+    Returns:
+        list[list]: indices per batch, a text that is too big on its own gets its own batch
+    """
+    batches, current, used = [], [], overhead
+    for i, text in texts.items():
+        cost = estimate_tokens(text)
+        if current and (used + cost > token_budget or len(current) >= max_tracks):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def analyze_lyrics_batch(lyrics_list, task, result_format, single, validate=None, token_budget=BATCH_TOKEN_BUDGET):
+    """
+    Analyze the lyrics of many tracks with as few Gemini requests as possible.
+    The lyrics are packed into requests within the token budget, the model answers with one JSON
+    object keyed by track number. Tracks whose answer is missing or invalid are retried one by one.
+    Args:
+        lyrics_list (list): lyrics per track (None for tracks without lyrics)
+        task (str): what to analyze, in the words of the single track prompt
+        result_format (str): description of the JSON value expected per track
+        single (callable): analyzes one track's lyrics, used as fallback
+        validate (callable, optional): returns True if a parsed value per track is usable
+    Returns:
+        list: one result per entry of lyrics_list, None where nothing could be analyzed
+    """
+    validate = validate or (lambda value: isinstance(value, dict))
+    results = [None] * len(lyrics_list)
+    texts = {i: lyrics_to_text(lyrics) for i, lyrics in enumerate(lyrics_list) if lyrics}
+    overhead = estimate_tokens(task + result_format) + 200
+    failed = []
+    requests_sent = 0
+
+    for batch in pack_batches(texts, token_budget, overhead=overhead):
+        if len(batch) == 1:
+            failed.extend(batch)  # nothing to gain from the batch prompt
+            continue
+        tracks = "\n\n".join(f'Track "{i}":\n{texts[i]}' for i in batch)
+        text = f"""You are a music analysis engine. Your task is to {task} for each of the following tracks:
+
+                {tracks}
+
+                Response Format:
+                - Return ONE JSON object with the track numbers as keys ({', '.join(f'"{i}"' for i in batch)})
+                - The value for every track: {result_format}
+                - Ensure the response is valid JSON format, use " instead of '
+                - DO NOT include markdown code block markers
+
+                DO NOT include any additional text, explanations, or formatting."""
+        requests_sent += 1
+        try:
+            response = model.generate_content(text, generation_config={"response_mime_type": "application/json"})
+            parsed = json.loads(clean_json_response(response.text))
+        except Exception as e:
+            print(f"⚠️ Batched lyric analysis failed, falling back to single requests: {e}")
+            parsed = {}
+        for i in batch:
+            value = parsed.get(str(i)) if isinstance(parsed, dict) else None
+            if value is not None and validate(value):
+                results[i] = value
+            else:
+                failed.append(i)
+
+    for i in failed:
+        results[i] = single(lyrics_list[i])
+    print(f"🧠 Analyzed {len(texts)} lyrics with {requests_sent} batched + {len(failed)} single requests")
+    return results
 
 @staticmethod
 def check_gemini_status():
@@ -18,11 +124,15 @@ def check_gemini_status():
         print(f"❌ Gemini API Error: {e}")
         return False
     
-def ask_ai(discovery_type, origin, limit, track_attributes, lyric_attributes):
+def ask_ai(discovery_type, origin, limit, track_attributes, lyric_attributes, exclude=None, candidates=None):
     '''
     This function sends a request to the AI model for music recommendations based on the provided parameters.
-    It includes error handling for various scenarios and formats the response accordingly.
+    The answer is a JSON array of {"title", "artist"} objects (see src/recommendations.py for the parser).
     It has the possibility to check if the Gemini API is working properly. (if needed)
+    Args:
+        exclude (list, optional): tracks that must not be recommended (e.g. already recommended ones when topping up)
+        candidates (list, optional): (title, artist) shortlist from the local catalog for the model to re-rank
+            (see src/database/candidates.py)
     '''
 
     # if not check_gemini_status():
@@ -31,8 +141,37 @@ def ask_ai(discovery_type, origin, limit, track_attributes, lyric_attributes):
 
     # print('Origin: ', origin) # Print the origin (playlist/song/liked songs/album/artist)
     # print('Limit: ', limit) # Print the limit (number of recommendations)
+    text = build_recommendation_prompt(discovery_type, origin, limit, track_attributes, lyric_attributes, exclude, candidates)
+    response = model.generate_content(text, generation_config=RECOMMENDATION_CONFIG)
+    # print("AI Input: ", text)
+    # print("AI Response: ", response.text) # Print the AI's response
+    # print("==================================================\n")
+    return response.text
+
+def ask_ai_stream(discovery_type, origin, limit, track_attributes, lyric_attributes, exclude=None, candidates=None):
+    """
+    Same request as ask_ai, but yields the response text chunk by chunk while the model is still generating
+    """
+    text = build_recommendation_prompt(discovery_type, origin, limit, track_attributes, lyric_attributes, exclude, candidates)
+    for chunk in model.generate_content(text, generation_config=RECOMMENDATION_CONFIG, stream=True):
+        try:
+            yield chunk.text
+        except ValueError:
+            continue  # chunk without text (e.g. only finish reason / safety info)
+
+RECOMMENDATION_CONFIG = {"response_mime_type": "application/json"}
+
+def build_recommendation_prompt(discovery_type, origin, limit, track_attributes, lyric_attributes, exclude=None, candidates=None):
     track_attributes = json.dumps(track_attributes) # Convert track attributes to JSON string for AI input
-    text = """You are a music recommendation engine. Your task is to recommend music based on the following criteria:
+    extra_rules = []  # numbered after the 3 fixed rules, only the ones that apply
+    if exclude:
+        extra_rules.append("DO NOT recommend any of these tracks: " + json.dumps([{"title": t, "artist": a} for t, a in exclude]))
+    if candidates:
+        # the shortlist is already matched on the attributes, the model only has to pick and order
+        extra_rules.append("Prefer tracks from this shortlist (best match first), only recommend other tracks if not enough of them fit: "
+                           + json.dumps([{"title": t, "artist": a} for t, a, *_ in candidates]))
+    extra_rules = "".join(f"\n        {number}. {rule}" for number, rule in enumerate(extra_rules, start=4))
+    return """You are a music recommendation engine. Your task is to recommend music based on the following criteria:
 
         Input Parameters:
         - Discovery Type: {discovery_type} (defines what kind of music to recommend) => MAKE SURE TO FOLLOW THIS INSTRUCTION 100%
@@ -41,39 +180,44 @@ def ask_ai(discovery_type, origin, limit, track_attributes, lyric_attributes):
         - Lyric Attributes: {lyric_attributes} (focus mainly on this)
         
         Response Rules:
-        1. Output Format: ONLY return a comma-separated list of 'song-artist' pairs
-        2. Maximum Recommendations: {limit}
-        3. Format Example: "Bohemian Rhapsody-Queen, Yesterday-The Beatles"
+        1. Output Format: ONLY return a JSON array of objects with the exact song title and the main artist: {recommendation_format}
+        2. Number of Recommendations: exactly {limit}
+        3. Format Example: [{{"title": "Bohemian Rhapsody", "artist": "Queen"}}, {{"title": "Yesterday", "artist": "The Beatles"}}]{extra_rules}
         
         Error Handling:
-        - If logical error: return "ERROR: Invalid input combination"
-        - If missing data: return "ERROR: Cannot access required data"
-        - For any other error: return "ERROR: [specific error message]"
+        - If logical error: return {{"error": "Invalid input combination"}}
+        - If missing data: return {{"error": "Cannot access required data"}}
+        - For any other error: return {error_format}
         
         DO NOT include any additional text, explanations, or formatting.""".format(
             discovery_type=discovery_type,
             origin=origin,
             track_attributes=json.dumps(track_attributes),
             limit=limit,
-            lyric_attributes=lyric_attributes
+            lyric_attributes=lyric_attributes,
+            recommendation_format=RECOMMENDATION_FORMAT,
+            error_format=ERROR_FORMAT,
+            extra_rules=extra_rules
         )
-    response = model.generate_content(text)
-    # print("AI Input: ", text)
-    # print("AI Response: ", response.text) # Print the AI's response
-    # print("==================================================\n")
-    return response.text
 
-def get_lyric_attributes_ai(lyrics):
+def get_lyric_attributes_ai(lyrics, count_miss=True):
     """
     Get lyric attributes from the lyrics text with ai
+    (answered from the lyric attribute cache if these lyrics were analyzed with the same schema and model before)
+    Args:
+        count_miss (bool): False if the caller already counted the cache miss (the batch fallback)
     Returns: dict with lyric attributes or None if not found
     """
-    print("Getting lyric attributes from AI...")
-    
     try:
-        with open('data/prod/lyric_attributes.json', 'r') as l:
-            lyric_attributes = json.load(l)
+        lyric_attributes = load_lyric_attributes_schema()
+        cache = get_lyric_attribute_cache(lyric_attributes)
+        if lyrics:
+            cached = cache.get(lyrics_to_text(lyrics), GEMINI_MODEL_NAME, count_miss=count_miss)
+            if cached is not None:
+                print("Lyric attributes found in cache")
+                return cached
 
+        print("Getting lyric attributes from AI...")
 
         text = f"""You are a music analysis engine. Your task is to analyze the following lyrics and extract their attributes:
 
@@ -101,8 +245,7 @@ def get_lyric_attributes_ai(lyrics):
         # print("\n-------------------")
 
         # Clean the response by removing markdown code block markers
-        cleaned_response = response.text.strip()
-        cleaned_response = cleaned_response.replace("```json", "").replace("```", "").strip()
+        cleaned_response = clean_json_response(response.text)
         
         # print("Cleaned Response:")
         # print(cleaned_response)
@@ -119,6 +262,8 @@ def get_lyric_attributes_ai(lyrics):
                 
             # Try to parse the cleaned response as JSON
             parsed_response = json.loads(cleaned_response)
+            if lyrics and isinstance(parsed_response, dict):
+                cache.put(lyrics_to_text(lyrics), GEMINI_MODEL_NAME, parsed_response)
             return parsed_response
         except json.JSONDecodeError as je:
             import sys
@@ -132,3 +277,30 @@ def get_lyric_attributes_ai(lyrics):
         exc_type, exc_value, exc_traceback = sys.exc_info()
         print(f"Error in lyric analysis at line {exc_traceback.tb_lineno}: {e}")
         return None
+
+def get_lyric_attributes_ai_batch(lyrics_list, token_budget=BATCH_TOKEN_BUDGET):
+    """
+    Get lyric attributes for many tracks at once, see analyze_lyrics_batch.
+    Lyrics that are in the lyric attribute cache are not sent again.
+    Returns: list with one dict (or None) per entry of lyrics_list
+    """
+    schema = load_lyric_attributes_schema()
+    cache = get_lyric_attribute_cache(schema)
+    results = [cache.get(lyrics_to_text(lyrics), GEMINI_MODEL_NAME) if lyrics else None for lyrics in lyrics_list]
+    missing = [i for i, result in enumerate(results) if result is None and lyrics_list[i]]
+    print(f"Getting lyric attributes for {len(missing)} tracks from AI ({sum(r is not None for r in results)} cached)...")
+    if not missing:
+        return results
+
+    analyzed = analyze_lyrics_batch(
+        [lyrics_list[i] for i in missing],
+        task="analyze the lyrics and extract their attributes",
+        result_format=f"a JSON object with attributes from this schema: {json.dumps(schema)}",
+        single=lambda lyrics: get_lyric_attributes_ai(lyrics, count_miss=False),  # the miss is counted above, caches its own result
+        token_budget=token_budget,
+    )
+    for i, attributes in zip(missing, analyzed):
+        results[i] = attributes
+        if isinstance(attributes, dict):
+            cache.put(lyrics_to_text(lyrics_list[i]), GEMINI_MODEL_NAME, attributes)
+    return results
@@ -1,4 +1,4 @@
-import requests
+from src.http_cache import cached_get
 
 def get_audio_db_info(artist_name, track_name):
     """
@@ -6,10 +6,11 @@ def get_audio_db_info(artist_name, track_name):
     Returns: dict with track information or None if not found
     """
     # TheAudioDB API endpoint
-    url = f"https://www.theaudiodb.com/api/v1/json/2/searchtrack.php?s={artist_name.strip().replace(" ", "%20")}&t={track_name.strip().replace(" ", "%20")}"
-    # print(f"audiodb API URL: {url}")  # Print the API URL for debugging
+    url = "https://www.theaudiodb.com/api/v1/json/2/searchtrack.php"
+    params = {"s": artist_name.strip(), "t": track_name.strip()}
+    # print(f"audiodb API URL: {url} {params}")  # Print the API URL for debugging
     try:
-        response = requests.get(url)
+        response = cached_get("audiodb", url, params=params)
         # print(f"audiodb API Response: {response}")  # Print the API response status code
         data = response.json()
         # print(f"audiodb API Data: {data}")  # Print the API response data for debugging
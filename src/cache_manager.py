@@ -1,56 +1,264 @@
+import atexit
 import json
 import os
-from src.utils import element_name_to_id
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_PATH = 'data/prod/cache.json'
+FLUSH_DELAY = 2.0  # seconds, updates within this time are written to disk together
+DEFAULT_LIMIT = 10
+PLAYLIST_VERIFY_INTERVAL = 7 * 24 * 60 * 60  # seconds a verified default playlist id is trusted without asking Spotify
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on path + '.lock', held by one process at a time"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'a+') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CacheStore:
+    """
+    cache.json in memory: loaded once, updates are written behind (FLUSH_DELAY after the first one)
+    and at exit. A flush merges the changed keys into the current file under a file lock and replaces
+    the file atomically, so several processes can share it without losing each other's updates.
+    """
+    def __init__(self, path=CACHE_PATH, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.lock = threading.RLock()
+        self.data = None
+        self.dirty = set()  # keys changed since the last flush
+        self.timer = None
+        self.exists = False  # was there a cache file when it was loaded
+        atexit.register(self.flush)
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'r') as cache:
+                return json.load(cache)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Cache file is invalid, starting with an empty cache: {e}")
+            return {}
+
+    def _loaded(self):
+        """The cache data, read from disk on first use (lock must be held)"""
+        if self.data is None:
+            data = self._read_file()
+            self.exists = data is not None
+            self.data = data or {}
+        return self.data
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self._loaded().get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self._loaded()[key] = value
+            self.dirty.add(key)
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def snapshot(self):
+        """Copy of all cached data"""
+        with self.lock:
+            return dict(self._loaded())
+
+    def flush(self):
+        """Write the changed keys to disk now"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            try:
+                with file_lock(self.path):
+                    # keys changed by other processes since we loaded stay, ours win
+                    merged = self._read_file() or {}
+                    merged.update({key: self.data[key] for key in self.dirty})
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+                    try:
+                        with os.fdopen(fd, 'w') as tmp:
+                            json.dump(merged, tmp)
+                            tmp.flush()
+                            os.fsync(tmp.fileno())
+                        os.replace(tmp_path, self.path)
+                    except BaseException:
+                        os.remove(tmp_path)
+                        raise
+                self.data = merged
+                self.dirty.clear()
+                self.exists = True
+            except OSError as e:
+                print(f"❌ Error writing cache: {e}")
+
+    def reload(self):
+        """Drop unflushed changes and read the file again"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.data = None
+            self.dirty.clear()
+            return self._loaded()
+
+    # typed accessors for the keys the app uses
+    @property
+    def default_limit(self):
+        try:
+            return int(self.get('default_limit', DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return DEFAULT_LIMIT
+
+    @default_limit.setter
+    def default_limit(self, value):
+        self.set('default_limit', int(value))
+
+    @property
+    def default_playlist_name(self):
+        return self.get('default_playlist_name')
+
+    @default_playlist_name.setter
+    def default_playlist_name(self, value):
+        if value != self.default_playlist_name:
+            self.set('default_playlist_verified_at', None)
+        self.set('default_playlist_name', value)
+
+    @property
+    def default_playlist_id(self):
+        return self.get('default_playlist_id')
+
+    @default_playlist_id.setter
+    def default_playlist_id(self, value):
+        if value != self.default_playlist_id:
+            self.set('default_playlist_verified_at', None)
+        self.set('default_playlist_id', value)
+
+    @property
+    def default_playlist_verified_at(self):
+        """When the default playlist id was last confirmed to belong to the default playlist name (unix time)"""
+        return self.get('default_playlist_verified_at')
+
+    @default_playlist_verified_at.setter
+    def default_playlist_verified_at(self, timestamp):
+        self.set('default_playlist_verified_at', timestamp)
+
+    @property
+    def genius_token(self):
+        return self.get('genius_token')
+
+    @genius_token.setter
+    def genius_token(self, token_info):
+        self.set('genius_token', token_info)
+
+    @property
+    def lyrics_strategy(self):
+        """Name of the lyrics extractor strategy that worked last (see lyrics_extractor.STRATEGIES)"""
+        return self.get('lyrics_strategy')
+
+    @lyrics_strategy.setter
+    def lyrics_strategy(self, name):
+        self.set('lyrics_strategy', name)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """The process wide cache, loaded on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheStore()
+        return _cache
+
+
+TYPED_KEYS = ('default_limit', 'default_playlist_name', 'default_playlist_id', 'default_playlist_verified_at', 'genius_token', 'lyrics_strategy')
 
 def update_cache_data(key, value):
-    """Update a specific key in the cache file while preserving other data"""
+    """Update a specific key in the cache while preserving other data (written to disk shortly after)"""
     try:
-        # Read existing cache data
-        cache_data = {}
-        try:
-            with open('data/prod/cache.json', 'r') as cache:
-                cache_data = json.load(cache)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # File doesn't exist or is empty/invalid
-            raise FileNotFoundError("Cache file not found or is empty. Creating a new one.")
-
-        # Update the specific key
-        cache_data[key] = value
-
-        # Write back all data
-        with open('data/prod/cache.json', 'w') as cache:
-            json.dump(cache_data, cache)
-        
+        if key in TYPED_KEYS:
+            setattr(get_cache(), key, value)  # converts the value and resets what depends on it
+        else:
+            get_cache().set(key, value)
         return True
-    
     except Exception as e:
         print(f"❌ Error updating cache: {e}")
         return False
 
 def load_cache_data():
-    """Load cache data from the cache file"""
+    """
+    Load cache data from the cache file, without any network call
+    (the default playlist id is verified when it's used, see verify_default_playlist)
+    """
     global default_limit, default_playlist_name, default_playlist_id
 
-    if os.path.exists('data/prod/cache.json'):
-        with open('data/prod/cache.json', 'r') as cache:
-            cache_data = json.load(cache)
-            default_limit = cache_data.get('default_limit')
-    else: default_limit = 10 # read the default playlist name from the cache (if it exists)
-
-    if os.path.exists('data/prod/cache.json'):
-        with open('data/prod/cache.json', 'r') as cache:
-            cache_data = json.load(cache)
-            default_playlist_name = cache_data.get('default_playlist_name', None)
-            default_playlist_id = cache_data.get('default_playlist_id', None)
-        if default_playlist_name is not None:
-            if default_playlist_id != element_name_to_id(default_playlist_name, "playlist"):
-                print(f"Default playlist name '{default_playlist_name}' does not match the ID '{default_playlist_id}'. Please check your cache.")
-                print("default playlist id: ", default_playlist_id)
-                print("default playlist name: ", default_playlist_name)
-                print("playlist id from name: is something else (but cant show lol)")
-            else: 
-                print("cache matches")
-        return default_playlist_name, default_playlist_id, default_limit
-    else: 
-        default_playlist_name = None # read the default playlist name from the cache (if it exists)
+    cache = get_cache()
+    default_limit = cache.default_limit
+    default_playlist_name = cache.default_playlist_name
+    default_playlist_id = cache.default_playlist_id
+    if not cache.exists:
         print("No cache file found. Please set one ('data/prod/cache.json') to save the default playlist name.")
+    return default_playlist_name, default_playlist_id, default_limit
+
+def mark_default_playlist_verified():
+    """Call after the default playlist id was looked up by its name"""
+    get_cache().default_playlist_verified_at = time.time()
+
+def verify_default_playlist(sp, force=False):
+    """
+    Check that the cached default playlist id still is the playlist with the default playlist name.
+    Only asks Spotify if the last check is older than PLAYLIST_VERIFY_INTERVAL (or force is set).
+    Args:
+        sp: Spotify client
+        force (bool): check even if the last check is recent
+    Returns:
+        bool: True if the id matches the name
+    """
+    cache = get_cache()
+    name, playlist_id = cache.default_playlist_name, cache.default_playlist_id
+    if name is None or playlist_id is None:
+        return False
+    verified_at = cache.default_playlist_verified_at
+    if not force and verified_at and time.time() - verified_at < PLAYLIST_VERIFY_INTERVAL:
+        return True
+
+    try:
+        playlist = sp.playlist(playlist_id, fields='id,name')
+    except Exception as e:
+        print(f"Default playlist '{name}' ({playlist_id}) could not be loaded: {e}")
+        return False
+    if playlist.get('name') != name:
+        print(f"Default playlist name '{name}' does not match the ID '{playlist_id}' (is called '{playlist.get('name')}'). Please check your cache.")
+        return False
+    mark_default_playlist_verified()
+    print("cache matches")
+    return True
@@ -0,0 +1,224 @@
+import threading
+import time
+from typing import NamedTuple
+from src.database.factory import db_factory
+from src.database.resolution_index import get_resolution_index
+from src.database.feature_matrix import get_feature_matrix
+from src.database.track_attributes import split_values
+
+# how much a matching attribute adds to a candidate's score
+WEIGHTS = {
+    "top_genre": 3.0,       # candidate's top genre is one of the seed's genres
+    "genre": 1.5,           # one of the candidate's other genres is
+    "topic": 2.0,           # per shared lyric topic
+    "language": 1.0,
+    "language_level": 0.5,
+    "year": 1.0,            # scaled by how close the release years are (see YEAR_RANGE)
+    "length": 0.5,          # scaled by how close the song lengths are (see LENGTH_RANGE)
+    "similarity": 4.0,      # scaled by the feature matrix similarity, only for seeds that are in the matrix
+}
+YEAR_RANGE = 20       # years apart at which the year similarity reaches 0
+LENGTH_RANGE = 120    # seconds apart at which the length similarity reaches 0
+POOL_FACTOR = 5       # candidates scored on the indexed attributes per returned candidate
+SHORTLIST_SIZE = 30   # candidates passed to the model to re-rank
+
+
+class Candidate(NamedTuple):
+    """One catalog track, unpacks like a Recommendation (title, artist)"""
+    title: str
+    artist: str
+    track_id: str
+    score: float
+
+    def __str__(self):
+        return f"{self.title} - {self.artist}"
+
+    def key(self):
+        """Same identity as Recommendation.key"""
+        return (self.title.casefold(), self.artist.casefold())
+
+    @property
+    def uri(self):
+        return f"spotify:track:{self.track_id}"
+
+
+def leaves(value):
+    """Every string in a nested dict/list (e.g. the themes of the AI lyric attributes)"""
+    if isinstance(value, dict):
+        return [leaf for v in value.values() for leaf in leaves(v)]
+    if isinstance(value, (list, tuple)):
+        return [leaf for v in value for leaf in leaves(v)]
+    return [value] if isinstance(value, str) else []
+
+def year_of(release_date):
+    try:
+        return int(str(release_date)[:4])
+    except (TypeError, ValueError):
+        return None
+
+def closeness(a, b, scale):
+    """1 for equal values, falling linearly to 0 at scale apart (0 if one is unknown)"""
+    if a is None or b is None:
+        return 0.0
+    return max(0.0, 1 - abs(a - b) / scale)
+
+
+class CandidateIndex:
+    """
+    Local candidate retrieval over the imported catalog in songs.db: scores tracks against the attributes
+    of a seed track (genres, topics, language, language level, release year, length) without asking any API.
+    The genre, topic and language matches are summed up through the indexed link tables, only the best
+    pool of those (plus the tracks closest to an imported seed in the feature matrix) is scored on the
+    remaining attributes.
+    Safe to share between threads.
+    """
+    def __init__(self, db_path='data/prod/songs.db', feature_matrix=None):
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+        self.feature_matrix = feature_matrix  # get_feature_matrix() if None
+
+    def stored_seed(self, track_id):
+        """Seed attributes of an imported track, None if it isn't in the catalog"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT language, language_level, release_date, song_length FROM audio_features WHERE track_id = ?',
+                (track_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            genres = [name for (name,) in self.conn.execute('''
+                SELECT genres.name FROM track_genres JOIN genres ON genres.id = track_genres.genre_id
+                WHERE track_genres.track_id = ? ORDER BY track_genres.is_top DESC
+            ''', (track_id,))]
+            topics = [name for (name,) in self.conn.execute('''
+                SELECT topics.name FROM track_topics JOIN topics ON topics.id = track_topics.topic_id
+                WHERE track_topics.track_id = ?
+            ''', (track_id,))]
+        language, language_level, release_date, song_length = row
+        return {
+            "track_id": track_id,
+            "genres": genres,
+            "topics": topics,
+            "language": language or None,
+            "language_level": split_values(language_level)[0] if split_values(language_level) else None,
+            "year": year_of(release_date),
+            "song_length": song_length or None,
+        }
+
+    def seed(self, title, artist, track_attributes=None, lyric_attributes=None):
+        """
+        Attributes of the seed track: from the catalog if it was imported, otherwise from the
+        TheAudioDB info (genre, style, duration) and the themes of the AI lyric attributes
+        Returns:
+            dict: track_id, genres, topics, language, language_level, year, song_length (unknown ones None/empty)
+        """
+        known = get_resolution_index().lookup(title, artist, fuzzy=False)
+        stored = self.stored_seed(known["track_id"]) if known else None
+        if stored and (stored["genres"] or stored["topics"]):
+            return stored
+
+        track_attributes = track_attributes if isinstance(track_attributes, dict) else {}
+        lyric_attributes = lyric_attributes if isinstance(lyric_attributes, dict) else {}
+        themes = lyric_attributes.get("lyrics_attributes", lyric_attributes).get("semantic", {}).get("themes", {})
+        duration = track_attributes.get("intDuration")
+        return {
+            "track_id": known["track_id"] if known else None,
+            "genres": split_values([track_attributes.get("strGenre"), track_attributes.get("strStyle")]),
+            "topics": split_values(leaves(themes)),
+            "language": stored["language"] if stored else None,
+            "language_level": stored["language_level"] if stored else None,
+            "year": stored["year"] if stored else None,
+            "song_length": int(duration) / 1000 if str(duration or '').isdigit() else None,  # TheAudioDB: ms
+        }
+
+    def _indexed_scores(self, seed, pool_size):
+        """(track_id, score) of the best pool_size tracks on the genre, topic and language matches"""
+        parts, params = [], []
+        if seed["genres"]:
+            marks = ", ".join("?" for _ in seed["genres"])
+            parts.append(f'''
+                SELECT track_genres.track_id, CASE WHEN track_genres.is_top THEN ? ELSE ? END AS weight
+                FROM genres JOIN track_genres ON track_genres.genre_id = genres.id WHERE genres.name IN ({marks})''')
+            params += [WEIGHTS["top_genre"], WEIGHTS["genre"], *seed["genres"]]
+        if seed["topics"]:
+            marks = ", ".join("?" for _ in seed["topics"])
+            parts.append(f'''
+                SELECT track_topics.track_id, ? AS weight
+                FROM topics JOIN track_topics ON track_topics.topic_id = topics.id WHERE topics.name IN ({marks})''')
+            params += [WEIGHTS["topic"], *seed["topics"]]
+        if seed["language"]:
+            parts.append('SELECT track_id, ? AS weight FROM audio_features WHERE language = ?')
+            params += [WEIGHTS["language"], seed["language"]]
+        if not parts:
+            return []
+        query = f'''
+            SELECT track_id, SUM(weight) AS score FROM ({" UNION ALL ".join(parts)})
+            WHERE track_id IS NOT ?
+            GROUP BY track_id ORDER BY score DESC LIMIT ?
+        '''
+        with self.lock:
+            return self.conn.execute(query, (*params, seed.get("track_id"), pool_size)).fetchall()
+
+    def _similar(self, seed, k, exclude):
+        """(track_id, similarity) of the k tracks closest to the seed in the feature matrix, empty if it isn't in there"""
+        if not seed.get("track_id"):
+            return []
+        try:
+            return (self.feature_matrix or get_feature_matrix()).similar(seed["track_id"], k, exclude)
+        except Exception as e:  # e.g. numpy missing, the link tables still give candidates
+            print(f"⚠️ Feature matrix similarity failed, using the indexed attributes only: {e}")
+            return []
+
+    def candidates(self, seed, k=SHORTLIST_SIZE, exclude=()):
+        """
+        Top-k catalog tracks for a seed (see seed())
+        Args:
+            seed (dict): seed attributes
+            k (int): number of candidates
+            exclude (iterable): track ids that must not be returned
+        Returns:
+            list[Candidate]: best first
+        """
+        start = time.perf_counter()
+        exclude = set(exclude)
+        pool_size = k * POOL_FACTOR
+        scores = {track_id: score for track_id, score in self._indexed_scores(seed, pool_size + len(exclude))
+                  if track_id not in exclude}
+        similarity = dict(self._similar(seed, pool_size, exclude))
+        for track_id in similarity:
+            scores.setdefault(track_id, 0.0)  # close in the matrix, but no shared genre/topic/language
+        if not scores:
+            return []
+        ids = list(scores)
+        with self.lock:
+            rows = self.conn.execute(f'''
+                SELECT tracks.track_id, tracks.name, tracks.main_artist_name,
+                       audio_features.language_level, audio_features.release_date, audio_features.song_length
+                FROM tracks LEFT JOIN audio_features ON audio_features.track_id = tracks.track_id
+                WHERE tracks.track_id IN ({", ".join("?" for _ in ids)})
+            ''', ids).fetchall()
+
+        results = []
+        for track_id, title, artist, language_level, release_date, song_length in rows:
+            score = scores[track_id]
+            if seed["language_level"] and seed["language_level"] in split_values(language_level):
+                score += WEIGHTS["language_level"]
+            score += WEIGHTS["year"] * closeness(seed["year"], year_of(release_date), YEAR_RANGE)
+            score += WEIGHTS["length"] * closeness(seed["song_length"], song_length, LENGTH_RANGE)
+            score += WEIGHTS["similarity"] * max(similarity.get(track_id, 0.0), 0.0)
+            results.append(Candidate(title, artist, track_id, round(score, 3)))
+        results.sort(key=lambda c: c.score, reverse=True)
+        print(f"🗂️ {min(k, len(results))} local candidates out of {len(scores)} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return results[:k]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_candidate_index():
+    """The process wide index, opened on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CandidateIndex()
+        return _index
@@ -1,13 +1,134 @@
-from src.env import initialize_spotify_client
-from track_attributes import data, db
+from src.env import get_client
+from src.database.track_attributes import data, db
+from src.database.pipeline import ImportPipeline, Stage
+from src.database.factory import db_factory
 from src.genius import get_lyrics_genius
+from src.http_cache import print_cache_stats
+from src.database.resolution_index import get_resolution_index
+from src.database.lyrics_store import get_lyrics_store
+from src.database.feature_matrix import get_feature_matrix
 from src.utils import element_name_to_id, id_to_element_name
-import traceback # for viewing full error tracebacks
-
-
-def start_import():
+import threading
+
+
+# number of worker threads per external service, GetGenre gets the most since it sleeps while it polls
+DEFAULT_WORKERS = {
+    "lyrics": 4,    # Genius
+    "metadata": 4,  # Spotify search
+    "genre": 8,     # GetGenre
+    "analysis": 2,  # Gemini
+    "artist": 2,    # Spotify + Wikidata
+}
+ANALYSIS_BATCH_SIZE = 10  # tracks per Gemini request in the analysis stage
+WRITE_BATCH_SIZE = 50     # tracks per SQLite transaction in the writer stage
+
+
+def playlist_items(playlist_id):
+    """Yield every item of a playlist, page by page, so the pipeline can start before the last page is loaded"""
+    page = sp.playlist_tracks(playlist_id)
+    while page:
+        for item in page['items']:
+            yield item
+        page = sp.next(page) if page.get('next') else None
+
+
+def fetch_lyrics(track_data):
+    track_data.lyrics = get_lyrics_genius(track_data.artist, track_data.title, track_data.track_id)
+    return track_data
+
+# every stage only warms one of the lazy facts on data, the writer then builds its dicts from them
+def fetch_metadata(track_data):
+    track_data.metadata
+    track_data.main_artist_id
+    return track_data
+
+def fetch_genre(track_data):
+    track_data.genre
+    return track_data
+
+def fetch_analysis(tracks):
+    # batched: one Gemini request for up to ANALYSIS_BATCH_SIZE tracks
+    return data.analyze_lyrics_batch(tracks)
+
+
+class fetch_artist:
+    """Pipeline stage that loads each main artist only once per import (and never if already in the db)"""
+    def __init__(self, known_artist_ids):
+        self.known = set(known_artist_ids)
+        self.lock = threading.Lock()
+
+    def __call__(self, track_data):
+        track_data.artist_dict = None
+        artist_id = track_data.main_artist_id
+        with self.lock:
+            if artist_id is None or artist_id in self.known:
+                return track_data
+            self.known.add(artist_id)  # claim it, so no other worker fetches the same artist
+        try:
+            track_data.artist_dict = track_data.artist_to_dict()
+        except Exception as e:
+            print(f"❌ Error loading artist {track_data.artist} ({artist_id}): {e}")
+        if not track_data.artist_dict:
+            with self.lock:
+                self.known.discard(artist_id)  # release the claim, the next track of this artist tries again
+        return track_data
+
+
+class write_track:
+    """
+    Pipeline stage that writes to SQLite, runs on a single thread since it owns the connection.
+    Batched: every batch of tracks is upserted in one transaction (see db.write_batch).
+    """
+    def __init__(self):
+        self.db_instance = None
+
+    def __call__(self, tracks):
+        if self.db_instance is None:
+            self.db_instance = db()  # created here so the connection belongs to the writer thread
+
+        track_dicts, audio_features_dicts, artist_dicts = [], [], []
+        for track_data in tracks:
+            track_data.fetched_only()  # a fact whose stage failed is skipped, not fetched again on this thread
+            track_data_dict = track_data.track_data_to_dict()
+            audio_features_dict = track_data.audio_features_to_dict()
+            if track_data_dict:
+                track_dicts.append(track_data_dict)
+            else:
+                print(f"Skipping track {track_data.title} by {track_data.artist} due to missing data.")
+            if audio_features_dict:
+                audio_features_dicts.append(audio_features_dict)
+            else:
+                print(f"Skipping audio features for track {track_data.title} by {track_data.artist} due to missing data.")
+            if track_data.artist_dict:
+                artist_dicts.append(track_data.artist_dict)
+
+        written = self.db_instance.write_batch(track_dicts, audio_features_dicts, artist_dicts)
+        # only tracks that are stored now, skipped ones are searched again next time
+        get_resolution_index().add_many(
+            [(t["title"], t["main_artist"], t["track_id"]) for t in track_dicts if t["track_id"] in written["tracks"]],
+            source="import")
+        try:
+            get_feature_matrix().add_tracks([f["track_id"] for f in audio_features_dicts if f["track_id"] in written["audio_features"]])  # only the new rows are written
+        except Exception as e:  # the tracks are stored already, a missing row is added by build_features
+            print(f"❌ Could not add {len(written['audio_features'])} tracks to the feature matrix, run python db.py build_features: {e}")
+
+        return tracks
+
+
+def start_import(workers=None, report_interval=15, write_batch_size=WRITE_BATCH_SIZE):
+    """
+    Import every track of a playlist into the database.
+    Lyrics, metadata, genre, AI analysis and artist lookups each run in their own worker pool,
+    so the slow services overlap across tracks; a single writer upserts them into SQLite in batches.
+    Args:
+        workers (dict, optional): worker count per stage, overrides DEFAULT_WORKERS
+        report_interval (float): seconds between throughput/queue depth reports
+        write_batch_size (int): tracks per SQLite transaction
+    Returns:
+        dict: final stats per stage
+    """
     global sp
-    sp = initialize_spotify_client()  # initialize the Spotify client
+    sp = get_client("spotify")  # the shared Spotify client
 
     playlist_id = input("give playlist id or link: ")
     # playlist_id = "https://open.spotify.com/playlist/4qUAY4SFePhy63TeKz3OJo?si=46fa95f46015447c&pt=edbfbcf9956a09a617ce5be212a7dda5" # for testing purposes
@@ -15,76 +136,53 @@ def start_import():
         playlist_id = playlist_id.split("/")[-1]  # extract the playlist ID from the link
         if "?" in playlist_id:
             playlist_id = playlist_id.split("?")[0]
-    
-    # Get tracks from the playlist
-    tracks = sp.playlist_tracks(playlist_id)
-    db_instance = db() 
-    
-    for item in tracks['items']:
-        try:
-            track = item['track']
-            track_id = track['id']
-            track_name = track['name']
-            main_artist_name = track['artists'][0]['name']
 
-            lyrics = get_lyrics_genius(main_artist_name, track_name)
-            track_data = data(main_artist_name, track_name, track_id, lyrics)
-            track_data_dict = track_data.track_data_to_dict()
-            audio_features_dict = track_data.audio_features_to_dict()
-            
-
-            # Efficiently check and insert
-            if not db_instance.track_exists(track_id):
-                if track_data_dict:
-                    db_instance.add_track(track_data_dict)
-                else:
-                    print(f"Skipping track {track_name} by {main_artist_name} due to missing data.")
-            else:
-                print(f"Track {track_name} by {main_artist_name} already exists in the tracks table.")
-
-            if not db_instance.audio_features_exists(track_id):
-                if audio_features_dict:
-                    db_instance.add_audio_features(audio_features_dict)
-                else:
-                    print(f"Skipping audio features for track {track_name} by {main_artist_name} due to missing data.")
-            else:
-                print(f"Audio features for track {track_name} by {main_artist_name} already exist in the audio_features table.")
-
-            if not db_instance.artist_exists(track_data_dict["main_artist_id"]):
-                # Add artist to the database if it doesn't exist
-                artist_dict = db_instance.artist_to_dict()
-
-                db_instance.cursor.execute('''
-                    INSERT INTO artists (id, name, monthly_listeners, age, birth_date, number_of_tracks, number_of_albums, album_names)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (track_data_dict["main_artist_id"], track_data_dict["main_artist"],
-                    track_data_dict["main_artist_monthly_listeners"], track_data_dict["main_artist_age"],
-                    track_data_dict["main_artist_birth_date"], track_data_dict["main_artist_number_of_tracks"],
-                    track_data_dict["main_artist_number_of_albums"], track_data_dict["main_artist_album_names"]))
-                db_instance.conn.commit()
-
-
-
-        except Exception as e:
-            print(f"Error processing track {item.get('track', {}).get('name', 'unknown')}: {e}")
-            traceback.print_exc()
+    workers = {**DEFAULT_WORKERS, **(workers or {})}
+
+    # artists that are already stored don't have to be crawled again
+    known_db = db()
+    known_db.cursor.execute("SELECT id FROM artists")
+    known_artist_ids = [row[0] for row in known_db.cursor.fetchall()]
+    known_db.conn.close()
+
+    pipeline = ImportPipeline([
+        Stage("lyrics", fetch_lyrics, workers["lyrics"]),
+        Stage("metadata", fetch_metadata, workers["metadata"]),
+        Stage("genre", fetch_genre, workers["genre"]),
+        Stage("analysis", fetch_analysis, workers["analysis"], batch_size=ANALYSIS_BATCH_SIZE),
+        Stage("artist", fetch_artist(known_artist_ids), workers["artist"]),
+        Stage("writer", write_track(), workers=1, batch_size=write_batch_size),
+    ], report_interval=report_interval)
+
+    def tracks():
+        for item in playlist_items(playlist_id):
+            track = item.get('track')
+            if not track or not track.get('id'):  # local files and removed tracks have no id
+                continue
+            yield data(track['artists'][0]['name'], track['name'], track['id'])
+
+    stats = pipeline.run(tracks())
+    print_cache_stats()
+    get_resolution_index().print_stats()
+    get_lyrics_store().print_stats()
+    return stats
             
 
 def import_artist(artist_id=None, artist_name=None):
     global sp
-    sp = initialize_spotify_client()  # initialize the Spotify client
+    sp = get_client("spotify")  # the shared Spotify client
 
     if artist_id is None and artist_name is None:
         print("give either artist_id or artist_name")
         return
 
     if artist_id is None:
-        artist_id = element_name_to_id(artist_name=artist_name, element_type="artist")
+        artist_id = element_name_to_id(element_name=artist_name, element_type="artist")
     
     if artist_name is None:
         artist_name = id_to_element_name(element_id=artist_id, type="artist").split("(")[0]
     
-    track_data = data(artist=artist_name)
+    track_data = data(artist=artist_name, artist_id=artist_id)
     db_instance = db()
 
     artist_dict =  track_data.artist_to_dict()
@@ -98,9 +196,17 @@ if __name__ == "__main__":
     action = sys.argv[1] if len(sys.argv) > 1 else None
     if action == "start_import":
         start_import()
+    elif action == "migrate":
+        db_factory.create_db('data/prod/songs.db')  # upgrades an existing database in place
+    elif action == "backfill_links":
+        db_instance = db('data/prod/songs.db')  # connecting migrates, so the link tables exist
+        db_instance.backfill_links()
+        db_instance.close()
+    elif action == "build_features":
+        get_feature_matrix().rebuild()
     elif action == "import_artist":
         artist_id = sys.argv[2] if len(sys.argv) > 2 else None
         artist_name = sys.argv[3] if len(sys.argv) > 3 else None
         import_artist(artist_id, artist_name)
     else:
-        print("Usage: python db.py start_import OR python db.py import_artist <artist_id> <artist_name>")
+        print("Usage: python db.py start_import OR python db.py migrate OR python db.py backfill_links OR python db.py build_features OR python db.py import_artist <artist_id> <artist_name>")
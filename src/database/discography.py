@@ -0,0 +1,143 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.http_client import RateLimiter
+from src.resolver import chunked
+from src.database.factory import db_factory
+
+ALBUM_PAGE_SIZE = 50       # max. albums per artist_albums page
+ALBUMS_PER_REQUEST = 20    # max. ids per sp.albums call
+MAX_CONCURRENT_REQUESTS = 4
+REQUESTS_PER_SECOND = 5    # the crawler shares Spotify's rate limit with the rest of the import
+REFRESH_INTERVAL = 7 * 24 * 60 * 60  # seconds a crawled discography is used without asking Spotify
+INCLUDE_GROUPS = "album,single,compilation,appears_on"
+
+spotify_limiter = RateLimiter(REQUESTS_PER_SECOND, burst=MAX_CONCURRENT_REQUESTS)
+
+
+class DiscographyCache:
+    """
+    Albums of every crawled artist in songs.db, with the number of tracks the artist is on per album,
+    so a refresh only has to load albums that weren't seen before.
+    Safe to share between threads.
+    """
+    def __init__(self, db_path='data/prod/songs.db'):
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+
+    def refreshed_at(self, artist_id):
+        with self.lock:
+            row = self.conn.execute('SELECT refreshed_at FROM discography_artists WHERE artist_id = ?', (artist_id,)).fetchone()
+        return row[0] if row else None
+
+    def album_ids(self, artist_id):
+        with self.lock:
+            return {row[0] for row in self.conn.execute('SELECT album_id FROM discography WHERE artist_id = ?', (artist_id,))}
+
+    def albums(self, artist_id):
+        """
+        Returns:
+            list: (album_id, name, album_group, release_date, total_tracks, artist_tracks) of the artist, oldest first
+        """
+        with self.lock:
+            return self.conn.execute('''
+                SELECT album_id, name, album_group, release_date, total_tracks, artist_tracks
+                FROM discography WHERE artist_id = ? ORDER BY release_date
+            ''', (artist_id,)).fetchall()
+
+    def update(self, artist_id, new_albums, removed_ids):
+        """
+        Store newly crawled albums and drop the ones that are no longer listed
+        Args:
+            new_albums (list): (album_id, name, album_group, release_date, total_tracks, artist_tracks)
+            removed_ids (iterable): album ids to delete
+        """
+        with self.lock:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO discography (artist_id, album_id, name, album_group, release_date, total_tracks, artist_tracks)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(artist_id, *album) for album in new_albums])
+            self.conn.executemany('DELETE FROM discography WHERE artist_id = ? AND album_id = ?',
+                                  [(artist_id, album_id) for album_id in removed_ids])
+            self.conn.execute('INSERT OR REPLACE INTO discography_artists (artist_id, refreshed_at) VALUES (?, ?)',
+                              (artist_id, time.time()))
+            self.conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_discography_cache():
+    """The process wide cache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiscographyCache()
+        return _cache
+
+
+def _limited(func, *args, **kwargs):
+    spotify_limiter.acquire()
+    return func(*args, **kwargs)
+
+def list_albums(sp, artist_id, pool):
+    """
+    Every album the artist is listed on (all pages, the pages after the first one are loaded concurrently)
+    Returns:
+        dict: album id -> simplified album object
+    """
+    first = _limited(sp.artist_albums, artist_id, include_groups=INCLUDE_GROUPS, limit=ALBUM_PAGE_SIZE)
+    pages = [first]
+    offsets = range(ALBUM_PAGE_SIZE, first['total'], ALBUM_PAGE_SIZE)
+    pages += pool.map(lambda offset: _limited(sp.artist_albums, artist_id, include_groups=INCLUDE_GROUPS,
+                                              limit=ALBUM_PAGE_SIZE, offset=offset), offsets)
+    return {album['id']: album for page in pages for album in page['items'] if album}
+
+def count_artist_tracks(sp, album, artist_id):
+    """Tracks of a full album object the artist is on (main or featured), album track pages included"""
+    count = 0
+    page = album['tracks']
+    while page:
+        count += sum(1 for track in page['items'] if track and any(a['id'] == artist_id for a in track['artists']))
+        page = _limited(sp.next, page) if page.get('next') else None
+    return count
+
+def crawl_discography(sp, artist_id, force=False):
+    """
+    Crawl the discography of an artist: all artist_albums pages, then the albums that aren't cached yet
+    in batches of ALBUMS_PER_REQUEST, concurrently and under the crawler's rate limit.
+    A discography younger than REFRESH_INTERVAL is answered from the cache without any request.
+    Args:
+        sp: Spotify client
+        artist_id (str): Spotify artist id
+        force (bool): refresh even if the cached discography is recent
+    Returns:
+        dict: album_names and number_of_albums (album releases only) and number_of_tracks (tracks the artist is on)
+    """
+    cache = get_discography_cache()
+    refreshed_at = cache.refreshed_at(artist_id)
+    if force or refreshed_at is None or time.time() - refreshed_at > REFRESH_INTERVAL:
+        known = cache.album_ids(artist_id)
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as pool:
+            listed = list_albums(sp, artist_id, pool)
+            new_ids = [album_id for album_id in listed if album_id not in known]
+            # sp.albums answers in the order of the requested ids, but a relinked album can come back under another id,
+            # so every album is kept under the id it was listed (and is cached) with
+            batches = pool.map(lambda ids: zip(ids, _limited(sp.albums, ids)['albums']), chunked(new_ids, ALBUMS_PER_REQUEST))
+            full_albums = [(album_id, album) for batch in batches for album_id, album in batch if album]
+            counts = pool.map(lambda item: count_artist_tracks(sp, item[1], artist_id), full_albums)
+            new_albums = [
+                (album_id, album['name'], listed[album_id].get('album_group'), album.get('release_date'),
+                 album.get('total_tracks'), count)
+                for (album_id, album), count in zip(full_albums, counts)
+            ]
+        cache.update(artist_id, new_albums, known - set(listed))
+        print(f"💿 Discography of {artist_id}: {len(listed)} albums, {len(new_albums)} new")
+
+    albums = cache.albums(artist_id)
+    album_names = [name for _, name, group, *_ in albums if group == "album"]
+    return {
+        "album_names": album_names,
+        "number_of_albums": len(album_names),
+        "number_of_tracks": sum(artist_tracks or 0 for *_, artist_tracks in albums),
+    }
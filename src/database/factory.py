@@ -1,93 +1,302 @@
 import os
 import sqlite3
+import threading
+
+# applied to every connection (see db_factory.connect)
+PRAGMAS = {
+    "journal_mode": "WAL",        # readers don't block the writer, one fsync per checkpoint instead of per commit
+    "synchronous": "NORMAL",      # safe with WAL, a power loss can only lose the last transactions
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,     # negative: KiB, so 64 MB page cache
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,         # ms to wait for another connection's write lock
+}
+
+def normalized_name_sql(column):
+    """SQL expression of split_values' normalization of one value: separators (- _ / .) become single spaces"""
+    for separator in ('-', '_', '/', '.'):
+        column = f"replace({column}, '{separator}', ' ')"
+    return f"trim(replace(replace({column}, '   ', ' '), '  ', ' '))"
+
+def normalize_names_statements(table, link_table, link_column, keep_top=False):
+    """Merge the names of a link table's name table that aren't normalized into their normalized name"""
+    normalized = normalized_name_sql('name')
+    keep = 'DO UPDATE SET is_top = max(is_top, excluded.is_top)' if keep_top else 'DO NOTHING'
+    return [
+        f'INSERT OR IGNORE INTO {table} (name) SELECT {normalized} FROM {table} WHERE name != {normalized}',
+        f'''
+        INSERT INTO {link_table} (track_id, {link_column}{', is_top' if keep_top else ''})
+        SELECT {link_table}.track_id, merged.id{f', {link_table}.is_top' if keep_top else ''}
+        FROM {link_table} JOIN {table} ON {table}.id = {link_table}.{link_column}
+        JOIN {table} AS merged ON merged.name = {normalized_name_sql(f'{table}.name')}
+        WHERE merged.id != {table}.id
+        ON CONFLICT (track_id, {link_column}) {keep}
+        ''',
+        f'DELETE FROM {link_table} WHERE {link_column} IN (SELECT id FROM {table} WHERE name != {normalized})',
+        f'DELETE FROM {table} WHERE name != {normalized}',
+    ]
+
+# (version, description, statements), applied in order, the database's PRAGMA user_version is the last applied one.
+# Never change a released migration, add a new one instead.
+MIGRATIONS = [
+    (1, "base tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS artists (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            monthly_listeners INTEGER,
+            age INTEGER,
+            birth_date DATE,
+            number_of_tracks INTEGER,
+            number_of_albums INTEGER,
+            album_names TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tracks (
+            track_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            main_artist_name TEXT,
+            main_artist_id TEXT,
+            featured_artists TEXT,
+            album_name TEXT,
+            album_id TEXT,
+            FOREIGN KEY (main_artist_id) REFERENCES artists (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS audio_features (
+            track_id TEXT PRIMARY KEY,
+            release_date DATE,
+            main_artist TEXT,
+            featured_artists TEXT,
+            language TEXT,
+            song_length REAL,
+            top_genre TEXT,
+            other_genres TEXT,
+            genre_finished TEXT,
+            language_level TEXT,
+            topic TEXT,
+            FOREIGN KEY (track_id) REFERENCES tracks (track_id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_artist_name ON artists(name)',
+        'CREATE INDEX IF NOT EXISTS idx_genre ON audio_features(top_genre)',
+    ]),
+    (2, "lookup indexes", [
+        'CREATE INDEX IF NOT EXISTS idx_tracks_main_artist_id ON tracks(main_artist_id)',
+        'CREATE INDEX IF NOT EXISTS idx_tracks_album_id ON tracks(album_id)',
+        'CREATE INDEX IF NOT EXISTS idx_audio_features_language ON audio_features(language)',
+        'CREATE INDEX IF NOT EXISTS idx_audio_features_release_date ON audio_features(release_date)',
+        'CREATE INDEX IF NOT EXISTS idx_audio_features_topic ON audio_features(topic)',
+    ]),
+    (3, "lookup and cache stores", [
+        '''
+        CREATE TABLE IF NOT EXISTS resolution_index (
+            title_key TEXT NOT NULL,
+            artist_key TEXT NOT NULL,
+            track_id TEXT NOT NULL,
+            uri TEXT NOT NULL,
+            source TEXT,
+            updated_at REAL,
+            PRIMARY KEY (artist_key, title_key)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lyric_attributes_cache (
+            key TEXT PRIMARY KEY,
+            schema_hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            attributes TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lyrics (
+            genius_id INTEGER PRIMARY KEY,
+            track_id TEXT,
+            lyrics BLOB NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_lyrics_track_id ON lyrics(track_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS genius_ids (
+            artist_key TEXT NOT NULL,
+            title_key TEXT NOT NULL,
+            genius_id INTEGER,
+            score REAL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (artist_key, title_key)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS discography (
+            artist_id TEXT NOT NULL,
+            album_id TEXT NOT NULL,
+            name TEXT,
+            album_group TEXT,
+            release_date TEXT,
+            total_tracks INTEGER,
+            artist_tracks INTEGER,
+            PRIMARY KEY (artist_id, album_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS discography_artists (
+            artist_id TEXT PRIMARY KEY,
+            refreshed_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (4, "genre, topic and featured artist link tables", [
+        'CREATE TABLE IF NOT EXISTS genres (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)',
+        '''
+        CREATE TABLE IF NOT EXISTS track_genres (
+            track_id TEXT NOT NULL,
+            genre_id INTEGER NOT NULL,
+            is_top INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (track_id, genre_id),
+            FOREIGN KEY (track_id) REFERENCES tracks (track_id),
+            FOREIGN KEY (genre_id) REFERENCES genres (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_track_genres_genre ON track_genres(genre_id, track_id)',
+        'CREATE TABLE IF NOT EXISTS topics (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)',
+        '''
+        CREATE TABLE IF NOT EXISTS track_topics (
+            track_id TEXT NOT NULL,
+            topic_id INTEGER NOT NULL,
+            PRIMARY KEY (track_id, topic_id),
+            FOREIGN KEY (track_id) REFERENCES tracks (track_id),
+            FOREIGN KEY (topic_id) REFERENCES topics (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_track_topics_topic ON track_topics(topic_id, track_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS track_featured_artists (
+            track_id TEXT NOT NULL,
+            artist_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (track_id, artist_name),
+            FOREIGN KEY (track_id) REFERENCES tracks (track_id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_track_featured_artists_name ON track_featured_artists(artist_name, track_id)',
+    ]),
+    (5, "feature matrix layout", [
+        'CREATE TABLE IF NOT EXISTS feature_rows (track_id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE)',
+        'CREATE TABLE IF NOT EXISTS feature_columns (name TEXT PRIMARY KEY, col INTEGER NOT NULL UNIQUE)',
+    ]),
+    (6, "genre and topic names without separators (hip-hop -> hip hop), run build_features to refill the feature matrix", [
+        *normalize_names_statements('genres', 'track_genres', 'genre_id', keep_top=True),
+        *normalize_names_statements('topics', 'track_topics', 'topic_id'),
+        f'''
+        UPDATE audio_features SET top_genre = {normalized_name_sql('top_genre')}, other_genres = {normalized_name_sql('other_genres')},
+            topic = {normalized_name_sql('topic')}
+        ''',
+        'DELETE FROM feature_rows',  # its genre and topic columns have the old names
+        'DELETE FROM feature_columns',
+    ]),
+    (7, "resolution index keys with version markers (remix, live, part 2 ...)", [
+        # old keys mixed up versions, the index fills itself again from the tracks table on the next start
+        'DELETE FROM resolution_index',
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_migrated = set()  # database paths already migrated by this process
+_migrate_lock = threading.Lock()
+
 
 class db_factory:
     """Factory class for database management"""
-    
+
     @staticmethod
-    def create_db(db_path, overwrite=False):
-        """Create tables and indexes"""
-        if input("are you sure you want to overwrite the database? (y/n): ").lower() == 'y':
-            print("Overwriting existing database...")
-            try:
-                # Close any open connections before deleting
-                try:
-                    conn.close()
-                except Exception:
-                    pass  # conn may not exist yet
-                os.remove(db_path)
-            except PermissionError as e:
-                print(f"Could not delete {db_path}: {e}")
-                print("Make sure no other process (including this script) is using the file.")
-                return
+    def connect(db_path, check_same_thread=True, migrate=True):
+        """
+        Open a connection with the PRAGMAS profile
+        Args:
+            db_path (str): database file
+            check_same_thread (bool): False for connections shared between threads (behind a lock)
+            migrate (bool): bring the schema up to date first (once per process and path), only for songs.db
+        Returns:
+            sqlite3.Connection
+        """
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+        for pragma, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        if migrate:
+            with _migrate_lock:
+                if db_path == ':memory:' or db_path not in _migrated:
+                    db_factory.migrate(conn)
+                    _migrated.add(db_path)
+        return conn
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Artists table
-        cursor.execute('''
-            CREATE TABLE artists (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                monthly_listeners INTEGER,
-                age INTEGER,
-                birth_date DATE,
-                number_of_tracks INTEGER,
-                number_of_albums INTEGER,
-                album_names TEXT
-            )
-        ''')
-        
-        # Tracks table
-        cursor.execute('''
-            CREATE TABLE tracks (
-                track_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                main_artist_name TEXT,
-                main_artist_id TEXT,
-                featured_artists TEXT,
-                album_name TEXT,
-                album_id TEXT,
-                FOREIGN KEY (main_artist_id) REFERENCES artists (id)
-            )
-        ''')
+    @staticmethod
+    def schema_version(conn):
+        return conn.execute('PRAGMA user_version').fetchone()[0]
 
+    @staticmethod
+    def migrate(conn):
+        """
+        Apply every migration newer than the database's user_version, each in its own transaction
+        Returns:
+            int: number of applied migrations
+        """
+        applied = 0
+        for migration_version, description, statements in MIGRATIONS:
+            if migration_version <= db_factory.schema_version(conn):
+                continue
+            try:
+                conn.execute('BEGIN IMMEDIATE')  # takes the write lock, so only one process runs a migration
+                if migration_version <= db_factory.schema_version(conn):  # another process was faster
+                    conn.execute('COMMIT')
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {migration_version}')
+                conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                conn.execute('ROLLBACK')
+                print(f"❌ Migration {migration_version} ({description}) failed: {e}")
+                raise
+            print(f"🛠️ Database migrated to version {migration_version}: {description}")
+            applied += 1
+        return applied
 
-        # Audio features table
-        cursor.execute('''
-            CREATE TABLE audio_features (
-                track_id TEXT PRIMARY KEY,
-                release_date DATE,
-                main_artist TEXT,
-                featured_artists TEXT,
-                language TEXT,
-                song_length REAL,
-                top_genre TEXT,
-                other_genres TEXT,
-                genre_finished TEXT,
-                language_level TEXT,
-                topic TEXT,
-                FOREIGN KEY (track_id) REFERENCES tracks (track_id)
-            )
-        ''')
-        
-        # Basic indexes
-        cursor.execute('CREATE INDEX idx_artist_name ON artists(name)')
-        cursor.execute('CREATE INDEX idx_genre ON audio_features(top_genre)')
-        
-        conn.commit()
-        conn.close()
-        print("Database setup complete!")
-    
     @staticmethod
-    def create_indexes(db_path):
-        """Create database indexes"""
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+    def create_db(db_path, overwrite=False):
+        """
+        Create the database or upgrade an existing one in place (tables, indexes, store tables)
+        Args:
+            db_path (str): database file
+            overwrite (bool): delete an existing database first (asks for confirmation)
+        """
+        if overwrite and os.path.exists(db_path):
+            if input("are you sure you want to overwrite the database? (y/n): ").lower() == 'y':
+                print("Overwriting existing database...")
+                try:
+                    for suffix in ('', '-wal', '-shm'):
+                        if os.path.exists(db_path + suffix):
+                            os.remove(db_path + suffix)
+                    _migrated.discard(db_path)
+                except PermissionError as e:
+                    print(f"Could not delete {db_path}: {e}")
+                    print("Make sure no other process (including this script) is using the file.")
+                    return
 
-        # Create indexes for faster queries
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_artist_name ON artists(name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_genre ON audio_features(top_genre)')
+        conn = db_factory.connect(db_path, migrate=False)
+        applied = db_factory.migrate(conn)
+        _migrated.add(db_path)
+        conn.close()
+        print(f"Database setup complete! (schema version {SCHEMA_VERSION}, {applied} migration(s) applied)")
 
-        conn.commit()
+    @staticmethod
+    def create_indexes(db_path):
+        """Create database indexes (they are part of the migrations, so this upgrades the schema)"""
+        conn = db_factory.connect(db_path, migrate=False)
+        db_factory.migrate(conn)
         conn.close()
@@ -0,0 +1,287 @@
+import os
+import threading
+import numpy as np
+from src.env import GEMINI_MODEL_NAME
+from src.ai import load_lyric_attributes_schema, lyrics_to_text
+from src.database.factory import db_factory
+from src.database.lyrics_store import get_lyrics_store
+from src.database.lyric_attributes_cache import get_lyric_attribute_cache
+from src.database.track_attributes import split_values
+
+MATRIX_PATH = 'data/prod/features.npy'
+INITIAL_ROWS = 1024      # capacity of a new matrix, doubled whenever it's full
+INITIAL_COLUMNS = 256
+YEAR_MIN = 1950          # release years are scaled to 0..1 between YEAR_MIN and YEAR_MAX
+YEAR_MAX = 2030          # fixed, so stored rows keep their meaning as the years pass (rebuild after changing it)
+MAX_LENGTH = 600         # seconds, song lengths are scaled to 0..1 up to this
+OTHER_GENRE_VALUE = 0.5  # top genre 1.0, other genres this
+
+# weight of every column group (the part of the column name before ':') in the similarity
+GROUP_WEIGHTS = {
+    "genre": 3.0,
+    "topic": 2.0,
+    "language": 1.0,
+    "level": 0.5,
+    "year": 1.0,
+    "length": 0.5,
+    "lyrics": 1.0,
+}
+
+
+def schema_categories(schema, path=()):
+    """
+    Flatten the lyric attribute schema into categories
+    Returns:
+        list: (path, value) for every listed value, (path, None) for single value attributes
+              (empty lists are free text like repeated_phrases and are skipped)
+    """
+    categories = []
+    for key, value in schema.items():
+        if isinstance(value, dict):
+            categories += schema_categories(value, path + (key,))
+        elif isinstance(value, list):
+            categories += [(path + (key,), v) for v in split_values(value)]  # normalized like the answers
+        else:
+            categories.append((path + (key,), None))
+    return categories
+
+def lyric_features(attributes, categories):
+    """Column name -> 1.0 for every schema category the AI lyric attributes of a track contain"""
+    if not isinstance(attributes, dict):
+        return {}
+    attributes = attributes.get("lyrics_attributes", attributes)
+    features = {}
+    for path, value in categories:
+        answer = attributes
+        for key in path[1:]:  # the schema's top level key ("lyrics_attributes") is dropped above
+            answer = answer.get(key) if isinstance(answer, dict) else None
+        name = "lyrics:" + ".".join(path[1:])
+        if value is None:
+            if answer and str(answer).casefold() not in ("false", "0", "none", "null"):
+                features[name] = 1.0
+        elif isinstance(answer, (list, tuple)) and value in split_values(answer):
+            features[f"{name}:{value}"] = 1.0
+    return features
+
+
+class FeatureMatrix:
+    """
+    Numeric feature vector of every imported track, kept as a float32 .npy file that is memory mapped:
+    one-hot genres (top genre 1.0, others 0.5), topics, language and language level, the release year and
+    length scaled to 0..1 and the categories of the lyric_attributes.json schema the AI found in the lyrics.
+    Which track is in which row and which feature in which column is kept in songs.db (feature_rows,
+    feature_columns), new tracks and features are appended, rows and columns grow by doubling the file.
+    Safe to share between threads, and between instances and processes on the same files: every update holds
+    the database's write lock (BEGIN IMMEDIATE) and starts from the layout in songs.db.
+    """
+    def __init__(self, db_path='data/prod/songs.db', matrix_path=MATRIX_PATH):
+        self.lock = threading.Lock()
+        self.matrix_path = matrix_path
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+        self.schema = load_lyric_attributes_schema()
+        self.categories = schema_categories(self.schema)
+        self.matrix = None
+        self.inode = None
+        self.data_version = None  # of songs.db when the layout was loaded
+        if os.path.exists(matrix_path):
+            self._open()
+        else:
+            # the layout belongs to the file, without it every track has to be added again
+            self.conn.execute('DELETE FROM feature_rows')
+            self.conn.execute('DELETE FROM feature_columns')
+            self.conn.commit()
+        self._load_layout()
+
+    def _open(self):
+        self.matrix = np.load(self.matrix_path, mmap_mode='r+')
+        self.inode = os.stat(self.matrix_path).st_ino
+
+    def _load_layout(self):
+        self.data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        self.rows = dict(self.conn.execute('SELECT track_id, row FROM feature_rows'))
+        self.columns = dict(self.conn.execute('SELECT name, col FROM feature_columns'))
+        self.track_ids = [None] * len(self.rows)  # row -> track id
+        for track_id, row in self.rows.items():
+            self.track_ids[row] = track_id
+
+    def _refresh(self, layout=False):
+        """
+        Catch up with other instances and processes (lock must be held): map the file again if it was grown
+        and reload the layout if songs.db was changed by another connection (e.g. the importer appended rows)
+        Args:
+            layout (bool): always reload the layout (before an update, inside its transaction)
+        """
+        if os.path.exists(self.matrix_path) and os.stat(self.matrix_path).st_ino != self.inode:
+            self._open()
+            layout = True
+        if layout or self.conn.execute('PRAGMA data_version').fetchone()[0] != self.data_version:
+            self._load_layout()
+
+    def _ensure_capacity(self, rows, columns):
+        """Grow the file to at least rows x columns, copying the old matrix (lock must be held)"""
+        old_rows, old_columns = self.matrix.shape if self.matrix is not None else (0, 0)
+        if rows <= old_rows and columns <= old_columns:
+            return
+        new_rows, new_columns = max(old_rows, INITIAL_ROWS), max(old_columns, INITIAL_COLUMNS)
+        while new_rows < rows:
+            new_rows *= 2
+        while new_columns < columns:
+            new_columns *= 2
+        os.makedirs(os.path.dirname(self.matrix_path) or '.', exist_ok=True)
+        temp_path = self.matrix_path + '.tmp'
+        grown = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=(new_rows, new_columns))
+        if self.matrix is not None:
+            grown[:old_rows, :old_columns] = self.matrix
+        grown.flush()
+        del grown
+        self.matrix = None
+        os.replace(temp_path, self.matrix_path)  # readers keep their old mapping until they reopen
+        self._open()
+
+    @staticmethod
+    def _lyric_attributes(track_id, lyric_cache):
+        """Cached AI lyric attributes of the track's stored lyrics, None if it was never analyzed"""
+        lyrics = get_lyrics_store().get_by_track(track_id)
+        if not lyrics:
+            return None
+        return lyric_cache.get(lyrics_to_text(lyrics), GEMINI_MODEL_NAME)
+
+    def track_features(self, track_ids):
+        """
+        Feature values of imported tracks, read from songs.db
+        Returns:
+            dict: track_id -> {column name: value}
+        """
+        marks = ", ".join("?" for _ in track_ids)
+        features = {track_id: {} for track_id in track_ids}
+        for track_id, language, language_level, release_date, song_length in self.conn.execute(f'''
+            SELECT track_id, language, language_level, release_date, song_length FROM audio_features
+            WHERE track_id IN ({marks})
+        ''', track_ids):
+            row = features[track_id]
+            if language:
+                row[f"language:{language.casefold()}"] = 1.0
+            for level in split_values(language_level):
+                row[f"level:{level}"] = 1.0
+            try:
+                row["year"] = min(max((int(str(release_date)[:4]) - YEAR_MIN) / (YEAR_MAX - YEAR_MIN), 0.0), 1.0)
+            except (TypeError, ValueError):
+                pass
+            if song_length:
+                row["length"] = min(float(song_length) / MAX_LENGTH, 1.0)
+        for track_id, name, is_top in self.conn.execute(f'''
+            SELECT track_genres.track_id, genres.name, track_genres.is_top
+            FROM track_genres JOIN genres ON genres.id = track_genres.genre_id WHERE track_genres.track_id IN ({marks})
+        ''', track_ids):
+            features[track_id][f"genre:{name}"] = 1.0 if is_top else OTHER_GENRE_VALUE
+        for track_id, name in self.conn.execute(f'''
+            SELECT track_topics.track_id, topics.name
+            FROM track_topics JOIN topics ON topics.id = track_topics.topic_id WHERE track_topics.track_id IN ({marks})
+        ''', track_ids):
+            features[track_id][f"topic:{name}"] = 1.0
+        lyric_cache = get_lyric_attribute_cache(self.schema)  # looked up once, not per track
+        for track_id in track_ids:
+            features[track_id].update(lyric_features(self._lyric_attributes(track_id, lyric_cache), self.categories))
+        return features
+
+    def add_tracks(self, track_ids):
+        """
+        Add or update the rows of imported tracks (called by the importer after every written batch)
+        Returns:
+            int: number of written rows
+        """
+        track_ids = list(dict.fromkeys(track_ids))
+        if not track_ids:
+            return 0
+        with self.lock:
+            features = {}
+            for i in range(0, len(track_ids), 500):  # stay below SQLite's max. number of parameters
+                features.update(self.track_features(track_ids[i:i + 500]))
+            features = {track_id: values for track_id, values in features.items() if values}
+
+            # the write lock keeps every other instance out until the rows are on disk and the layout is committed
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._refresh(layout=True)  # rows and columns appended by others since we last looked
+                new_rows = [(track_id, len(self.rows) + i) for i, track_id in enumerate(t for t in features if t not in self.rows)]
+                names = dict.fromkeys(name for values in features.values() for name in values if name not in self.columns)
+                new_columns = [(name, len(self.columns) + i) for i, name in enumerate(names)]
+                # the layout first, a conflicting row or column fails here before anything is written to the file
+                self.conn.executemany('INSERT INTO feature_rows (track_id, row) VALUES (?, ?)', new_rows)
+                self.conn.executemany('INSERT INTO feature_columns (name, col) VALUES (?, ?)', new_columns)
+                self._ensure_capacity(len(self.rows) + len(new_rows), len(self.columns) + len(new_columns))
+                self.rows.update(new_rows)
+                self.track_ids += [track_id for track_id, _ in new_rows]
+                self.columns.update(new_columns)
+
+                for track_id, values in features.items():
+                    row = self.rows[track_id]
+                    self.matrix[row] = 0.0
+                    self.matrix[row, [self.columns[name] for name in values]] = list(values.values())
+                self.matrix.flush()
+                self.conn.execute('COMMIT')  # the layout is only committed once the rows are on disk
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                self._load_layout()  # rows written for the rolled back layout are unused space
+                raise
+            self.data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        return len(features)
+
+    def rebuild(self):
+        """Build the matrix from scratch for every track in songs.db (e.g. after the schema changed)"""
+        track_ids = [row[0] for row in self.conn.execute('SELECT track_id FROM audio_features')]
+        with self.lock:
+            self.matrix = None
+            if os.path.exists(self.matrix_path):
+                os.remove(self.matrix_path)
+            with self.conn:
+                self.conn.execute('DELETE FROM feature_rows')
+                self.conn.execute('DELETE FROM feature_columns')
+            self.rows, self.columns, self.track_ids = {}, {}, []
+        added = self.add_tracks(track_ids)
+        print(f"🧮 Feature matrix rebuilt: {added} tracks x {len(self.columns)} features")
+        return added
+
+    def weights(self):
+        """Per column weight from GROUP_WEIGHTS (lock must be held)"""
+        weights = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        for name, col in self.columns.items():
+            weights[col] = GROUP_WEIGHTS.get(name.split(':', 1)[0], 1.0)
+        return weights
+
+    def similar(self, track_id, k=10, exclude=()):
+        """
+        Most similar tracks by weighted cosine similarity, over the whole catalog in one matrix product
+        Args:
+            track_id (str): seed track, must be in the matrix
+            k (int): number of results
+            exclude (iterable): track ids that must not be returned
+        Returns:
+            list: (track_id, similarity) best first, empty if the seed isn't in the matrix
+        """
+        with self.lock:
+            self._refresh()
+            if self.matrix is None or track_id not in self.rows:
+                return []
+            n, used = len(self.rows), len(self.columns)
+            matrix = self.matrix[:n, :used]  # the rest is spare capacity
+            squared_weights = self.weights()[:used] ** 2
+            seed = np.array(matrix[self.rows[track_id]])
+            norms = np.sqrt((matrix * matrix) @ squared_weights) * np.sqrt((seed * seed) @ squared_weights)
+            scores = (matrix @ (seed * squared_weights)) / np.where(norms > 0, norms, 1.0)
+            track_ids = self.track_ids[:n]
+        skip = set(exclude) | {track_id}
+        order = np.argsort(-scores)
+        return [(track_ids[row], float(scores[row])) for row in order[:k + len(skip)] if track_ids[row] not in skip][:k]
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+def get_feature_matrix():
+    """The process wide matrix, opened on first use"""
+    global _matrix
+    with _matrix_lock:
+        if _matrix is None:
+            _matrix = FeatureMatrix()
+        return _matrix
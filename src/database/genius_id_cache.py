@@ -0,0 +1,62 @@
+import threading
+import time
+from src.database.resolution_index import normalize
+from src.database.factory import db_factory
+
+DAY = 24 * 60 * 60
+NEGATIVE_TTL = 30 * DAY  # songs without a Genius match are searched again after that (they may have been added)
+
+
+class GeniusIdCache:
+    """
+    Persistent (artist, title) -> Genius song id lookup in songs.db, including songs Genius has no match for,
+    so the same song is never searched twice.
+    Safe to share between threads.
+    """
+    def __init__(self, db_path='data/prod/songs.db'):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+
+    def get(self, artist, title):
+        """
+        Returns:
+            tuple: (True, genius_id) if known, genius_id is None for songs without a match; (False, None) if unknown
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT genius_id, updated_at FROM genius_ids WHERE artist_key = ? AND title_key = ?',
+                (normalize(artist), normalize(title))
+            ).fetchone()
+            if row is None or (row[0] is None and time.time() - row[1] > NEGATIVE_TTL):
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        return True, row[0]
+
+    def put(self, artist, title, genius_id, score=None):
+        """Remember the Genius id of a song (None: Genius has no matching song)"""
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO genius_ids (artist_key, title_key, genius_id, score, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (normalize(artist), normalize(title), genius_id, score, time.time()))
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_genius_id_cache():
+    """The process wide cache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GeniusIdCache()
+        return _cache
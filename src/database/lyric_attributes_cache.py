@@ -0,0 +1,87 @@
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from src.database.factory import db_factory
+
+
+def normalize_lyrics(text):
+    """Same lyrics with different whitespace or unicode composition give the same text"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def schema_hash(schema):
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+def content_key(lyrics_text, schema, model_name):
+    """Hash of everything the AI lyric attributes depend on: lyrics, schema and model"""
+    digest = hashlib.sha256()
+    for part in (normalize_lyrics(lyrics_text), json.dumps(schema, sort_keys=True), model_name):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class LyricAttributeCache:
+    """
+    Content-addressed store for AI lyric attributes in songs.db.
+    Entries made with another schema version are dropped when the cache is opened,
+    so a changed lyric_attributes.json invalidates them automatically.
+    Safe to share between threads.
+    """
+    def __init__(self, schema, db_path='data/prod/songs.db'):
+        self.schema = schema
+        self.schema_hash = schema_hash(schema)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+        removed = self.conn.execute(
+            'DELETE FROM lyric_attributes_cache WHERE schema_hash != ?', (self.schema_hash,)
+        ).rowcount
+        self.conn.commit()
+        if removed:
+            print(f"🧹 Lyric attribute schema changed, dropped {removed} cached analyses")
+
+    def get(self, lyrics_text, model_name, count_miss=True):
+        """
+        Args:
+            count_miss (bool): False for a second lookup of the same lyrics, so a miss is only counted once
+        Returns:
+            dict: cached attributes, None if these lyrics weren't analyzed with this schema and model
+        """
+        key = content_key(lyrics_text, self.schema, model_name)
+        with self.lock:
+            row = self.conn.execute('SELECT attributes FROM lyric_attributes_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, lyrics_text, model_name, attributes):
+        key = content_key(lyrics_text, self.schema, model_name)
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO lyric_attributes_cache (key, schema_hash, model, attributes, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, self.schema_hash, model_name, json.dumps(attributes), time.time()))
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_lyric_attribute_cache(schema):
+    """The process wide cache for the given schema, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.schema_hash != schema_hash(schema):
+            _cache = LyricAttributeCache(schema)
+        return _cache
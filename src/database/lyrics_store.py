@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+import zlib
+from src.database.factory import db_factory
+
+
+class LyricsStore:
+    """
+    Persistent Genius lyrics in songs.db, keyed by Genius song id and (once known) Spotify track id.
+    The lyrics are stored zlib compressed together with the time they were scraped.
+    Safe to share between threads.
+    """
+    def __init__(self, db_path='data/prod/songs.db'):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+
+    def _load(self, row, count_miss=True):
+        """Count the lookup and unpack the stored lyrics (lock must be held)"""
+        stored = json.loads(zlib.decompress(row[0])) if row is not None else None
+        if isinstance(stored, list):
+            # stored before the sections kept their "[", an empty list was a failed extraction
+            stored = {"sections": ['[' + part for part in stored]} if stored else None
+        if not stored:
+            if count_miss:
+                self.misses += 1
+            return None
+        self.hits += 1
+        return stored["sections"]
+
+    def get(self, genius_id):
+        """
+        Returns:
+            list: stored lyrics fragments of the Genius song, None if not stored
+        """
+        with self.lock:
+            return self._load(self.conn.execute('SELECT lyrics FROM lyrics WHERE genius_id = ?', (genius_id,)).fetchone())
+
+    def get_by_track(self, track_id):
+        """
+        Same as get, but by Spotify track id (no Genius search needed).
+        Only a hit is counted, on a miss the caller looks the song up again with get, which counts the miss.
+        """
+        with self.lock:
+            return self._load(self.conn.execute('SELECT lyrics FROM lyrics WHERE track_id = ?', (track_id,)).fetchone(),
+                              count_miss=False)
+
+    def put(self, genius_id, lyrics, track_id=None):
+        """Store the lyrics sections of a Genius song, nothing is stored for empty lyrics"""
+        if not lyrics:
+            return
+        body = zlib.compress(json.dumps({"sections": lyrics}).encode())
+        with self.lock:
+            if track_id:
+                # a track id belongs to one Genius song, a newer match replaces the old link
+                self.conn.execute('UPDATE lyrics SET track_id = NULL WHERE track_id = ? AND genius_id != ?', (track_id, genius_id))
+            self.conn.execute('''
+                INSERT INTO lyrics (genius_id, track_id, lyrics, fetched_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(genius_id) DO UPDATE SET
+                    track_id = COALESCE(excluded.track_id, lyrics.track_id),
+                    lyrics = excluded.lyrics,
+                    fetched_at = excluded.fetched_at
+            ''', (genius_id, track_id, body, time.time()))
+            self.conn.commit()
+
+    def link_track(self, genius_id, track_id):
+        """Remember the Spotify track id of already stored lyrics"""
+        with self.lock:
+            self.conn.execute('UPDATE lyrics SET track_id = NULL WHERE track_id = ? AND genius_id != ?', (track_id, genius_id))
+            self.conn.execute('UPDATE lyrics SET track_id = ? WHERE genius_id = ?', (track_id, genius_id))
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(lyrics)), 0) FROM lyrics').fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"📝 Lyrics store: {s['entries']} songs, {s['bytes'] / 1024:.0f} KB, {s['hits']} hits, "
+              f"{s['misses']} misses ({s['hit_rate']:.0%})")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_lyrics_store():
+    """The process wide store, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LyricsStore()
+        return _store
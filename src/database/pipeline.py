@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+import traceback
+
+_DONE = object()  # sentinel that tells a worker thread to shut down
+
+
+class Stage:
+    """
+    One step of the import pipeline with its own bounded worker pool.
+    Args:
+        name (str): Name of the stage, used for reporting
+        func (callable): Called with one item, returns the item for the next stage (or None to drop it)
+        workers (int): Number of worker threads for this stage
+        maxsize (int): Maximum number of items waiting in front of this stage
+        batch_size (int): If > 1, func gets a list of up to batch_size items and returns a list
+        linger (float): Seconds a worker waits for a batch to fill up before it runs a smaller one
+    """
+    def __init__(self, name, func, workers=1, maxsize=50, batch_size=1, linger=2.0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.linger = linger
+        self.inbox = queue.Queue(maxsize=maxsize)
+        self.next = None  # the stage that gets our output, set by ImportPipeline
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.active = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Tell every worker to finish after the items already queued and wait for them"""
+        for _ in self._threads:
+            self.inbox.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+
+    def _take_batch(self):
+        """
+        Wait for the next item(s)
+        Returns:
+            tuple: (list of items, True if the worker should stop afterwards)
+        """
+        item = self.inbox.get()
+        if item is _DONE:
+            return [], True
+        items = [item]
+        deadline = time.monotonic() + self.linger
+        while len(items) < self.batch_size:
+            try:
+                item = self.inbox.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _work(self):
+        while True:
+            items, done = self._take_batch()
+            if items:
+                self._process(items)
+            if done:
+                return
+
+    def _process(self, items):
+        with self._lock:
+            self.active += 1
+        started = time.perf_counter()
+        try:
+            if self.batch_size > 1:
+                results = self.func(items)
+            else:
+                results = [self.func(items[0])]
+        except Exception as e:
+            results = []
+            with self._lock:
+                self.failed += len(items)
+            print(f"❌ [{self.name}] Error processing {items!r}: {e}")
+            traceback.print_exc()
+        else:
+            with self._lock:
+                self.processed += len(items)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.busy_seconds += time.perf_counter() - started
+
+        for result in results:
+            if result is not None and self.next is not None:
+                self.next.inbox.put(result)  # blocks when the next stage is full (backpressure)
+
+    def stats(self, elapsed):
+        """
+        Snapshot of the stage counters
+        Args:
+            elapsed (float): Seconds since the pipeline started
+        Returns:
+            dict: processed, failed, throughput (items/s), queue depth, active workers and utilisation
+        """
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "failed": self.failed,
+                "throughput": self.processed / elapsed if elapsed > 0 else 0.0,
+                "queue_depth": self.inbox.qsize(),
+                "active": self.active,
+                "workers": self.workers,
+                "utilisation": self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0,
+            }
+
+
+class ImportPipeline:
+    """
+    Chain of stages where every stage runs its own worker pool, so different tracks can be in
+    different stages at the same time. The last stage should have a single worker (the writer).
+    Args:
+        stages (list[Stage]): Stages in the order the items pass through them
+        report_interval (float): Seconds between progress reports, None to disable
+    """
+    def __init__(self, stages, report_interval=15):
+        self.stages = stages
+        self.report_interval = report_interval
+        self.started = None
+        for current, following in zip(stages, stages[1:]):
+            current.next = following
+
+    def run(self, items):
+        """
+        Feed all items through the pipeline and block until the last stage is done
+        Args:
+            items (iterable): Items for the first stage (may be a generator)
+        Returns:
+            dict: final stats per stage name
+        """
+        self.started = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+
+        finished = threading.Event()
+        reporter = None
+        if self.report_interval:
+            reporter = threading.Thread(target=self._report_loop, args=(finished,), daemon=True)
+            reporter.start()
+
+        try:
+            for item in items:
+                self.stages[0].inbox.put(item)
+        finally:
+            # shut the stages down front to back, so every queued item is still handled
+            for stage in self.stages:
+                stage.stop()
+            finished.set()
+            if reporter is not None:
+                reporter.join()
+
+        self.report()
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+    def report(self):
+        """Print throughput and queue depth for every stage"""
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        print(f"📊 Import pipeline after {elapsed:.1f}s:")
+        for name, s in self.stats().items():
+            print(
+                f"   {name:<10} done {s['processed']:>5} ({s['throughput']:.2f}/s), failed {s['failed']}, "
+                f"queued {s['queue_depth']}, busy {s['active']}/{s['workers']} ({s['utilisation']:.0%})"
+            )
+
+    def _report_loop(self, finished):
+        while not finished.wait(self.report_interval):
+            self.report()
@@ -0,0 +1,196 @@
+import difflib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from src.database.factory import db_factory
+
+FUZZY_CUTOFF = 0.88  # min. similarity of normalized keys for a fuzzy hit
+
+_brackets = re.compile(r"[\(\[][^\)\]]*[\)\]]")  # (feat. X), [Remastered], (Live) ...
+_suffix = re.compile(r"\s+-\s+.*$")  # "Song - Remastered 2011"
+_featuring = re.compile(r"\b(feat|ft|featuring)\b.*$")
+_non_word = re.compile(r"[^\w]+")
+_part = re.compile(r"\b(?:part|pt|vol|volume|chapter|no)\b\W*(\w+)")  # "(Pt. 2)", "- Part II"
+_roman = re.compile(r"^m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$")
+
+# words in the dropped parts of a title that mean a different recording, not just another release of it
+# ("Remastered 2011", "Radio Edit" or "feat. X" are the same song for us)
+VERSION_MARKERS = {"remix", "live", "acoustic", "demo", "instrumental", "unplugged", "reprise", "extended",
+                   "slowed", "sped", "karaoke", "cover"}
+
+
+def normalize(text):
+    """
+    Normalize a title or artist for lookups: casefold, strip accents, drop bracketed
+    additions, " - ..." suffixes, featured artists and punctuation.
+    """
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = _brackets.sub(' ', text)
+    text = _suffix.sub('', text)
+    text = _featuring.sub('', text)
+    text = _non_word.sub(' ', text)
+    return ' '.join(text.split())
+
+def numeral_value(token):
+    """Value of an Arabic or Roman numeral ("2", "ii"), None for other words"""
+    if token.isdigit():
+        return int(token)
+    if not token or not _roman.match(token):
+        return None
+    values = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+    total = 0
+    for char, following in zip(token, token[1:] + " "):
+        value = values[char]
+        total += -value if values.get(following, 0) > value else value
+    return total
+
+def version_markers(text):
+    """
+    Markers of a different recording in the parts of a title that normalize drops
+    Returns:
+        list: sorted markers, e.g. ["live"] for "Hello - Live", ["part 2"] for "Song (Pt. II)"
+    """
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    suffix = _suffix.search(text)
+    dropped = ' '.join(_brackets.findall(text)) + ' ' + (suffix.group(0) if suffix else '')
+    markers = set(_non_word.sub(' ', dropped).split()) & VERSION_MARKERS
+    markers |= {f"part {numeral_value(n)}" for n in _part.findall(dropped) if numeral_value(n) is not None}
+    return sorted(markers)
+
+def title_key(title):
+    """Index key of a title: the normalized title plus its version markers, "mask off (remix)" """
+    markers = version_markers(title)
+    return f"{normalize(title)} ({' '.join(markers)})" if markers else normalize(title)
+
+def same_version(a, b):
+    """Two title keys can be the same recording: same version markers and the same numbers ("Part I" isn't "Part II")"""
+    base_a, _, markers_a = a.partition(' (')
+    base_b, _, markers_b = b.partition(' (')
+    numerals = lambda key: sorted(v for v in map(numeral_value, key.split()) if v is not None)
+    return markers_a == markers_b and numerals(base_a) == numerals(base_b)
+
+
+class ResolutionIndex:
+    """
+    Persistent (title, artist) -> Spotify track lookup, stored next to the tracks in songs.db,
+    so songs that were resolved once never have to be searched again.
+    Versions stay apart: "Mask Off (Remix)" or "Hello - Live" only find what a search for exactly that returned.
+    Safe to share between threads.
+    """
+    def __init__(self, db_path='data/prod/songs.db'):
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(db_path, check_same_thread=False)  # tables are created by the migrations
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        # artist_key -> {title_key: (track_id, uri)}, loaded once so exact and fuzzy lookups stay in memory
+        self.entries = {}
+        for title_key, artist_key, track_id, uri in self.conn.execute(
+            'SELECT title_key, artist_key, track_id, uri FROM resolution_index'
+        ):
+            self.entries.setdefault(artist_key, {})[title_key] = (track_id, uri)
+        if not self.entries:
+            self.populate_from_tracks()
+
+    def populate_from_tracks(self):
+        """Add every track already imported into the tracks table"""
+        try:
+            rows = self.conn.execute('SELECT track_id, name, main_artist_name FROM tracks').fetchall()
+        except sqlite3.OperationalError:
+            return 0  # no tracks table yet
+        for track_id, name, artist in rows:
+            self.add(name, artist, track_id, source="tracks", commit=False)
+        with self.lock:
+            self.conn.commit()
+        return len(rows)
+
+    def add(self, title, artist, track_id, uri=None, source="search", commit=True):
+        """Remember that (title, artist) resolves to track_id"""
+        key, artist_key = title_key(title), normalize(artist)
+        if not key or not track_id:
+            return
+        uri = uri or f"spotify:track:{track_id}"
+        with self.lock:
+            self.entries.setdefault(artist_key, {})[key] = (track_id, uri)
+            self.conn.execute('''
+                INSERT OR REPLACE INTO resolution_index (title_key, artist_key, track_id, uri, source, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, artist_key, track_id, uri, source, time.time()))
+            if commit:
+                self.conn.commit()
+
+    def add_many(self, entries, source="search"):
+        """Add (title, artist, track_id) tuples with a single commit"""
+        for title, artist, track_id in entries:
+            self.add(title, artist, track_id, source=source, commit=False)
+        with self.lock:
+            self.conn.commit()
+
+    def add_search_result(self, title, artist, item):
+        """Index a Spotify track object under the searched names and its own name/main artist"""
+        self.add(title, artist, item['id'], item['uri'])
+        if item.get('artists'):
+            self.add(item['name'], item['artists'][0]['name'], item['id'], item['uri'])
+
+    def lookup(self, title, artist, fuzzy=True):
+        """
+        Find a track without asking Spotify
+        Args:
+            title (str): song title
+            artist (str): artist name
+            fuzzy (bool): fall back to the closest normalized title/artist of the same version (see same_version)
+        Returns:
+            dict: track_id and uri, None if unknown
+        """
+        key, artist_key = title_key(title), normalize(artist)
+        with self.lock:
+            titles = self.entries.get(artist_key, {})
+            if key in titles:
+                self.hits += 1
+                track_id, uri = titles[key]
+                return {"track_id": track_id, "uri": uri}
+
+            if fuzzy and key:
+                artist_keys = [artist_key] if titles else difflib.get_close_matches(
+                    artist_key, self.entries.keys(), n=3, cutoff=FUZZY_CUTOFF)
+                for known_artist in artist_keys:
+                    for match in difflib.get_close_matches(key, self.entries[known_artist].keys(), n=3, cutoff=FUZZY_CUTOFF):
+                        if same_version(key, match):
+                            self.fuzzy_hits += 1
+                            track_id, uri = self.entries[known_artist][match]
+                            return {"track_id": track_id, "uri": uri}
+
+            self.misses += 1
+            return None
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.fuzzy_hits + self.misses
+            return {
+                "entries": sum(len(titles) for titles in self.entries.values()),
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"🔎 Resolution index: {s['entries']} entries, {s['hits']} hits, {s['fuzzy_hits']} fuzzy hits, "
+              f"{s['misses']} misses ({s['hit_rate']:.0%})")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_resolution_index():
+    """The process wide index, loaded on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ResolutionIndex()
+        return _index
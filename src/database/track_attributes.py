@@ -1,18 +1,34 @@
-from src.utils import initialize_spotify_client, element_name_to_id
-from src.env import initialize_gemini_client
+from src.utils import element_name_to_id
+from src.env import LazyClient, get_client
 from src.genius import get_lyrics_genius
-import requests
+from src.ai import analyze_lyrics_batch
+from src.http_cache import cached_get
+from src.database.resolution_index import get_resolution_index
+from src.database.discography import crawl_discography
+from src.database.factory import db_factory
+from src import http_client
 import os
 from dotenv import load_dotenv
 from langdetect import detect
 import sqlite3
 import importlib # for debugging in terminal
+import re
 import time
 from datetime import date
 from bs4 import BeautifulSoup as bs
 
 global sp
-sp = initialize_spotify_client()  # initialize the Spotify client
+sp = LazyClient("spotify")  # the shared Spotify client, created on first use
+
+
+def finished_genre_response(response):
+    """GetGenre answer that is worth caching: a 200 with genres (an error page or a 200 without JSON isn't)"""
+    if response.status_code != 200 or 'application/json' not in response.headers.get('content-type', ''):
+        return False
+    try:
+        return bool(response.json().get("top_genres"))
+    except (ValueError, AttributeError):  # broken JSON or not an object
+        return False
 
 
 class data:
@@ -37,16 +53,78 @@ class data:
             language_level (str)
             topic (str)
     """
-    def __init__(self, artist=None, title=None, track_id=None, lyrics=None):
+    def __init__(self, artist=None, title=None, track_id=None, lyrics=None, artist_id=None):
         # FIXME: keep init as minimal as possible, so i can call the artist to dict with just artist
         self.artist = artist
         self.title = title
         self.track_id = track_id
-        self.lyrics = lyrics
-        # self.metadata = self.get_song_metadata(title, lyrics)  # get metadata for the song
-        # self.genre = self.get_song_genre(title, artist)  # get genre for the song
+        self._facts = {}  # everything fetched from an API, filled lazily by _fact()
+        if artist_id:
+            self._facts["main_artist_id"] = artist_id  # already known, no search needed
+        self._lyrics = lyrics
         # self.bpm = self.get_song_bpm(title, artist)  # FIXME: get bpm for the song
-        # self.lyric_data = self.get_song_lyrics(title, artist, lyrics)  # get lyrics data for the song
+
+    # facts that depend on the lyrics and have to be fetched again when the lyrics change
+    LYRIC_FACTS = ("metadata", "lyric_data")
+
+    def _fact(self, name, loader):
+        """Return the cached value of a fact, calling loader() only the first time it is needed"""
+        if name not in self._facts:
+            self._facts[name] = loader()
+        return self._facts[name]
+
+    def invalidate(self, *names):
+        """
+        Forget fetched facts, so they are fetched again on the next access
+        Args:
+            names (str): metadata, genre, lyric_data, main_artist_id; all facts if none given
+        """
+        if not names:
+            self._facts.clear()
+        for name in names:
+            self._facts.pop(name, None)
+
+    def fetched_only(self):
+        """
+        Stop fetching: facts no stage fetched (e.g. because its API call raised) are None from now on,
+        so building the dicts afterwards never calls an API (the writer must not block on the network)
+        """
+        for name in ("metadata", "genre", "lyric_data", "main_artist_id"):
+            self._facts.setdefault(name, None)
+        return self
+
+    @property
+    def lyrics(self):
+        return self._lyrics
+
+    @lyrics.setter
+    def lyrics(self, lyrics):
+        self._lyrics = lyrics
+        self.invalidate(*self.LYRIC_FACTS)
+
+    @property
+    def metadata(self):
+        return self._fact("metadata", lambda: self.get_song_metadata(self.title, self.lyrics))
+
+    @property
+    def genre(self):
+        return self._fact("genre", lambda: self.get_song_genre(self.title, self.artist))
+
+    @property
+    def lyric_data(self):
+        return self._fact("lyric_data", lambda: self.get_song_lyrics(self.title, self.artist, self.lyrics))
+
+    @property
+    def main_artist_id(self):
+        return self._fact("main_artist_id", self.get_main_artist_id)
+
+    def get_main_artist_id(self):
+        """The main artist id from the track metadata, only searched by name if there is no track"""
+        if self.title or self.track_id:
+            artist_id = (self.metadata or {}).get("main_artist_id")
+            if artist_id:
+                return artist_id
+        return element_name_to_id(self.artist, "artist")
 
     def get_getgenre_access_token(self):
         """
@@ -76,7 +154,7 @@ class data:
                 "Accept": "application/json"
             }
             
-            response = requests.post(url, data=data, headers=headers)
+            response = http_client.post(url, data=data, headers=headers)
             
             # print(f"Token request status: {response.status_code}")
             # print(f"Token response: {response.text}")
@@ -98,20 +176,32 @@ class data:
         retrieves song metadata (release date, artists, language, song length) with the help of the Spotify API.
         '''
         try:
-            search = sp.search(q=f"track:{title} artist:{self.artist}", type='track', limit=1)
-            release_date = search['tracks']['items'][0]['album']['release_date']  # get the release date
+            index = get_resolution_index()
+            track_id = self.track_id
+            if track_id is None:
+                known = index.lookup(title, self.artist)
+                track_id = known["track_id"] if known else None
+            if track_id:  # known track, fetch it directly instead of searching
+                track = sp.track(track_id)
+            else:
+                search = sp.search(q=f"track:{title} artist:{self.artist}", type='track', limit=1)
+                track = search['tracks']['items'][0]
+                index.add_search_result(title, self.artist, track)
+            release_date = track['album']['release_date']  # get the release date
             main_artist = self.artist
-            featured_artists = [artist['name'] for artist in search['tracks']['items'][0]['artists'][1:]]  # get the featured artists
+            featured_artists = [artist['name'] for artist in track['artists'][1:]]  # get the featured artists
+            language = None
             if lyrics:
                 language = detect(str(lyrics))  # use langedetect to detect the language of the track name
-            song_length = search['tracks']['items'][0]['duration_ms'] / 1000  # get the song length in seconds
+            song_length = track['duration_ms'] / 1000  # get the song length in seconds
             # Return all metadata as a dictionary
             return {
-                "track_id": sp.search(q='track:' + title + ' artist:' + self.artist, type='track', limit=1)['tracks']['items'][0]['id'],  # get the track ID
-                "album_name": search['tracks']['items'][0]['album']['name'],
-                "album_id": search['tracks']['items'][0]['album']['id'],
+                "track_id": track['id'],  # get the track ID
+                "album_name": track['album']['name'],
+                "album_id": track['album']['id'],
                 "release_date": release_date,
                 "main_artist": main_artist,
+                "main_artist_id": track['artists'][0]['id'],
                 "featured_artists": featured_artists,
                 "language": language,
                 "song_length": song_length
@@ -152,17 +242,19 @@ class data:
             }
 
             # 'FIXME: THE TIMEOUT FUCKS ME WOHOOOOOOO'
-            # Construct the URL with parameters
+            # Construct the request parameters
+            params = {}
             if artist:
-                url += "?artist_name=" + artist.replace(" ", "%20") 
-            url += f"&track_name={title.replace(' ', '%20')}"  # Use track_name instead of artist
-            url += f"&timeout=10"  # Add timeout parameter (has to be between 10 and 60)
+                params["artist_name"] = artist.strip()
+            params["track_name"] = title.strip()  # Use track_name instead of artist
+            params["timeout"] = 10  # Add timeout parameter (has to be between 10 and 60)
 
-            print(f"Request URL for GetGenre: {url}")  # Debugging line to see the full request URL
+            print(f"Request for GetGenre: {url} {params}")  # Debugging line to see the full request
 
-            for attempt in range(5):  # Retry up to 5 times
+            for attempt in range(5):  # Poll up to 5 times (429/5xx are already retried by the session)
                 print(f"Attempt {attempt + 1} to get genre information for {title}")
-                response = requests.get(url, headers=headers)
+                # only finished results are cached, a 202 (still processing) has to be asked again
+                response = cached_get("getgenre", url, params=params, headers=headers, cache_if=finished_genre_response)
                 print(response.status_code, response.text)  # Debugging line
 
                 try:
@@ -173,7 +265,8 @@ class data:
                 # Only break if top_genres is present and non-empty
                 if data.get("top_genres"):
                     break
-                time.sleep(5)  # Wait before retrying
+                if attempt < 4:
+                    time.sleep(http_client.backoff_delay(attempt, base=2))  # still processing, back off before polling again
 
             # Now handle the result after the loop
             if data.get("top_genres"):
@@ -212,8 +305,10 @@ class data:
             Thema: Liebe, Politik, Gesellschaft, Natur, etc.
         '''
         # waitlist.initialize_gemini_client() # initialize the client for lyrics retrieval => FALSCHER CLIENT?????
-        
-        model = initialize_gemini_client()  # initialize the client for text generation
+        if not lyrics:
+            return None  # nothing to analyze, don't send "None" to Gemini
+
+        model = get_client("gemini")  # the shared client for text generation
         response = model.generate_content(
             f"""
             Analyse the following lyrics according to two criteria:
@@ -226,12 +321,46 @@ class data:
             """
             # max_tokens=500,  # Adjust max tokens as needed
         )
-        language_level, topic = response.text.split(" / ")
+        answer = response.text.strip().strip('"').split(" / ", 1)
+        if len(answer) != 2:
+            print(f"⚠️ Unexpected lyric analysis answer for {title} by {artist}: {response.text!r}")
+            return None
+        language_level, topic = (part.strip() for part in answer)
         return {
             "language_level": language_level,
             "topic": topic
         }
 
+    @staticmethod
+    def analyze_lyrics_batch(tracks):
+        """
+        Fill lyric_data (language level and topic) for many tracks with batched Gemini requests.
+        Tracks whose batched answer can't be parsed are analyzed one by one.
+        Args:
+            tracks (list[data]): tracks to analyze, their lyrics must already be set
+        """
+        results = analyze_lyrics_batch(
+            [track.lyrics for track in tracks],
+            task="analyse the lyrics according to two criteria: 1. language level: choose exactly one! - "
+                 "vulgar, youth slang, colloquial, standard, sophisticated, technical, poetic. "
+                 "2. topic: e.g. love, politics, society, nature, etc.",
+            result_format='{"language_level": "<level>", "topic": "<topic1>, <topic2>, ..."}',
+            single=lambda lyrics: None,  # the fallback runs per track below, it needs title and artist
+            validate=lambda value: isinstance(value, dict) and value.get("language_level") and value.get("topic"),
+        )
+        for track, result in zip(tracks, results):
+            if result is not None:
+                track._facts["lyric_data"] = {"language_level": result["language_level"], "topic": result["topic"]}
+            elif not track.lyrics:
+                track._facts["lyric_data"] = None  # nothing to analyze, no request
+            else:
+                try:
+                    track.lyric_data  # single request
+                except Exception as e:  # one failed track must not fail the whole batch
+                    print(f"❌ Lyric analysis failed for {track.title} by {track.artist}: {e}")
+                    track._facts["lyric_data"] = None
+        return tracks
+
     def audio_features_to_dict(self):
         # Only merge if all are dicts
         if all(isinstance(x, dict) for x in [self.lyric_data, self.metadata, self.genre]):
@@ -242,13 +371,13 @@ class data:
                 "featured_artists": ', '.join(self.metadata.get("featured_artists", [])),
                 "language": self.metadata.get("language", ""),
                 "song_length": self.metadata.get("song_length", 0),
-                "top_genre": self.get_song_genre(self.title, self.artist).get("top_genre", ""),
-                "other_genres": ', '.join(self.get_song_genre(self.title, self.artist)["other_genres"]) if isinstance(self.genre["other_genres"], list) else self.genre["other_genres"],
-                "genre_finished": self.get_song_genre(self.title, self.artist).get("genre_finished", False),
+                "top_genre": self.genre.get("top_genre", ""),
+                "other_genres": ', '.join(self.genre["other_genres"]) if isinstance(self.genre["other_genres"], list) else self.genre["other_genres"],
+                "genre_finished": self.genre.get("genre_finished", False),
                 "bpm": None, # FIXME: bpm
                 "lyrics": self.lyrics,
-                "language_level": self.get_song_lyrics(self.title, self.artist, self.lyrics).get("language_level", ""),
-                "topic": self.get_song_lyrics(self.title, self.artist, self.lyrics).get("topic", ""),
+                "language_level": self.lyric_data.get("language_level", ""),
+                "topic": self.lyric_data.get("topic", ""),
             }
             return audio_features
         else:
@@ -260,28 +389,29 @@ class data:
         Convert the track data to a dictionary format for database insertion.
         Returns:
             dict: Dictionary containing track data
+            None: If the metadata could not be fetched
         """
+        if not isinstance(self.metadata, dict):
+            return None
         return {
             "track_id": self.track_id,
             "title": self.title,
             "main_artist": self.artist,
-            "main_artist_id": element_name_to_id(self.artist, "artist"),
-            "featured_artists": self.get_song_metadata(self.title, self.lyrics).get("featured_artists", []),
-            "album_name": self.get_song_metadata(self.title, self.lyrics).get("album_name", ""),
-            "album_id": self.get_song_metadata(self.title, self.lyrics).get("album_id", ""),
+            "main_artist_id": self.main_artist_id,
+            "featured_artists": self.metadata.get("featured_artists", []),
+            "album_name": self.metadata.get("album_name", ""),
+            "album_id": self.metadata.get("album_id", ""),
         }
 
     def artist_to_dict(self):
-        artist_id = element_name_to_id(element_name=self.artist, element_type="artist")
+        artist_id = self.main_artist_id
         artist_name = self.artist
         today= date.today()
-        number_of_tracks = 0
-        album_names = []
-        album_ids = []
         # TODO: artist follower can be aquired with sp.search
         #  same with genres
     
         # Get monthly listeners from Spotify, by scraping the artist's page
+        monthly_listeners = None  # stays None if the page has no description
         try: 
             headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -294,7 +424,7 @@ class data:
             "Upgrade-Insecure-Requests": "1"
             }
             spotify_artist_url = f"https://open.spotify.com/intl-de/artist/{artist_id}"
-            response = requests.get(spotify_artist_url, headers=headers)
+            response = http_client.get(spotify_artist_url, headers=headers)
             print(spotify_artist_url)
             soup = bs(response.text, 'html.parser')
             meta_tag = soup.find("meta", property="og:description")
@@ -319,7 +449,7 @@ class data:
             headers = {
                 "Accept": "application/sparql-results+json"
             }
-            response = requests.get(url, params={'query': query}, headers=headers)
+            response = cached_get("wikidata", url, params={'query': query}, headers=headers)
 
             if response.status_code == 200:
                 data = response.json()
@@ -340,29 +470,18 @@ class data:
         except:
             age = None
 
-        # Get number of albums and their respective names from Spotify
+        # Get the albums and count all tracks of the artist (whole discography, cached per artist, see discography.py)
         try:
-            artist_albums = sp.artist_albums(artist_id=artist_id, include_groups="album")
-            number_of_albums = artist_albums["total"]
-            for item in artist_albums["items"]:
-                album_names.append(item["name"]) 
-                album_ids.append(item["id"])
+            discography = crawl_discography(sp, artist_id)
+            album_names = discography["album_names"]
+            number_of_albums = discography["number_of_albums"]
+            number_of_tracks = discography["number_of_tracks"]
         except Exception as e:
-            print(f"Error fetching album names and ids for {artist_name}: {e}")
+            print(f"Error fetching the discography of {artist_name}: {e}")
             number_of_tracks = None
             number_of_albums = None
             album_names = None
 
-        # Count all tracks by an artist by iterating through their spotify discography
-        try:
-            artist_discography = sp.artist_albums(artist_id=artist_id)["items"]  # Access the 'items' list
-            for item in artist_discography:
-                track_ids_of_album = sp.album_tracks(item["id"])["items"]  # Access the 'items' list
-                for track in track_ids_of_album:
-                    number_of_tracks += 1
-        except Exception as e:
-            print(f"Error fetching number of tracks for {artist_name}: {e}")
-
         return {
             "id": artist_id,
             "name": artist_name,
@@ -385,10 +504,92 @@ class data:
         # return str(out)  # <-- Convert dict to string for printing
         pass
 
+
+# attribute -> (name table, link table, id column) of the many-to-many tables (see factory migration 4)
+LINK_TABLES = {
+    "genres": ("genres", "track_genres", "genre_id"),
+    "topics": ("topics", "track_topics", "topic_id"),
+}
+
+
+_separators = re.compile(r'[-_/.]+')  # keep in sync with factory.normalized_name_sql
+
+def split_values(value):
+    """
+    Split a stored or fetched attribute into single values, every source is normalized the same way
+    ("Hip-Hop" from TheAudioDB and "hip hop" from GetGenre are the same genre)
+    Args:
+        value (str or list): "love, politics" / ["pop", "rock"] / None
+    Returns:
+        list: lower-cased values with separators (- _ / .) as single spaces, without duplicates, in order
+    """
+    if not value:
+        return []
+    parts = value if isinstance(value, (list, tuple)) else str(value).split(',')
+    values = []
+    for part in parts:
+        part = ' '.join(_separators.sub(' ', str(part)).split()).casefold()
+        if part and part not in values:
+            values.append(part)
+    return values
+
+def split_names(value, known_names=None):
+    """
+    Like split_values, but keeps the case (artist names)
+    Args:
+        value (str or list): a list is taken as is, a string is split on commas
+        known_names (set, optional): casefolded artist names, neighbouring parts of a string that join to one
+            of them stay one name ("Tyler, The Creator")
+    """
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        parts = [' '.join(str(part).split()) for part in value]
+    else:
+        parts = [' '.join(part.split()) for part in str(value).split(',')]
+        if known_names:
+            merged, i = [], 0
+            while i < len(parts):
+                for j in range(len(parts), i + 1, -1):  # longest known name first
+                    if ', '.join(parts[i:j]).casefold() in known_names:
+                        merged.append(', '.join(parts[i:j]))
+                        i = j
+                        break
+                else:
+                    merged.append(parts[i])
+                    i += 1
+            parts = merged
+    names = []
+    for part in parts:
+        if part and part not in names:
+            names.append(part)
+    return names
+
+
+def upsert_sql(table, columns, key):
+    """INSERT ... ON CONFLICT DO UPDATE for all columns, NULLs never overwrite stored values"""
+    updates = ', '.join(f"{column} = COALESCE(excluded.{column}, {table}.{column})" for column in columns if column != key)
+    return f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+        ON CONFLICT({key}) DO UPDATE SET {updates}
+    """
+
+
 class db:
+    """
+    Write access to songs.db. Records are written in batches: write_batch (and the add_* wrappers) writes
+    whole lists in one transaction, a failing batch is written again record by record.
+    Existing rows are updated, so no existence checks are needed.
+    """
+    TRACK_COLUMNS = ("track_id", "name", "main_artist_name", "main_artist_id", "featured_artists", "album_name", "album_id")
+    AUDIO_FEATURE_COLUMNS = ("track_id", "release_date", "main_artist", "featured_artists", "language", "song_length",
+                             "top_genre", "other_genres", "genre_finished", "language_level", "topic")
+    ARTIST_COLUMNS = ("id", "name", "monthly_listeners", "age", "birth_date", "number_of_tracks", "number_of_albums", "album_names")
+
     def __init__(self, db_name='data/prod/songs.db'):
-        self.conn = sqlite3.connect(db_name)
+        self.conn = db_factory.connect(db_name)
         self.cursor = self.conn.cursor()
+        self.written = {"artists": 0, "tracks": 0, "audio_features": 0}
     
     def track_exists(self, track_id):
         self.cursor.execute("SELECT 1 FROM tracks WHERE track_id = ?", (track_id,))
@@ -402,29 +603,263 @@ class db:
         self.cursor.execute("SELECT 1 FROM artists WHERE id = ?", (artist_id,))
         return self.cursor.fetchone() is not None
 
-    # TODO: track_data von audio features trennen (ist glaube fertig lol)
+    @staticmethod
+    def track_row(track_data):
+        """
+        track_id, name, main_artist_name, main_artist_id, featured_artists, album_name
+        """
+        return (
+            track_data["track_id"],
+            track_data["title"],
+            track_data["main_artist"],
+            track_data["main_artist_id"],
+            ', '.join(split_names(track_data["featured_artists"])),
+            track_data["album_name"],
+            track_data["album_id"]
+        )
+
+    @staticmethod
+    def audio_features_row(audio_features):
+        """
+        track_id, release_date, main_artist, featured_artists, language, song_length, top_genre, other_genres, language_level, topic
+        """
+        return (
+            audio_features["track_id"],
+            audio_features["release_date"],
+            audio_features["main_artist"],
+            ', '.join(split_names(audio_features["featured_artists"])),
+            audio_features["language"],
+            audio_features["song_length"],
+            ', '.join(split_values(audio_features["top_genre"])) or None,  # no genre (yet) keeps a stored one
+            ', '.join(split_values(audio_features["other_genres"])) or None,
+            audio_features["genre_finished"],
+            audio_features["language_level"],
+            audio_features["topic"]
+        )
+
+    @staticmethod
+    def artist_row(artist_data):
+        return (
+            artist_data["id"],
+            artist_data["name"],
+            artist_data["monthly_listeners"],
+            artist_data["age"],
+            artist_data["birth_date"],
+            artist_data["number_of_tracks"],
+            artist_data["number_of_albums"],
+            ', '.join(artist_data["album_names"] or [])
+        )
+
+    @staticmethod
+    def _valid_rows(records, row_builder, kind):
+        """(records, rows) of the records a row can be built from, broken records are logged and dropped"""
+        valid, rows = [], []
+        for record in records:
+            if not record:
+                continue
+            try:
+                rows.append(row_builder(record))
+                valid.append(record)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                print(f"❌ Skipping invalid {kind} record {record.get('track_id') or record.get('id') if isinstance(record, dict) else record}: {e!r}")
+        return valid, rows
+
+    def _write(self, tracks, audio_features, artists, rows):
+        """One transaction for the given records (artists first, so the tracks' foreign keys are already there)"""
+        with self.conn:
+            self.cursor.executemany(upsert_sql("artists", self.ARTIST_COLUMNS, "id"), rows["artists"])
+            self.cursor.executemany(upsert_sql("tracks", self.TRACK_COLUMNS, "track_id"), rows["tracks"])
+            self.cursor.executemany(upsert_sql("audio_features", self.AUDIO_FEATURE_COLUMNS, "track_id"), rows["audio_features"])
+            self._write_links(tracks, audio_features)
+
+    def write_batch(self, tracks=(), audio_features=(), artists=()):
+        """
+        Upsert lists of track, audio feature and artist dicts in one transaction.
+        If the transaction fails, every artist and every track (with its audio features) is written
+        again in a transaction of its own, so a bad record only loses itself.
+        Returns:
+            dict: ids of the written records per table (artists, tracks, audio_features)
+        """
+        artists, artist_rows = self._valid_rows(artists, self.artist_row, "artist")
+        tracks, track_rows = self._valid_rows(tracks, self.track_row, "track")
+        audio_features, feature_rows = self._valid_rows(audio_features, self.audio_features_row, "audio features")
+        try:
+            self._write(tracks, audio_features, artists,
+                        {"artists": artist_rows, "tracks": track_rows, "audio_features": feature_rows})
+            written = {
+                "artists": {a["id"] for a in artists},
+                "tracks": {t["track_id"] for t in tracks},
+                "audio_features": {f["track_id"] for f in audio_features},
+            }
+        except sqlite3.Error as e:
+            print(f"⚠️ Error writing batch ({len(artists)} artists, {len(tracks)} tracks, "
+                  f"{len(audio_features)} audio features): {e}, writing it record by record")
+            written = self._write_one_by_one(tracks, audio_features, artists)
+        for table, ids in written.items():
+            self.written[table] += len(ids)
+        return written
+
+    def _write_one_by_one(self, tracks, audio_features, artists):
+        """Fallback of write_batch: one transaction per artist and per track"""
+        written = {"artists": set(), "tracks": set(), "audio_features": set()}
+        for artist in artists:
+            try:
+                self._write([], [], [artist], {"artists": [self.artist_row(artist)], "tracks": [], "audio_features": []})
+                written["artists"].add(artist["id"])
+            except sqlite3.Error as e:
+                print(f"❌ Error writing artist {artist['id']}: {e}")
+        features_by_id = {f["track_id"]: f for f in audio_features}
+        tracks_by_id = {t["track_id"]: t for t in tracks}
+        for track_id in dict.fromkeys([*tracks_by_id, *features_by_id]):
+            track = [tracks_by_id[track_id]] if track_id in tracks_by_id else []
+            features = [features_by_id[track_id]] if track_id in features_by_id else []
+            try:
+                self._write(track, features, [], {
+                    "artists": [],
+                    "tracks": [self.track_row(t) for t in track],
+                    "audio_features": [self.audio_features_row(f) for f in features],
+                })
+                if track:
+                    written["tracks"].add(track_id)
+                if features:
+                    written["audio_features"].add(track_id)
+            except sqlite3.Error as e:
+                print(f"❌ Error writing track {track_id}: {e}")
+        return written
+
+    def _name_ids(self, table, names):
+        """Ids of the names in a genres/topics table, missing names are added (inside the caller's transaction)"""
+        if not names:
+            return {}
+        self.cursor.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', [(name,) for name in names])
+        ids = {}
+        names = list(names)
+        for i in range(0, len(names), 500):  # stay below SQLite's max. number of parameters
+            chunk = names[i:i + 500]
+            ids.update((name, name_id) for name_id, name in self.cursor.execute(
+                f'SELECT id, name FROM {table} WHERE name IN ({", ".join("?" for _ in chunk)})', chunk))
+        return ids
+
+    def _replace_links(self, attribute, links):
+        """
+        Replace the genre/topic links of tracks
+        Args:
+            attribute (str): genres or topics
+            links (dict): track_id -> list of (name, is_top); tracks with an empty list keep their stored links
+        """
+        table, link_table, id_column = LINK_TABLES[attribute]
+        links = {track_id: values for track_id, values in links.items() if values}
+        if not links:
+            return
+        ids = self._name_ids(table, {name for values in links.values() for name, _ in values})
+        self.cursor.executemany(f'DELETE FROM {link_table} WHERE track_id = ?', [(track_id,) for track_id in links])
+        if attribute == "genres":
+            self.cursor.executemany(
+                'INSERT OR REPLACE INTO track_genres (track_id, genre_id, is_top) VALUES (?, ?, ?)',
+                [(track_id, ids[name], int(is_top)) for track_id, values in links.items() for name, is_top in values])
+        else:
+            self.cursor.executemany(
+                f'INSERT OR IGNORE INTO {link_table} (track_id, {id_column}) VALUES (?, ?)',
+                [(track_id, ids[name]) for track_id, values in links.items() for name, _ in values])
+
+    def _replace_featured_artists(self, featured):
+        """featured: track_id -> list of artist names; tracks with an empty list keep their stored links"""
+        featured = {track_id: names for track_id, names in featured.items() if names}
+        if not featured:
+            return
+        self.cursor.executemany('DELETE FROM track_featured_artists WHERE track_id = ?', [(track_id,) for track_id in featured])
+        self.cursor.executemany(
+            'INSERT OR IGNORE INTO track_featured_artists (track_id, artist_name, position) VALUES (?, ?, ?)',
+            [(track_id, name, position) for track_id, names in featured.items() for position, name in enumerate(names)])
+
+    def _write_links(self, tracks, audio_features):
+        """Fill the genre, topic and featured artist link tables from track and audio feature dicts"""
+        genres, topics, featured = {}, {}, {}
+        for features in audio_features:
+            top = split_values(features.get("top_genre"))
+            genres[features["track_id"]] = [(name, True) for name in top] + [
+                (name, False) for name in split_values(features.get("other_genres")) if name not in top]
+            topics[features["track_id"]] = [(name, False) for name in split_values(features.get("topic"))]
+            featured[features["track_id"]] = split_names(features.get("featured_artists"))
+        for track in tracks:
+            featured[track["track_id"]] = split_names(track.get("featured_artists")) or featured.get(track["track_id"], [])
+        self._replace_links("genres", genres)
+        self._replace_links("topics", topics)
+        self._replace_featured_artists(featured)
+
+    def backfill_links(self):
+        """
+        Split the comma-joined genre, topic and featured artist columns of stored tracks into the link tables.
+        Tracks that already have links (written by the import) keep them, only the missing ones are filled.
+        Returns:
+            int: number of tracks processed
+        """
+        rows = self.cursor.execute('''
+            SELECT audio_features.track_id, top_genre, other_genres, topic,
+                   COALESCE(NULLIF(audio_features.featured_artists, ''), tracks.featured_artists)
+            FROM audio_features LEFT JOIN tracks ON tracks.track_id = audio_features.track_id
+        ''').fetchall()
+        linked = {
+            table: {row[0] for row in self.cursor.execute(f'SELECT DISTINCT track_id FROM {table}')}
+            for table in ("track_genres", "track_topics", "track_featured_artists")
+        }
+        # names with a comma inside ("Tyler, The Creator") can only be told apart from two artists by knowing them
+        known_names = {row[0].casefold() for row in self.cursor.execute(
+            'SELECT name FROM artists UNION SELECT main_artist_name FROM tracks UNION SELECT artist_name FROM track_featured_artists'
+        ) if row[0] and ',' in row[0]}
+        features = []
+        for track_id, top_genre, other_genres, topic, featured in rows:
+            genres_linked = track_id in linked["track_genres"]
+            features.append({
+                "track_id": track_id,
+                "top_genre": None if genres_linked else top_genre,
+                "other_genres": None if genres_linked else other_genres,
+                "topic": None if track_id in linked["track_topics"] else topic,
+                "featured_artists": None if track_id in linked["track_featured_artists"] else split_names(featured, known_names),
+            })
+        with self.conn:
+            self._write_links([], features)
+        print(f"✅ Backfilled genre, topic and featured artist links of {len(features)} tracks")
+        return len(features)
+
+    def tracks_with_genre(self, genre, top_only=False):
+        """Track ids with a genre (through the genre index, no LIKE scan)"""
+        return [row[0] for row in self.cursor.execute('''
+            SELECT track_genres.track_id FROM genres JOIN track_genres ON track_genres.genre_id = genres.id
+            WHERE genres.name = ? AND (? = 0 OR track_genres.is_top = 1)
+        ''', ((split_values(genre) or [''])[0], int(top_only)))]
+
+    def tracks_with_topic(self, topic):
+        """Track ids with a lyric topic"""
+        return [row[0] for row in self.cursor.execute('''
+            SELECT track_topics.track_id FROM topics JOIN track_topics ON track_topics.topic_id = topics.id
+            WHERE topics.name = ?
+        ''', ((split_values(topic) or [''])[0],))]
+
+    def tracks_featuring(self, artist_name):
+        """Track ids an artist is featured on"""
+        return [row[0] for row in self.cursor.execute(
+            'SELECT track_id FROM track_featured_artists WHERE artist_name = ?', (' '.join(artist_name.split()),))]
+
+    def add_tracks(self, tracks):
+        return self.write_batch(tracks=tracks)
+
+    def add_audio_features_batch(self, audio_features):
+        return self.write_batch(audio_features=audio_features)
+
+    def add_artists(self, artists):
+        return self.write_batch(artists=artists)
+
+    def close(self):
+        self.conn.close()
+
+    # single record versions
     def add_track(self, track_data):
         """
         Add a track to the database
         track_id, name, main_artist_name, main_artist_id, featured_artists, album_name
         """
-        try: 
-            # print(track_data)
-            self.cursor.execute('''
-                INSERT INTO tracks (track_id, name, main_artist_name, main_artist_id, featured_artists, album_name, album_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                track_data["track_id"],
-                track_data["title"],
-                track_data["main_artist"],
-                track_data["main_artist_id"],
-                ''.join(track_data["featured_artists"]),
-                track_data["album_name"],
-                track_data["album_id"]
-            ))
-            self.conn.commit()
-        except sqlite3.IntegrityError as e:
-            print(f"Error adding track: {e}")
+        self.add_tracks([track_data])
     
     def add_audio_features(self, audio_features):
         """
@@ -434,50 +869,13 @@ class db:
         if not audio_features:
             print("audio_features dict is None in adding process, skipping...")
             return
-        try:
-            self.cursor.execute('''
-                INSERT INTO audio_features (track_id, release_date, main_artist, featured_artists, language, song_length, top_genre, other_genres, genre_finished, language_level, topic)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                audio_features["track_id"],
-                audio_features["release_date"],
-                audio_features["main_artist"],
-                ''.join(audio_features["featured_artists"]),
-                audio_features["language"],
-                audio_features["song_length"],
-                ''.join(audio_features["top_genre"]),
-                ''.join(audio_features["other_genres"]),
-                audio_features["genre_finished"],
-                audio_features["language_level"],
-                audio_features["topic"]
-            ))
-            self.conn.commit()
-        except sqlite3.IntegrityError as e:
-            print(f"Error adding audio features: {e}")
+        self.add_audio_features_batch([audio_features])
 
     def add_artist(self, artist_data=None):
         if artist_data is None:
             print("artist_dict is None in adding process, skipping...")
             return
-        
-        try:
-            self.cursor.execute('''
-                    INSERT INTO artists (id, name, monthly_listeners, age, birth_date, number_of_tracks, number_of_albums, album_names)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    artist_data["id"],
-                    artist_data["name"],
-                    artist_data["monthly_listeners"],
-                    artist_data["age"],
-                    artist_data["birth_date"],
-                    artist_data["number_of_tracks"],
-                    artist_data["number_of_albums"],
-                    ', '.join(artist_data["album_names"])
-                ))
-            self.conn.commit()
-        
-        except sqlite3.IntegrityError as e:
-            print(f"Error adding audio features: {e}")
+        self.add_artists([artist_data])
         
 
 
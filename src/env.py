@@ -1,15 +1,19 @@
 import dotenv
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-from spotipy.oauth2 import SpotifyOAuth
-import google.generativeai as genai
+import threading
+import time
 import src.genius_auth as genius_auth
+from src.http_client import get_session
+# spotipy and google.generativeai are imported inside the initializers, they are slow to import
 
+_env_loaded = False
 
 def load_env_variables():
-    """Load environment variables from .env file"""
-    dotenv.load_dotenv(dotenv_path="data/prod/.env")  # Adjust the path to your .env file
+    """Load environment variables from .env file (the file is only read once per process)"""
+    global _env_loaded
+    if not _env_loaded:
+        dotenv.load_dotenv(dotenv_path="data/prod/.env")  # Adjust the path to your .env file
+        _env_loaded = True
     SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
     SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
     SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI") 
@@ -19,34 +23,32 @@ def load_env_variables():
     GENIUS_REDIRECT_URI = os.getenv('GENIUS_REDIRECT_URI')
     return SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, GOOGLE_API_KEY, GENIUS_CLIENT_ID, GENIUS_CLIENT_SECRET, GENIUS_REDIRECT_URI
 
+GEMINI_MODEL_NAME = 'gemini-2.0-flash-lite'
+
 def initialize_spotify_client():
-    """Initialize the Spotify client with credentials"""
+    """Initialize the Spotify client with credentials, use get_client("spotify") to share one instance"""
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
     SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, *_ = load_env_variables()
 
-    # Initialize the Spotify client
-    auth_manager = SpotifyClientCredentials(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET
-    )
-    
     # Initialize Spotify client with OAuth for user authentication
-    global sp
     sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
         client_id=SPOTIFY_CLIENT_ID,
         client_secret=SPOTIFY_CLIENT_SECRET,
         redirect_uri=SPOTIFY_REDIRECT_URI,
         scope="playlist-read-private playlist-read-collaborative user-library-read playlist-modify-public playlist-modify-private user-modify-playback-state",  # Added user-modify-playback-state
-        cache_path="data/prod/.spotify_cache"
-    ))
+        cache_path="data/prod/.spotify_cache",
+        requests_session=get_session()
+    ), requests_session=get_session())  # shared keep-alive pool, retries 429/5xx with backoff
     return sp
 
 def initialize_gemini_client():
-    # Configure Gemini API
+    # Configure Gemini API, use get_client("gemini") to share one instance
+    import google.generativeai as genai
     # TODO: WARNING: THE REDIRECT URI IS USED BY TWO DIFFERENT CLIENTS (SPOTIFY AND GENIUS)
     SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, GOOGLE_API_KEY, *_ = load_env_variables() # TODO: dont load all variables
     genai.configure(api_key=GOOGLE_API_KEY) # use configure instead of client
-    global model
-    model = genai.GenerativeModel('gemini-2.0-flash-lite') #specify the model
+    model = genai.GenerativeModel(GEMINI_MODEL_NAME) #specify the model
     return model
 
 def initialize_genius_client():
@@ -61,9 +63,75 @@ def initialize_genius_client():
         # Get the authorization info & code from the callback server
         genius_token_info = genius_auth.main()
         # print(f"Genius token info: {genius_token_info}") # Print the token info for debugging
-        return
+        return genius_token_info
         # authorization_code = genius_token_info['code']
 
     except Exception as e:
         print(f"❌ Error initializing Genius client: {e}")
         return None
+
+
+# Process wide client registry: every client is created on first use and then shared,
+# so importing a module never authenticates or touches the network.
+CLIENT_FACTORIES = {
+    "spotify": initialize_spotify_client,
+    "gemini": initialize_gemini_client,
+    "genius": initialize_genius_client,  # the Genius token info
+}
+_clients = {}
+_failed = set()  # clients whose factory returned None, not tried again until reset_client
+_client_init_seconds = {}
+_clients_lock = threading.Lock()  # guards the dicts above, never held while a factory runs
+_client_locks = {name: threading.Lock() for name in CLIENT_FACTORIES}  # one per client
+
+def get_client(name):
+    """
+    Get the shared client, creating it the first time.
+    Only callers of the same client wait while it is created (e.g. during the Genius OAuth flow),
+    a client that couldn't be created is None for the rest of the session (see reset_client).
+    Args:
+        name (str): spotify, gemini or genius
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _client_locks[name]:
+        with _clients_lock:
+            if name in _clients:
+                return _clients[name]
+            if name in _failed:
+                return None
+        started = time.perf_counter()
+        client = CLIENT_FACTORIES[name]()
+        with _clients_lock:
+            _client_init_seconds[name] = time.perf_counter() - started
+            if client is None:
+                _failed.add(name)
+                print(f"⚠️ {name} client unavailable, not trying again in this session")
+                return None
+            _clients[name] = client
+        return client
+
+def reset_client(name):
+    """Forget a client or its failure (e.g. after the token was cleared), the next use creates a new one"""
+    with _clients_lock:
+        _clients.pop(name, None)
+        _failed.discard(name)
+
+def client_stats():
+    """Returns: dict of the seconds each created client took to initialize"""
+    with _clients_lock:
+        return dict(_client_init_seconds)
+
+
+class LazyClient:
+    """Module level stand-in for a client, it is only created when an attribute is used"""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_client(self._name), attr)
+
+    def __repr__(self):
+        state = "created" if self._name in _clients else "not created yet"
+        return f"<LazyClient {self._name} ({state})>"
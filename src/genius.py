@@ -1,18 +1,38 @@
-import json
-import requests
-from bs4 import BeautifulSoup
-import src.genius_auth as genius_auth
+import difflib
+import re
+from src.env import get_client
+from src.http_cache import cached_get
+from src.database.lyrics_store import get_lyrics_store
+from src.lyrics_extractor import extract_lyrics
+from src.database.genius_id_cache import get_genius_id_cache
+from src.database.resolution_index import normalize
 
-def get_lyrics_genius(artist_name, track_name):
+MIN_MATCH_SCORE = 0.6  # hits below this are treated as "Genius doesn't have the song"
+TITLE_WEIGHT = 0.6     # title similarity counts a bit more than the artist (features, "&" duos ...)
+_section_start = re.compile(r'(?=\[)')
+_bracketed = re.compile(r'[(\[]([^)\]]+)[)\]]')
+
+def get_genius_token():
+    """The Genius access token, the auth flow only runs the first time it's needed"""
+    token_info = get_client("genius")
+    return token_info.get('access_token') if token_info else None
+
+def get_lyrics_genius(artist_name, track_name, track_id=None):
     """
-    Get lyrics from Genius API
-    Returns: Lyrics as a string or None if not found
-    FIXME: ALSO: WHY THE FUCK IS IT SEARCHING FOR THE WRONG TRACKS (SEE CELO ABDI 20 ZOLL MAE)
+    Get lyrics from the lyrics store, or from Genius (and store them) if they were never fetched
+    Args:
+        artist_name (str): main artist
+        track_name (str): song title
+        track_id (str, optional): Spotify track id, lets the store answer without a Genius search
+    Returns: Lyrics fragments as a list or None if not found
     """
-    # Load token from cache
-    with open('data/prod/cache.json', 'r') as f:
-        cache_data = json.load(f)
-        access_token = cache_data.get('genius_token', {}).get('access_token')
+    store = get_lyrics_store()
+    if track_id:
+        lyrics = store.get_by_track(track_id)
+        if lyrics is not None:
+            return lyrics
+
+    access_token = get_genius_token()
     
     if not access_token:
         print("❌ No Genius access token found in cache")
@@ -23,9 +43,18 @@ def get_lyrics_genius(artist_name, track_name):
         'Authorization': f'Bearer {access_token}'
     }
 
-    track_id = get_genius_track_id(artist_name, track_name) # get the song id from genius
-    track_url = f"https://api.genius.com/songs/{track_id}" # get the song url from genius
-    data = requests.get(track_url, headers=headers).json() # get the song data from genius
+    genius_id = get_genius_track_id(artist_name, track_name) # get the song id from genius
+    if genius_id is None:
+        return None
+
+    lyrics = store.get(genius_id)
+    if lyrics is not None:
+        if track_id:
+            store.link_track(genius_id, track_id)
+        return lyrics
+
+    track_url = f"https://api.genius.com/songs/{genius_id}" # get the song url from genius
+    data = cached_get("genius", track_url, headers=headers).json() # get the song data from genius
     # print(track_id)
     # print(track_url)
     # print(data) # print the song data
@@ -33,29 +62,96 @@ def get_lyrics_genius(artist_name, track_name):
     lyrics_url = data['response']['song']['url'] # get the lyrics url from genius
     
     # Get the actual lyrics by scraping the page
-    page = requests.get(lyrics_url)
+    page = cached_get("genius_page", lyrics_url)
     # print(f"Scraping lyrics from: {lyrics_url}")
-    soup = BeautifulSoup(page.content, 'html.parser')
-    
-    # Find lyrics container and extract text
-    lyrics_div = soup.find('div', class_='bjajog')
-    if lyrics_div:
-        # Remove script tags and clean up the text
-        [s.extract() for s in lyrics_div(['script', 'style'])]
-        lyrics = lyrics_div.get_text()
-        lyrics = lyrics.split('[')[1:] # remove irrelevant stuff from beautifulsoup scraping
+    # only the lyrics containers are parsed, see lyrics_extractor for the strategies
+    sections = split_sections(extract_lyrics(page.text))
+    if sections:
         # print("Lyrics found:")
-        # print(lyrics)
-        return lyrics
+        # print(sections)
+        store.put(genius_id, sections, track_id)
+        return sections
     else:
-        print("❌ Could not extract lyrics from page, the class on genius' website probably changed")
+        print("❌ Could not extract lyrics from page, the layout of genius' website probably changed")
+
+def split_sections(lyrics):
+    """
+    Split lyrics into their sections ([Verse 1], [Chorus] ...)
+    Returns:
+        list: sections with their "[...]" header, lines before the first header (or songs without any) are kept
+    """
+    return [part for part in _section_start.split(lyrics or '') if part.strip()]
+
+def similarity(a, b, partial=False):
+    """
+    Similarity (0-1) of two normalized titles or artist names
+    Args:
+        partial (bool): one name containing the other counts as a good match ("Celo" vs "Celo & Abdi")
+    """
+    a, b = normalize(a), normalize(b)
+    if not a or not b:
+        return 0.0
+    ratio = difflib.SequenceMatcher(None, a, b).ratio()
+    if partial and (f" {a} " in f" {b} " or f" {b} " in f" {a} "):
+        return max(0.9, ratio)
+    return ratio
+
+def score_hit(hit, artist_name, track_name):
+    """
+    Score how well a Genius search hit matches the song we look for
+    Returns:
+        float: weighted title and artist similarity (0-1), 0 for hits that aren't songs
+    """
+    if hit.get('type', 'song') != 'song':
+        return 0.0
+    result = hit.get('result', {})
+    titles = [result.get('title'), result.get('title_with_featured')]
+    titles += _bracketed.findall(result.get('title') or '')  # songs in other scripts carry the English title in brackets: "봄날 (Spring Day)"
+    title_score = max(similarity(track_name, title) for title in titles)
+    artists = [result.get('artist_names'), result.get('primary_artist', {}).get('name')]
+    artists += [artist.get('name') for artist in result.get('featured_artists', [])]
+    artist_score = max(similarity(artist_name, artist, partial=True) for artist in artists)
+    return TITLE_WEIGHT * title_score + (1 - TITLE_WEIGHT) * artist_score
+
+def rank_hits(hits, artist_name, track_name):
+    """
+    Returns:
+        list: (score, result) of all hits, best match first
+    """
+    def raw_title_match(result):
+        # tie breaker between versions that normalize to the same title, e.g. "Get Lucky (Remix)" and "Get Lucky (Ft. ...)"
+        # shared words of both full titles, so extra "(Remix)"/"(Live)" words count against a hit
+        words = lambda text: set(re.findall(r'\w+', str(text or '').casefold()))
+        wanted, title = words(track_name), words(result.get('title_with_featured'))
+        return len(wanted & title) / len(wanted | title) if wanted | title else 0.0
+
+    ranked = [(score_hit(hit, artist_name, track_name), hit.get('result', {})) for hit in hits]
+    return sorted(ranked, key=lambda scored: (scored[0], raw_title_match(scored[1])), reverse=True)
+
+def best_hit(hits, artist_name, track_name):
+    """
+    Returns:
+        tuple: (genius_id, score) of the best hit, genius_id is None if no hit is similar enough
+    """
+    ranked = rank_hits(hits, artist_name, track_name)
+    if not ranked or ranked[0][0] < MIN_MATCH_SCORE:
+        return None, ranked[0][0] if ranked else None
+    return ranked[0][1].get('id'), ranked[0][0]
 
 def get_genius_track_id(artist_name, track_name):
+    """
+    Find the Genius song id of a track: every search hit is ranked by title/artist similarity
+    and the result (also "no match") is remembered in the Genius id cache
+    Returns:
+        int: Genius song id, None if Genius has no matching song or the search failed
+    """
+    id_cache = get_genius_id_cache()
+    known, genius_id = id_cache.get(artist_name, track_name)
+    if known:
+        return genius_id
+
     try:
-        # Load token from cache
-        with open('data/prod/cache.json', 'r') as f:
-            cache_data = json.load(f)
-            access_token = cache_data.get('genius_token', {}).get('access_token')
+        access_token = get_genius_token()
         
         if not access_token:
             print("❌ No Genius access token found in cache")
@@ -66,13 +162,13 @@ def get_genius_track_id(artist_name, track_name):
             'Authorization': f'Bearer {access_token}'
         }
 
-        # URL encode the search parameters
-        search_query = f"{artist_name} {track_name}".replace(" ", "%20")
-        url = f'https://api.genius.com/search?q={search_query}'
+        # search parameters get URL encoded by requests
+        search_query = f"{artist_name.strip()} {track_name.strip()}"
+        url = 'https://api.genius.com/search'
         # for debugging
-        # print(f"search url for genius lyrics api: {url + search_query}")
-        # Make authenticated request
-        response = requests.get(url, headers=headers)
+        # print(f"search url for genius lyrics api: {url}?q={search_query}")
+        # Make authenticated request (or answer from the http cache)
+        response = cached_get("genius", url, params={'q': search_query}, headers=headers)
         
         if response.status_code != 200:
             print(f"❌ API request failed with status code: {response.status_code}")
@@ -80,18 +176,15 @@ def get_genius_track_id(artist_name, track_name):
 
         data = response.json()
         hits = data.get('response', {}).get('hits', [])
-        # FIXME: if hits is empty, dont begin the entire thing at all, just return None
-        try:     
-            if hits:
-                print("✅ API request successful!")
-                print(hits[0].get('result', {}).get('id'))
-                return hits[0].get('result', {}).get('id')
-            else:
-                print("❌ No results found")
-                return None
-        except KeyError as e:
-            print(f"❌ KeyError: {e} - Response structure may have changed")
-            return None
+        genius_id, score = best_hit(hits, artist_name, track_name)
+        if genius_id:
+            print(f"✅ Genius match for {track_name} by {artist_name}: {genius_id} (score {score:.2f})")
+        elif hits:
+            print(f"❌ No matching Genius result for {track_name} by {artist_name} (best score {score:.2f})")
+        else:
+            print("❌ No results found")
+        id_cache.put(artist_name, track_name, genius_id, score)
+        return genius_id
     except Exception as e:
         print(f"❌ Error accessing Genius API: {e}")
         return None
@@ -1,10 +1,9 @@
-import requests
+from src import http_client
+from src.cache_manager import get_cache
 import webbrowser
 import http.server
 import socketserver
 import urllib.parse
-import json
-import os
 from urllib.parse import urlencode
 
 # Genius API credentials
@@ -90,7 +89,7 @@ def exchange_code_for_token(code):
         'grant_type': 'authorization_code'
     }
     
-    response = requests.post(GENIUS_TOKEN_URL, data=token_data)
+    response = http_client.post(GENIUS_TOKEN_URL, data=token_data)
     
     if response.status_code == 200:
         token_info = response.json()
@@ -101,22 +100,11 @@ def exchange_code_for_token(code):
         return None
 
 def save_token_to_file(token_info):
-    """Save the token information to cache.json file"""
+    """Save the token information to the cache (cache.json)"""
     try:
-        # Load existing cache data
-        cache_data = {}
-        try:
-            with open('data/prod/cache.json', 'r') as f:
-                cache_data = json.load(f)
-        except FileNotFoundError:
-            pass
-
-        # Update with new token info
-        cache_data['genius_token'] = token_info
-
-        # Write back to cache
-        with open('data/prod/cache.json', 'w') as f:
-            json.dump(cache_data, f)
+        cache = get_cache()
+        cache.genius_token = token_info
+        cache.flush()  # the token is needed by the next run even if this one crashes
         print("✅ Token saved to cache.json")
         return True
     except Exception as e:
@@ -124,13 +112,9 @@ def save_token_to_file(token_info):
         return False
 
 def load_token_from_file():
-    """Load token information from cache.json file"""
+    """Load token information from the cache (cache.json)"""
     try:
-        with open('data/prod/cache.json', 'r') as f:
-            cache_data = json.load(f)
-            return cache_data.get('genius_token')
-    except FileNotFoundError:
-        return None
+        return get_cache().genius_token
     except Exception as e:
         print(f"❌ Error loading token: {e}")
         return None
@@ -164,7 +148,7 @@ def test_api_call(access_token):
         'Authorization': f'Bearer {access_token}'
     }
     
-    response = requests.get('https://api.genius.com/account', headers=headers)
+    response = http_client.get('https://api.genius.com/account', headers=headers)
     
     if response.status_code == 200:
         user_data = response.json()
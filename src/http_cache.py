@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from src import http_client
+from src.database.factory import db_factory
+
+CACHE_PATH = 'data/prod/http_cache.db'
+MAX_CACHE_BYTES = 256 * 1024 * 1024  # compressed bodies, least recently used entries are evicted above this
+
+DAY = 24 * 60 * 60
+# how long a response stays valid, per source
+TTL = {
+    "genius": 30 * DAY,        # song + search api
+    "genius_page": 30 * DAY,   # scraped lyrics pages
+    "audiodb": 14 * DAY,
+    "getgenre": 90 * DAY,      # only finished results are stored
+    "wikidata": 180 * DAY,     # birth dates don't change
+}
+DEFAULT_TTL = 7 * DAY
+
+
+class CachedResponse:
+    """The parts of a requests.Response the call sites use, rebuilt from the cache"""
+    def __init__(self, url, status_code, content, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.from_cache = True
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def normalize_key(method, url, params=None):
+    """
+    Build the cache key of a request: lower-cased scheme/host, query parameters from the url and
+    params merged and sorted, whitespace in the values collapsed. Headers (tokens) are not part of it.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(key, str(value)) for key, value in (params.items() if isinstance(params, dict) else params)]
+    query = sorted((key, ' '.join(value.split())) for key, value in query)
+    return f"{method.upper()} " + urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+class HttpCache:
+    """
+    On-disk response cache backed by SQLite with a TTL per source and LRU eviction above max_bytes.
+    Safe to share between threads.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = db_factory.connect(path, check_same_thread=False, migrate=False)  # not songs.db, only the pragma profile
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                encoding TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)')
+        self.conn.commit()
+
+    def get(self, source, key):
+        """Return the cached response for key, or None if there is none or it expired"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT status, body, encoding, stored_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[3] > TTL.get(source, DEFAULT_TTL):
+                self.misses[source] = self.misses.get(source, 0) + 1
+                return None
+            self.conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits[source] = self.hits.get(source, 0) + 1
+        status, body, encoding, _ = row
+        return CachedResponse(key.split(' ', 1)[1], status, zlib.decompress(body), encoding)
+
+    def put(self, source, key, response):
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO responses (key, source, status, body, encoding, size, stored_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, source, response.status_code, body, response.encoding, len(body), now, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used entries until the cache fits into max_bytes (lock must be held)"""
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute('SELECT key, size FROM responses ORDER BY last_used').fetchall():
+            self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, source=None):
+        with self.lock:
+            if source is None:
+                self.conn.execute('DELETE FROM responses')
+            else:
+                self.conn.execute('DELETE FROM responses WHERE source = ?', (source,))
+            self.conn.commit()
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses and hit rate per source, plus entries/bytes stored and evictions
+        """
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            sources = {}
+            for source in set(self.hits) | set(self.misses):
+                hits, misses = self.hits.get(source, 0), self.misses.get(source, 0)
+                sources[source] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        return {"sources": sources, "entries": entries, "bytes": size, "evictions": self.evictions}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_http_cache():
+    """The process wide cache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache()
+        return _cache
+
+
+def cached_get(source, url, params=None, headers=None, cache_if=None, **kwargs):
+    """
+    requests.get that answers from the on-disk cache when possible.
+    Args:
+        source (str): name of the API, selects the TTL (see TTL)
+        url (str): request url
+        params (dict, optional): query parameters, part of the cache key
+        headers (dict, optional): request headers, NOT part of the cache key
+        cache_if (callable, optional): gets the live response, only stored if it returns True
+            (default: only 200 responses are stored)
+    Returns:
+        requests.Response or CachedResponse
+    """
+    cache = get_http_cache()
+    key = normalize_key('GET', url, params)
+    cached = cache.get(source, key)
+    if cached is not None:
+        return cached
+
+    response = http_client.get(url, params=params, headers=headers, **kwargs)
+    should_store = cache_if(response) if cache_if else response.status_code == 200
+    if should_store:
+        try:
+            cache.put(source, key, response)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not store response in http cache: {e}")
+    return response
+
+
+def print_cache_stats():
+    stats = get_http_cache().stats()
+    print(f"🗄️ HTTP cache: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB, {stats['evictions']} evicted")
+    for source, s in sorted(stats["sources"].items()):
+        print(f"   {source:<12} hits {s['hits']:>5}, misses {s['misses']:>5} ({s['hit_rate']:.0%})")
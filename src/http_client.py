@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeout in seconds, per host with a default for everything else
+DEFAULT_TIMEOUT = (5, 30)
+TIMEOUTS = {
+    "api.getgenre.com": (5, 70),       # the search waits up to 60s server side
+    "query.wikidata.org": (5, 60),     # SPARQL can be slow
+}
+
+POOL_SIZE = 20  # connections kept alive per host, should be >= the biggest worker pool
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 0.5  # 0.5s, 1s, 2s, 4s ...
+BACKOFF_JITTER = 0.5  # up to this many seconds added randomly to every backoff
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class _Retry(Retry):
+    """
+    Retry only on 429 and 5xx (plus connection errors, where the request never reached the server).
+    A 429 means the request was not handled at all, so it is retried for POST too.
+    """
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class _Session(requests.Session):
+    """requests.Session that fills in the per-host timeout when the caller didn't pass one"""
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = TIMEOUTS.get(urlsplit(url).hostname, DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def build_session():
+    retry = _Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=0,  # a read timeout may have been handled by the server, don't send it twice
+        status=MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_jitter=BACKOFF_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,  # hand the last response to the caller like before
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = _Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """The shared keep-alive session, every outbound call (Spotify included) should use this"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
+
+
+def backoff_delay(attempt, base=BACKOFF_FACTOR * 2, cap=30):
+    """
+    Seconds to wait before polling again, exponential with jitter (half fixed, half random)
+    Args:
+        attempt (int): 0 for the first retry
+    """
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RateLimiter:
+    """
+    Token bucket shared between threads, acquire() blocks until a request may be sent
+    Args:
+        rate (float): requests per second on average
+        burst (int): requests that may be sent at once after an idle period
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,147 @@
+import json
+import re
+from html.parser import HTMLParser
+from src.cache_manager import get_cache
+
+CHUNK_SIZE = 8 * 1024  # characters fed to the parser at once, parsing stops as soon as a container is closed
+
+_whitespace = re.compile(r'\s+')
+
+# elements without a closing tag, they don't change the nesting depth
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+
+class _LyricsTextParser(HTMLParser):
+    """
+    Collects the text of one element (the first start tag it is fed) and stops when that element is closed.
+    Whitespace is collapsed like a browser does, <br> and the end of a <p> become line breaks, scripts, styles and elements marked with data-exclude-from-selection (headers, ads) are skipped.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.depth = 0
+        self.exclude_depth = None  # depth of the excluded element we are in
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'br':
+            if self.exclude_depth is None:
+                self.parts.append('\n')
+            return
+        if tag in VOID_TAGS:
+            return
+        self.depth += 1
+        if self.exclude_depth is None and (tag in ('script', 'style') or ('data-exclude-from-selection', 'true') in attrs):
+            self.exclude_depth = self.depth
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'br' and not self.done and self.exclude_depth is None:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if self.done or tag in VOID_TAGS:
+            return
+        if self.exclude_depth == self.depth:
+            self.exclude_depth = None
+        elif tag == 'p' and self.exclude_depth is None:
+            self.parts.append('\n')
+        self.depth -= 1
+        if self.depth <= 0:
+            self.done = True
+
+    def handle_data(self, data):
+        if not self.done and self.depth > 0 and self.exclude_depth is None:
+            self.parts.append(_whitespace.sub(' ', data))  # line breaks in the page source aren't line breaks
+
+    def text(self):
+        return '\n'.join(line.strip() for line in ''.join(self.parts).split('\n'))
+
+
+def element_text(html, start):
+    """
+    Text of the element whose start tag begins at html[start], only this element is parsed
+    Args:
+        html (str): whole page
+        start (int): index of the '<' of the start tag
+    Returns:
+        str: text of the element
+    """
+    parser = _LyricsTextParser()
+    pos = start
+    while not parser.done and pos < len(html):
+        parser.feed(html[pos:pos + CHUNK_SIZE])
+        pos += CHUNK_SIZE
+    return parser.text()
+
+
+def container_strategy(marker):
+    """
+    Strategy that joins the text of every element whose start tag matches marker (a regex for
+    something inside the tag), the page is only parsed inside those elements.
+    """
+    pattern = re.compile(marker)
+
+    def extract(html):
+        texts = []
+        pos = 0
+        while True:
+            match = pattern.search(html, pos)
+            if not match:
+                break
+            texts.append(element_text(html, html.rfind('<', 0, match.start())))
+            pos = match.end()
+        return '\n'.join(texts)
+    return extract
+
+
+_preloaded_state = re.compile(r"window\.__PRELOADED_STATE__\s*=\s*JSON\.parse\('(.*?)'\);", re.DOTALL)
+
+def preloaded_state_strategy(html):
+    """Lyrics html embedded in the JSON state Genius ships for its React app"""
+    match = _preloaded_state.search(html)
+    if not match:
+        return None
+    try:
+        state = json.loads('"' + match.group(1).replace("\\'", "'") + '"')
+        body = json.loads(state)['songPage']['lyricsData']['body']['html']
+    except (ValueError, KeyError, TypeError):
+        return None
+    return element_text(f'<div>{body}</div>', 0)
+
+
+# tried in this order, starting with the one that worked last
+STRATEGIES = {
+    "data_attribute": container_strategy(r'data-lyrics-container="true"'),
+    "preloaded_state": preloaded_state_strategy,
+    "legacy_class": container_strategy(r'class="lyrics"'),
+    "bjajog_class": container_strategy(r'class="[^"]*\bbjajog\b'),
+}
+
+strategy_stats = {name: 0 for name in STRATEGIES}  # successful extractions per strategy
+
+
+def extract_lyrics(html):
+    """
+    Extract the lyrics text from a Genius song page.
+    The strategy that worked last is kept in cache.json and tried first, also after a restart.
+    Args:
+        html (str): the page
+    Returns:
+        str: lyrics with line breaks, None if no strategy found them (the layout probably changed)
+    """
+    cache = get_cache()
+    last = cache.lyrics_strategy
+    names = list(STRATEGIES)
+    if last in STRATEGIES:
+        names.remove(last)
+        names.insert(0, last)
+    for name in names:
+        lyrics = STRATEGIES[name](html)
+        if lyrics and lyrics.strip():
+            if name != last:
+                cache.lyrics_strategy = name  # only written when the layout changed
+            strategy_stats[name] += 1
+            return lyrics.strip()
+    return None
@@ -2,13 +2,19 @@ import inquirer
 import os
 import json
 import datetime
-from src.env import initialize_spotify_client, initialize_gemini_client, initialize_genius_client
-from src.utils import string_to_list, id_to_element_name
-from src.cache_manager import load_cache_data, update_cache_data
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.env import LazyClient, reset_client
+from src.utils import id_to_element_name
+from src.recommendations import iter_recommendations, parse_failure_rate
+from src.cache_manager import load_cache_data, update_cache_data, get_cache, verify_default_playlist, mark_default_playlist_verified
 from src.spotify import add_to_queue, get_discovery_type, from_where, PlaylistManager
-from src.ai import get_lyric_attributes_ai, ask_ai
+from src.ai import get_lyric_attributes_ai, ask_ai_stream
+from src.resolver import resolve_results
 from src.genius import get_lyrics_genius
 from src.audio_db import get_audio_db_info
+from src.database.candidates import get_candidate_index, SHORTLIST_SIZE
 
 
 def what_to_do():
@@ -46,6 +52,14 @@ def what_to_do():
                 if default_playlist_id is None and default_playlist_name is None:
                     print("No default Playlist found. Please set one in the settings, or check Cache.")
                     return
+                # the cached id is only checked against Spotify when it's used (and at most every few days)
+                if not verify_default_playlist(playlist_manager.sp):
+                    default_playlist_id = playlist_manager.find_user_playlist_id(default_playlist_name) # look the id up again by name
+                    if default_playlist_id is None:
+                        print("No default Playlist found. Please set one in the settings, or check Cache.")
+                        return
+                    update_cache_data('default_playlist_id', default_playlist_id)
+                    mark_default_playlist_verified()
                 # remove old tracks from the default playlist
                 playlist_manager.sp.playlist_replace_items(default_playlist_id, [])
                 print(f"Removed old tracks from the default playlist: {default_playlist_name}")
@@ -105,6 +119,8 @@ def settings():
         advanced_settings_answer = inquirer.prompt(advanced_settings)
         if advanced_settings_answer['advanced_settings'] == 'clear authentication (resetting Spotify token)':
             open('data/prod/.spotify_cache', 'w').close() # Clear the cache file to force re-authentication (by overwriting it)
+            reset_client("spotify") # the next Spotify call authenticates again
+            playlist_manager.index.reset() # playlists and user of the old account
             print("Spotify account changed. Please re-authenticate.")
         elif advanced_settings_answer['advanced_settings'] == 'change Gemini API key':
             os.putenv("gemini_api_key", input("Enter new Gemini API key: "))
@@ -127,11 +143,10 @@ def settings():
             else:
                 print("Cache clearing cancelled")
         elif advanced_settings_answer['advanced_settings'] == 'output cache data':
-            try:
-                with open('data/prod/cache.json', 'r') as cache:
-                    cache_data = json.load(cache)
-                    print("Cache data: ", cache_data)
-            except FileNotFoundError:
+            cache = get_cache()
+            if cache.snapshot() or cache.exists:
+                print("Cache data: ", cache.snapshot())
+            else:
                 print("Cache file not found.")
         elif advanced_settings_answer['advanced_settings'] == 'back':
             settings()
@@ -170,7 +185,7 @@ def settings():
                 print("There is no old playlist to overwrite.")
                 return
         elif override_or_create_new_default['override/create default'] == 'create new default playlist':
-            playlist_manager.create_playlist(sp.me()['id'], default_playlist_name) # create a new playlist with the new name
+            playlist_manager.create_playlist(playlist_manager.user_id(), default_playlist_name) # create a new playlist with the new name
             update_cache_data('default_playlist_name', new_name) # update the cache with the new default playlist name
             print(f"New default playlist created: {new_name}")
 
@@ -178,6 +193,7 @@ def settings():
             global default_playlist_id
             default_playlist_id = playlist_manager.find_user_playlist_id(default_playlist_name) # get the playlist id from the name
             update_cache_data('default_playlist_id', default_playlist_id) # update the cache with the new default playlist id
+            mark_default_playlist_verified() # found by name, so id and name match
         
     elif basic_settings_answer['settings'] == 'change default playlist description':
         new_description = input("Enter the new playlist description: ")
@@ -186,9 +202,10 @@ def settings():
         if default_playlist_id is None:
             print("Cannot update description: Playlist not found")
             return
+        mark_default_playlist_verified() # found by name, so id and name match
 
         playlist_manager.sp.user_playlist_change_details(
-            user=sp.me()['id'],
+            user=playlist_manager.user_id(),
             playlist_id=default_playlist_id,
             name=playlist_manager.sp.playlist(default_playlist_id, fields=['name']), # get the name of the playlist
             public=False,
@@ -240,58 +257,161 @@ def basic_process(playlist_id=None):
         print(f"discovered playlist id input ({playlist_id})")
 
     if is_track: # if a track was selected
-        recommendations = process_track_recommendation(origin, discovery_type, limit=default_limit) # get recommendations based on the track, discovery type and limit -> returns list of strings (song-artist pairs)
-        print(f"🎵 Found {len(recommendations)} recommendations:")
-        for i, rec in enumerate(recommendations, 1):
-            print(f"{i}. {rec}")
-
-        # Create the playlist if not already created
+        # Create the playlist first, so the streamed recommendations can go straight into it
         if playlist_id is None:
-            playlist_manager.create_playlist(sp.me()['id'])
-            playlist_manager.fill_playlist(recommendations) # fill the playlist with the recommendations
-        else:
-            playlist_manager.fill_playlist(recommendations, playlist_id) # fill the playlist with the recommendations
+            playlist_manager.create_playlist(playlist_manager.user_id())
+
+        # get recommendations based on the track, discovery type and limit -> yields track uris, resolved while the AI is still generating
+        track_uris = process_track_recommendation_stream(sp, origin, discovery_type, limit=default_limit)
+        playlist_manager.add_tracks(track_uris, playlist_id) # added in small batches while the rest is still resolving
+
+# (start offset, duration) in seconds per stage of the last streaming recommendation
+last_stage_timings = {}
+
+class StageTimer:
+    """Records when each stage started (relative to the timer) and how long it took"""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+
+    def run(self, stage, func, *args):
+        stage_start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[stage] = (stage_start - self.started, time.perf_counter() - stage_start)
+
+    def mark(self, stage):
+        self.timings[stage] = (time.perf_counter() - self.started, 0.0)
+
+    def report(self):
+        last_stage_timings.clear()
+        last_stage_timings.update(self.timings)
+        print(f"⏱️ Recommendations after {time.perf_counter() - self.started:.2f}s: " + ", ".join(
+            f"{stage} {offset:.2f}s+{duration:.2f}s" for stage, (offset, duration) in sorted(self.timings.items(), key=lambda t: t[1][0])
+        ))
+
+def fetch_origin_attributes(origin, timer):
+    """
+    Get the TheAudioDB attributes and the AI lyric attributes of the origin track.
+    TheAudioDB and Genius are asked at the same time and the lyric analysis starts as soon as
+    the lyrics arrive (while TheAudioDB may still be loading).
+    Returns:
+        tuple: (track_attributes, lyric_attributes)
+    """
+    track_name = str(origin["track_name"])
+    artist_name = str(origin["artist"])
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        audio_db_future = pool.submit(timer.run, "audio_db", get_audio_db_info, artist_name, track_name)
+        lyrics_future = pool.submit(timer.run, "lyrics", get_lyrics_genius, artist_name, track_name)
+        # the analysis only depends on the lyrics, so it doesn't wait for TheAudioDB
+        analysis_future = pool.submit(lambda: timer.run("lyric_analysis", get_lyric_attributes_ai, lyrics_future.result()))
+        return audio_db_future.result(), analysis_future.result()
 
-def process_track_recommendation(origin, discovery_type, limit):
+MAX_RECOMMENDATION_ROUNDS = 4      # AI requests per recommendation run, the first one included
+RECOMMENDATION_TIME_BUDGET = 90    # seconds, no new round is started after that
+USE_LOCAL_SHORTLIST = True         # let the model re-rank local catalog candidates instead of inventing everything
+
+# rounds, resolved, unresolved and duplicate recommendations of the last run of process_track_recommendation_stream
+last_recommendation_stats = {}
+
+def local_shortlist(origin, track_attributes, lyric_attributes, k=SHORTLIST_SIZE):
+    """
+    Catalog tracks that match the origin's attributes (see src/database/candidates.py), an empty list
+    if the catalog can't be used (e.g. no songs.db yet)
+    """
+    try:
+        index = get_candidate_index()
+        seed = index.seed(str(origin["track_name"]), str(origin["artist"]), track_attributes, lyric_attributes)
+        return index.candidates(seed, k)
+    except Exception as e:
+        print(f"⚠️ No local candidates: {e}")
+        return []
+
+def process_track_recommendation_stream(sp, origin, discovery_type, limit, max_rounds=MAX_RECOMMENDATION_ROUNDS, time_budget=RECOMMENDATION_TIME_BUDGET, shortlist=USE_LOCAL_SHORTLIST):
     """
-    Process a track and get AI recommendations based on its attributes
+    Get exactly limit recommendations that exist on Spotify, resolved while the model is still generating.
+    Every streamed recommendation is searched on Spotify as soon as it is complete. Recommendations that
+    can't be found or are duplicates (same title/artist or same track) are counted as missing and the model
+    is asked again for just the missing count, with everything recommended so far excluded.
+    Stops when limit tracks are resolved, after max_rounds requests or when time_budget is used up.
     Args:
+        sp: Spotify client
         origin (dict): Track information containing name and artist
         discovery_type (str): Type of discovery/recommendation wanted
-        limit (int): Number of recommendations to return
-    Returns:
-        list: List of recommended tracks
+        limit (int): Number of tracks to return
+        max_rounds (int): max. AI requests
+        time_budget (float): seconds after which no new request is started
+        shortlist (bool): pass matching tracks of the local catalog to the model to re-rank (they resolve without a search)
+    Yields:
+        str: track uris, in the order the model recommended them
     """
     print(f"Processing track: {origin}")
     print(f"Discovery type: {discovery_type}")
-    # Extract track name and artist from the formatted string
-    track_name = str(origin["track_name"])
-    artist_name = str(origin["artist"])
+    timer = StageTimer()
+    track_attributes, lyric_attributes = fetch_origin_attributes(origin, timer)
+    candidates = timer.run("shortlist", local_shortlist, origin, track_attributes, lyric_attributes) if shortlist else []
 
-    # print(f"Processing track: '{track_name}' by '{artist_name}'")
-    
-    # Get additional track information from TheAudioDB
-    track_attributes = get_audio_db_info(track_name, artist_name)
-    
-    # Get lyric-attributes
-    lyrics = get_lyrics_genius(artist_name, track_name)
-    lyric_attributes = get_lyric_attributes_ai(lyrics) 
-    # print(lyric_attributes)
+    print("🎵 Recommendations:")
+    recommended = []  # everything the model recommended so far, excluded from the next rounds
+    known = set()
+    uris = set()
+    stats = {"rounds": 0, "resolved": 0, "unresolved": 0, "duplicates": 0}
+    stats_lock = threading.Lock()  # fresh() runs on the resolver's feeder thread
 
-    # TODO: filter lyrics attributes out of json, so theres not as much irrelevant info passed onto gemini
-    # ^ may be redundant, if database is used, instead of ai
+    def count_duplicate():
+        with stats_lock:
+            stats["duplicates"] += 1
 
-    # Get AI recommendations
-    ai_response = ask_ai(discovery_type, origin, limit, track_attributes, lyric_attributes)
-    
-    # Convert AI response to list of recommendations
-    recommendations = string_to_list(str(ai_response))
-    
+    def fresh(recommendations, missing):
+        """Drop recommendations that were already given, at most missing new ones per round"""
+        new = 0
+        for rec in recommendations:
+            if rec.key() in known:
+                count_duplicate()
+                continue
+            if new >= missing:
+                continue
+            known.add(rec.key())
+            recommended.append(rec)
+            new += 1
+            yield rec
+
+    while stats["resolved"] < limit:
+        if stats["rounds"] >= max_rounds or time.perf_counter() - timer.started > time_budget:
+            break
+        stats["rounds"] += 1
+        missing = limit - stats["resolved"]
+        if stats["rounds"] > 1:
+            print(f"🔁 {missing} recommendation(s) missing, asking the AI again (round {stats['rounds']})...")
+        round_start = time.perf_counter()
+        chunks = ask_ai_stream(discovery_type, origin, missing, track_attributes, lyric_attributes, exclude=list(recommended),
+                               candidates=[c for c in candidates if c.key() not in known])
+        for rec, uri in resolve_results(sp, fresh(iter_recommendations(chunks), missing)):
+            if uri is None:
+                stats["unresolved"] += 1
+                continue
+            if uri in uris:
+                count_duplicate()
+                continue
+            uris.add(uri)
+            stats["resolved"] += 1
+            if stats["resolved"] == 1:
+                timer.mark("first_track")
+            print(f"{stats['resolved']}. {rec}")
+            yield uri
+            if stats["resolved"] >= limit:
+                break
+        timer.timings[f"round_{stats['rounds']}"] = (round_start - timer.started, time.perf_counter() - round_start)
+
+    last_recommendation_stats.clear()
+    last_recommendation_stats.update(stats)
+    print(f"🔁 {stats['resolved']}/{limit} tracks in {stats['rounds']} round(s), "
+          f"{stats['unresolved']} not found on Spotify, {stats['duplicates']} duplicates")
     # Verify recommendation count
-    if len(recommendations) != limit:
-        print(f"⚠️ PSA: Got {len(recommendations)} recommendations instead of requested {limit}")
-    
-    return recommendations
+    if stats["resolved"] != limit:
+        print(f"⚠️ PSA: Got {stats['resolved']} tracks instead of requested {limit} (parse failure rate {parse_failure_rate():.0%})")
+    timer.report()
 
 
 if __name__ == "__main__":
@@ -301,9 +421,8 @@ if __name__ == "__main__":
     global playlist_manager
     global sp
 
-    sp = initialize_spotify_client()
-    model = initialize_gemini_client()
-    initialize_genius_client()
+    # clients are created on first use (see env.get_client), nothing is authenticated before it's needed
+    sp = LazyClient("spotify")
 
     default_playlist_name, default_playlist_id, default_limit = load_cache_data() # load the cache data to get the default playlist name and id
     playlist_manager = PlaylistManager(sp)
@@ -0,0 +1,150 @@
+import threading
+import time
+
+PAGE_SIZE = 50            # max. playlists per current_user_playlists page
+REFRESH_INTERVAL = 5 * 60  # seconds the index is used without asking Spotify again
+
+
+class PlaylistIndex:
+    """
+    All playlists in the user's library (every page), indexed by id and by name, plus the
+    current user for the session. Refreshes page through the library again but only rebuild
+    entries whose snapshot id changed. Safe to share between threads.
+    """
+    def __init__(self, sp, refresh_interval=REFRESH_INTERVAL):
+        self.sp = sp
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.playlists = {}  # id -> playlist dict (id, name, owner_id, snapshot_id, description, public, collaborative)
+        self.by_name = {}    # name -> list of ids, in library order
+        self.loaded_at = None
+        self._me = None
+        self.changed = 0     # entries added/updated by the last refresh
+
+    def me(self):
+        """The current user (sp.me()), asked once per session"""
+        with self.lock:
+            if self._me is None:
+                self._me = self.sp.me()
+            return self._me
+
+    def user_id(self):
+        return self.me()['id']
+
+    def _entry(self, item):
+        return {
+            "id": item['id'],
+            "name": item['name'],
+            "owner_id": (item.get('owner') or {}).get('id'),
+            "snapshot_id": item.get('snapshot_id'),
+            "description": item.get('description'),
+            "public": item.get('public'),
+            "collaborative": item.get('collaborative'),
+        }
+
+    def _rebuild_names(self):
+        self.by_name = {}
+        for playlist in self.playlists.values():
+            self.by_name.setdefault(playlist['name'], []).append(playlist['id'])
+
+    def refresh(self, force=False):
+        """
+        Page through the whole library, unless the index is younger than refresh_interval
+        Returns:
+            int: number of added or changed playlists
+        """
+        with self.lock:
+            if not force and self.loaded_at and time.time() - self.loaded_at < self.refresh_interval:
+                return 0
+            playlists = {}
+            changed = 0
+            page = self.sp.current_user_playlists(limit=PAGE_SIZE)
+            while page:
+                for item in page['items']:
+                    if not item:
+                        continue
+                    known = self.playlists.get(item['id'])
+                    if known and known['snapshot_id'] == item.get('snapshot_id') and known['name'] == item['name']:
+                        playlists[item['id']] = known  # unchanged since the last refresh
+                    else:
+                        playlists[item['id']] = self._entry(item)
+                        changed += 1
+                page = self.sp.next(page) if page.get('next') else None
+            self.playlists = playlists
+            self._rebuild_names()
+            self.loaded_at = time.time()
+            self.changed = changed
+            return changed
+
+    def all(self):
+        """
+        Returns:
+            list: every playlist in the library, in library order
+        """
+        self.refresh()
+        with self.lock:
+            return list(self.playlists.values())
+
+    def get(self, playlist_id):
+        self.refresh()
+        with self.lock:
+            return self.playlists.get(playlist_id)
+
+    def find(self, name, owned=True):
+        """
+        Find a playlist by name
+        Args:
+            name (str): playlist name
+            owned (bool): only playlists owned by the current user
+        Returns:
+            dict: the first matching playlist, None if there is none
+        """
+        self.refresh()
+        user_id = self.user_id() if owned else None
+        with self.lock:
+            for playlist_id in self.by_name.get(name, []):
+                playlist = self.playlists[playlist_id]
+                if not owned or playlist['owner_id'] == user_id:
+                    return playlist
+        return None
+
+    def add(self, item):
+        """Add a playlist that was just created (the Spotify playlist object), without a refresh"""
+        with self.lock:
+            self.playlists[item['id']] = self._entry(item)
+            self._rebuild_names()
+
+    def update(self, playlist_id, **changes):
+        """Apply changes made through the API (e.g. name=...) to the index, without a refresh"""
+        with self.lock:
+            if playlist_id in self.playlists:
+                self.playlists[playlist_id].update(changes)
+                self._rebuild_names()
+
+    def invalidate(self):
+        """The next lookup pages through the library again"""
+        with self.lock:
+            self.loaded_at = None
+
+    def reset(self):
+        """Forget everything, e.g. after switching the Spotify account"""
+        with self.lock:
+            self.playlists = {}
+            self.by_name = {}
+            self.loaded_at = None
+            self._me = None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_playlist_index(sp):
+    """
+    The process wide index of the user's playlists, loaded on first lookup
+    (all Spotify clients of the app are the same client, so the first one given is kept)
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PlaylistIndex(sp)
+        return _index
@@ -0,0 +1,163 @@
+import json
+import threading
+from typing import NamedTuple
+
+# What the model has to answer with, the prompt shows it and the parser checks every entry against it
+RECOMMENDATION_FORMAT = '[{"title": "<song title>", "artist": "<main artist>"}, ...]'
+ERROR_FORMAT = '{"error": "<specific error message>"}'
+
+
+class Recommendation(NamedTuple):
+    """One recommended track, unpacks like the old (song, artist) pairs"""
+    title: str
+    artist: str
+
+    def __str__(self):
+        return f"{self.title} - {self.artist}"
+
+    def key(self):
+        """Case insensitive identity, used to spot duplicates"""
+        return (self.title.casefold(), self.artist.casefold())
+
+
+# counters over all parsed responses of this process, parsers run on several resolver threads
+parse_stats = {"responses": 0, "entries": 0, "invalid_entries": 0, "failed_responses": 0}
+_stats_lock = threading.Lock()
+
+def count(**increments):
+    """Add to the parse_stats counters, e.g. count(entries=1)"""
+    with _stats_lock:
+        for name, increment in increments.items():
+            parse_stats[name] += increment
+
+def parse_failure_rate():
+    """Share of entries (or whole responses without any entry) that could not be used"""
+    with _stats_lock:
+        total = parse_stats["entries"] + parse_stats["failed_responses"]
+        failed = parse_stats["invalid_entries"] + parse_stats["failed_responses"]
+    return failed / total if total else 0.0
+
+
+def validate_entry(entry):
+    """
+    Returns:
+        Recommendation: if entry is an object with a non-empty title and artist string, else None
+    """
+    if not isinstance(entry, dict):
+        return None
+    title, artist = entry.get("title"), entry.get("artist")
+    if not isinstance(title, str) or not isinstance(artist, str):
+        return None
+    title, artist = ' '.join(title.split()), ' '.join(artist.split())
+    if not title or not artist:
+        return None
+    return Recommendation(title, artist)
+
+
+class RecommendationParser:
+    """
+    Incremental parser for a JSON array of {"title", "artist"} objects, also when the model wraps it
+    in an object ({"recommendations": [...]}).
+    feed() can be called with any pieces of the response (e.g. a token stream) and returns every
+    entry that is complete so far, so nothing waits for the closing bracket.
+    """
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0          # next character to scan
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.entry_start = None
+        self.started = False  # saw the opening '[' or '{'
+        self.array_depth = None  # depth inside the array of entries: 1, or 2 if it's wrapped in an object
+        self.is_error = False
+        self.valid = 0
+        self.invalid = 0
+        count(responses=1)
+
+    def feed(self, chunk):
+        """
+        Returns:
+            list[Recommendation]: entries completed by this chunk
+        """
+        self.buffer += chunk
+        found = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if not self.started:
+                if char in '[{':  # skip code fences or text in front of the JSON
+                    self.started = True
+                    self.is_error = char == '{'  # until it turns out to wrap the array
+                    self.array_depth = 1 if char == '[' else None
+                    self.depth = 1
+                self.pos += 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+                if self.array_depth is None and char == '[' and self.depth == 2:  # {"recommendations": [
+                    self.array_depth = 2
+                    self.is_error = False
+                elif self.array_depth is not None and self.depth == self.array_depth + 1:
+                    self.entry_start = self.pos
+            elif char in ']}':
+                self.depth -= 1
+                if self.depth == self.array_depth and self.entry_start is not None:
+                    found.extend(self._entry(self.buffer[self.entry_start:self.pos + 1]))
+                    self.entry_start = None
+            self.pos += 1
+        return found
+
+    def _entry(self, text):
+        count(entries=1)
+        try:
+            recommendation = validate_entry(json.loads(text))
+        except json.JSONDecodeError:
+            recommendation = None
+        if recommendation is None:
+            self.invalid += 1
+            count(invalid_entries=1)
+            print(f"⚠️ Skipping invalid recommendation: {text}")
+            return []
+        self.valid += 1
+        return [recommendation]
+
+    def close(self):
+        """Call after the last chunk, reports error answers and responses without any entry"""
+        if self.is_error:
+            try:
+                print("AI Error: ", json.loads(self.buffer[self.buffer.index('{'):].replace('```', '')).get('error'))
+            except (ValueError, AttributeError):
+                print("AI Error: ", self.buffer.strip())
+        if self.valid + self.invalid == 0:
+            count(failed_responses=1)
+
+
+def iter_recommendations(chunks):
+    """
+    Parse a (streamed) AI response
+    Args:
+        chunks (iterable): pieces of the response text as they arrive
+    Yields:
+        Recommendation: every valid entry as soon as it is complete
+    """
+    parser = RecommendationParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
+
+def parse_recommendations(text):
+    """
+    Parse a complete AI response
+    Returns:
+        list[Recommendation]: valid entries, in order
+    """
+    return list(iter_recommendations([text]))
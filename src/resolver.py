@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+import requests
+from src.http_client import RateLimiter
+from src.database.resolution_index import get_resolution_index
+
+MAX_CONCURRENT_SEARCHES = 8  # parallel Spotify searches
+SEARCHES_PER_SECOND = 10     # stays well below Spotify's rolling rate limit
+PLAYLIST_ADD_LIMIT = 100     # max. items per playlist_add_items call
+PLAYLIST_ADD_LINGER = 1.0    # seconds a resolved track waits for more before it's added to the playlist
+
+search_limiter = RateLimiter(SEARCHES_PER_SECOND, burst=MAX_CONCURRENT_SEARCHES)
+
+
+def chunked(items, size):
+    """Yield successive lists of at most size items"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def batched_stream(items, size, linger):
+    """
+    Group a stream that is still arriving into lists: a list is given out when it is full or when its
+    first item has waited linger seconds (the stream is read on another thread, so a slow stream can't hold it back)
+    Args:
+        items (iterable): e.g. the track uris of a streamed recommendation
+        size (int): max. items per list
+        linger (float): max. seconds an item waits for others
+    Yields:
+        list: at least one item each, in stream order
+    """
+    arrived = queue.Queue()
+
+    def read():
+        error = None
+        try:
+            for item in items:
+                arrived.put(item)
+        except Exception as e:
+            error = e
+        arrived.put(_End(error))
+
+    threading.Thread(target=read, name="batch-read", daemon=True).start()
+    batch, deadline = [], None
+    while True:
+        try:
+            item = arrived.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+        except queue.Empty:  # the first item waited long enough
+            yield batch
+            batch, deadline = [], None
+            continue
+        if isinstance(item, _End):
+            if batch:
+                yield batch
+            if item.error:
+                raise item.error
+            return
+        batch.append(item)
+        if deadline is None:
+            deadline = time.monotonic() + linger
+        if len(batch) >= size:
+            yield batch
+            batch, deadline = [], None
+
+
+def search_track(sp, name, artist):
+    """
+    Find one track, in the local resolution index first and on Spotify if it isn't known yet
+    Returns:
+        str: track uri, None if not found or the search failed
+    """
+    index = get_resolution_index()
+    known = index.lookup(name, artist)
+    if known:
+        print(f"✅ Found track: {name} by {artist} (cached)")
+        return known["uri"]
+
+    search_limiter.acquire()
+    # 429/5xx are retried with backoff by the shared session (see http_client)
+    try:
+        result = sp.search(q=f'track:{name} artist:{artist}', type='track', limit=1)
+        if result['tracks']['items']:
+            item = result['tracks']['items'][0]
+            index.add_search_result(name, artist, item)
+            print(f"✅ Found track: {name} by {artist}")
+            return item['uri']
+        print(f"❌ Could not find track: {name} by {artist}")
+    except requests.exceptions.Timeout:
+        print(f"⚠️ Timeout error: {name} by {artist}")
+    except Exception as e:
+        print(f"❌ Error processing track: {e}")
+    return None
+
+
+class _End:
+    """Marks the end of a stream that is read on another thread, with the error that ended it"""
+    def __init__(self, error=None):
+        self.error = error
+
+
+def resolve_results(sp, pairs, max_workers=MAX_CONCURRENT_SEARCHES):
+    """
+    Resolve (song, artist) pairs to Spotify uris with concurrent searches, while the pairs are still arriving.
+    Every pair is searched as soon as it comes in, so e.g. a streamed AI response and the searches overlap.
+    The pairs are read on a feeder thread, a finished search is given out right away, not only when the next pair arrives.
+    Identical pairs are only searched once.
+    Args:
+        sp: Spotify client
+        pairs (iterable): (song, artist) pairs or Recommendation records, may be a generator
+        max_workers (int): max. searches running at the same time
+    Yields:
+        tuple: (pair, uri) in the order of the pairs (as soon as all earlier ones are resolved), uri is None if not found
+    """
+    seen_pairs = set()
+    submitted = queue.Queue()  # (pair, future) in the order of the pairs, then _End
+    stop = threading.Event()   # the caller stopped early, stop reading pairs
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def feed():
+        error = None
+        try:
+            for pair in pairs:
+                if stop.is_set():
+                    break
+                name, artist = pair
+                key = (name.casefold(), artist.casefold())
+                if key in seen_pairs:
+                    continue
+                seen_pairs.add(key)
+                submitted.put((pair, pool.submit(search_track, sp, name, artist)))
+        except Exception as e:  # e.g. the AI stream broke, raised to the caller after the finished searches
+            error = e
+        submitted.put(_End(error))
+
+    threading.Thread(target=feed, name="resolver-feed", daemon=True).start()
+    try:
+        while True:
+            item = submitted.get()
+            if isinstance(item, _End):
+                if item.error and not stop.is_set():
+                    raise item.error
+                return
+            pair, future = item
+            yield pair, future.result()
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)  # searches nobody waits for anymore are dropped
+
+def resolve_stream(sp, pairs, max_workers=MAX_CONCURRENT_SEARCHES):
+    """
+    Resolve (song, artist) pairs to Spotify uris, see resolve_results.
+    Tracks that resolve to the same uri are only returned once.
+    Yields:
+        str: track uris in the order of the pairs, unresolvable pairs left out
+    """
+    seen_uris = set()
+    for _, uri in resolve_results(sp, pairs, max_workers):
+        if uri and uri not in seen_uris:
+            seen_uris.add(uri)
+            yield uri
+
+def resolve_tracks(sp, pairs, max_workers=MAX_CONCURRENT_SEARCHES):
+    """
+    Resolve many (song, artist) pairs to Spotify uris with concurrent searches, see resolve_stream
+    Returns:
+        list: track uris in the order of the pairs, unresolvable pairs left out
+    """
+    return list(resolve_stream(sp, pairs, max_workers))
+
+
+def add_to_playlist(sp, playlist_id, uris):
+    """Add any number of tracks to a playlist, in API sized batches"""
+    for batch in chunked(uris, PLAYLIST_ADD_LIMIT):
+        sp.playlist_add_items(playlist_id, batch)
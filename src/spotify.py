@@ -1,5 +1,6 @@
-from src.env import initialize_spotify_client
-import requests
+from src.env import LazyClient
+from src.resolver import add_to_playlist, batched_stream, PLAYLIST_ADD_LIMIT, PLAYLIST_ADD_LINGER
+from src.playlist_index import get_playlist_index
 import inquirer
 import datetime
 # from audio_db import get_audio_db_info
@@ -7,13 +8,18 @@ import datetime
 global is_track
 is_track = False
 global sp
-sp = initialize_spotify_client()
+sp = LazyClient("spotify")  # created on first use
 default_limit = 10
 
 class PlaylistManager:
     def __init__(self, sp):
         self.sp = sp
         self.playlist = None
+        self.index = get_playlist_index(sp)  # all playlists of the library + the current user, loaded on first use
+
+    def user_id(self):
+        """Id of the current user (sp.me() is only asked once per session)"""
+        return self.index.user_id()
 
     def create_playlist(self, username, playlist_name=None):
         # playlist_description = PlaylistManager.get_playlist_description(discovery_type, origin_name, origin_type)
@@ -27,6 +33,7 @@ class PlaylistManager:
             collaborative=False,
             # description=playlist_description
         )
+        self.index.add(self.playlist)
 
     def get_playlist_cover_image(playlist_id):
         # TODO: get_playlist_cover_image
@@ -59,50 +66,47 @@ class PlaylistManager:
         pass
 
     def change_playlist_name(self, old_name, new_name, is_default_playlist=False): # no need for is_default_playlist here, but maybe later
-        from cache_manager import update_cache_data, load_cache_data
+        from src.cache_manager import update_cache_data, get_cache
 
         # need to update cache, if default_playlist_name is changed
         if is_default_playlist:
             print("Changing the default playlist name...")    
             global default_playlist_name
-            default_playlist_name, *_ = load_cache_data()
+            default_playlist_name = get_cache().default_playlist_name
             if old_name == default_playlist_name:
                 default_playlist_name = new_name
                 # Update the cache with the new default playlist name
                 update_cache_data('default_playlist_name', new_name)
                 print(f"! Warning ! Default playlist name changed from '{old_name}' to '{new_name}'")
 
-        # Get all user playlists and find the one to rename
-        all_playlists = sp.current_user_playlists()
-        for item in all_playlists['items']:
-            if item['name'] == old_name:
-                # Rename the playlist
-                sp.user_playlist_change_details(
-                    user=sp.me()['id'],
-                    playlist_id=item['id'],
-                    name=new_name,
-                    public=False,
-                    collaborative=False,
-                    description=item['description']
-                )
-                if is_default_playlist:
-                    print(f"Default playlist name changed from '{old_name}' to '{new_name}'")
-                else:
-                    print(f"Renamed playlist '{old_name}' to '{new_name}'")
-                return
+        # Find the playlist to rename in the playlist index (whole library, not just the first page)
+        item = self.index.find(old_name)
+        if item:
+            # Rename the playlist
+            self.sp.user_playlist_change_details(
+                user=self.user_id(),
+                playlist_id=item['id'],
+                name=new_name,
+                public=False,
+                collaborative=False,
+                description=item['description']
+            )
+            self.index.update(item['id'], name=new_name)
+            if is_default_playlist:
+                print(f"Default playlist name changed from '{old_name}' to '{new_name}'")
+            else:
+                print(f"Renamed playlist '{old_name}' to '{new_name}'")
+            return
 
         print(f"Playlist '{old_name}' not found. No changes made.")
 
     def find_user_playlist_id(self, playlist_name):
         """Find a specific playlist ID owned by the current user"""
         try:
-            # Get all user playlists
-            playlists = self.sp.current_user_playlists()
-            
-            # Search through user's playlists
-            for playlist in playlists['items']:
-                if playlist['name'] == playlist_name and playlist['owner']['id'] == self.sp.me()['id']:
-                    return playlist['id']
+            # Look the name up in the playlist index (all pages of the library, owned by the current user)
+            playlist = self.index.find(playlist_name)
+            if playlist:
+                return playlist['id']
             
             print(f"❌ Playlist '{playlist_name}' not found in your library")
             return None
@@ -110,53 +114,22 @@ class PlaylistManager:
             print(f"❌ Error finding playlist: {e}")
             return None
 
-    def fill_playlist(self, recommendations, playlist_id=None):
-        # get recommended track uris
-        recommended_track_ids = []
-        max_retries = 3  # Number of retries for each track
-        for rec in recommendations:
-            # Split the string into name and artist
-            # TODO: not very redundant, but works for now
-            name, artist = [part.strip() for part in rec.rsplit('-', 1)]
-            # Get track info from TheAudioDB
-            for attempt in range(max_retries):
-                try:
-                    result = self.sp.search(
-                        q=f'track:{name} artist:{artist}',
-                        type='track',
-                        limit=1,
-                    )
-                    if result['tracks']['items']:
-                        track_uri = result['tracks']['items'][0]['uri']
-                        recommended_track_ids.append(track_uri)
-                        print(f"✅ Found track: {name} by {artist}")
-                        break  # Success, exit retry loop
-                    else:
-                        print(f"❌ Could not find track: {name} by {artist}")
-                        break  # No results, no need to retry
-                        
-                except requests.exceptions.Timeout:
-                    if attempt == max_retries - 1:
-                        print(f"⚠️ Timeout error after {max_retries} attempts: {name} by {artist}")
-                    else:
-                        print(f"⚠️ Attempt {attempt + 1} timed out, retrying...")
-                        continue
-                        
-                except Exception as e:
-                    print(f"❌ Error processing track: {e}")
-                    break
-        if recommended_track_ids:
-            # get the playlist id if given
-            if playlist_id:
-                self.sp.playlist_add_items(playlist_id, recommended_track_ids)
-            else:
-                # Add the recommended tracks to the playlist
-                self.sp.playlist_add_items(self.playlist['id'], recommended_track_ids)
+    def add_tracks(self, track_uris, playlist_id=None):
+        """
+        Add already resolved tracks to a playlist
+        Args:
+            track_uris (iterable): track uris, may be a stream that is still arriving: tracks are added in batches
+                while it arrives (once PLAYLIST_ADD_LIMIT are together or PLAYLIST_ADD_LINGER seconds passed)
+            playlist_id (str, optional): target playlist, the one created with create_playlist if not given
+        """
+        for batch in batched_stream(track_uris, PLAYLIST_ADD_LIMIT, PLAYLIST_ADD_LINGER):
+            # get the playlist id if given, otherwise add to the playlist created before
+            add_to_playlist(self.sp, playlist_id or self.playlist['id'], batch)
 
 
 def add_to_queue():
-    from utils import id_to_element_name, element_name_to_id
-    from main import process_track_recommendation
+    from utils import id_to_element_name
+    from main import process_track_recommendation_stream
     print("Adding to queue... \n")
     global discovery_type
     discovery_type = get_discovery_type() # auf was soll sich suche beziehen (mood/genre ehatever) -> returns string
@@ -164,16 +137,11 @@ def add_to_queue():
     origin_id, is_track = from_where() # von wo soll gesucht werden (playlist/song/liked songs/album/artist) -> returns id
     origin = id_to_element_name(element_id=origin_id, type="track") # convert id to name (for AI input) -> returns string
 
-    recommendations = process_track_recommendation(origin, discovery_type, limit=default_limit) # get recommendations based on the track, discovery type and limit -> returns list of strings (song-artist pairs)
-    
-    print(f"🎵 Found {len(recommendations)} recommendations:")
-    for i, rec in enumerate(recommendations, 1):
-        print(f"{i}. {rec}")
-        track, artist = [part.strip() for part in rec.rsplit('-', 1)]
-        track_id = element_name_to_id(track.strip(), "track") # get the track id from the name
+    # yields track uris while the AI is still generating (resolved through the local index first,
+    # unknown tracks are searched on Spotify, missing ones are asked for again), each one is queued right away
+    for track_uri in process_track_recommendation_stream(sp, origin, discovery_type, limit=default_limit):
         try:
-            # print(f"Adding {track} by {artist} to queue... (id: {track_id})")
-            sp.add_to_queue(track_id, None) # add the track to the queue device_id=None (None = current device) see docs
+            sp.add_to_queue(track_uri, None) # add the track to the queue device_id=None (None = current device) see docs
         except Exception as e:
             print(f"Error adding to queue: {e}")
             continue
@@ -221,9 +189,9 @@ def get_discovery_type():
 
 def from_where():
     is_track = False
-    # Get all user playlists and create a list of choices
-    all_playlists = sp.current_user_playlists()
-    playlist_choices = [item['name'] for item in all_playlists['items']]
+    # Get all user playlists (every page, from the playlist index) and create a list of choices
+    all_playlists = get_playlist_index(sp).all()
+    playlist_choices = [item['name'] for item in all_playlists]
     playlist_choices.append('None - Search all songs')  # Add option to search without playlist context
 
     # Create interactive prompts for user input
@@ -254,7 +222,7 @@ def from_where():
         chosen_playlist = inquirer.prompt(playlist_question)
         print(f"Selected playlist: {chosen_playlist['playlist']}")
         # Find and return the playlist ID
-        for item in all_playlists['items']:
+        for item in all_playlists:
             if item['name'] == chosen_playlist['playlist']:
                 print(f"Found playlist: {item['name']} with ID: {item['id']}")
                 global playlist_id
@@ -1,21 +1,7 @@
-from src.env import initialize_spotify_client
+from src.env import LazyClient
 
 global sp
-sp = initialize_spotify_client()  # Assuming this function initializes the Spotify client
-
-def string_to_list(string):
-    """
-    Convert a comma-separated string to a list of song-artist pairs
-    Returns: List of strings, each formatted as 'song-artist'
-    """
-    # Split by comma and clean each entry
-    items = [item.strip() for item in string.split(',')]
-    
-    # Remove any empty strings and clean newlines
-    cleaned_items = [item.replace('\n', '') for item in items if item]
-    
-    # print("Converted list: ", cleaned_items)
-    return cleaned_items
+sp = LazyClient("spotify")  # the shared Spotify client, created on first use
 
 def id_to_element_name(element_id, type=None, type_given=True):
     """
@@ -94,7 +80,8 @@ def element_name_to_id(element_name, element_type):
     """
     try: 
         item = sp.search(q=element_name, type=element_type)
-        return item['artists']['items'][0]['id']
+        items = item[f"{element_type}s"]['items']  # results are under "tracks", "playlists", "albums" or "artists"
+        return items[0]['id'] if items and items[0] else None
     except Exception as e:
         print(f"Error searching for element: {e}")
         return None
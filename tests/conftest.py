@@ -0,0 +1,41 @@
+import os
+import sys
+import pytest
+
+# the modules import each other as src.*, so the repository root has to be importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_track():
+    """Factory for the track dicts the importer hands to db.write_batch"""
+    def make(track_id, title=None, featured=(), album_name="Album"):
+        return {"track_id": track_id, "title": title or f"Song {track_id}", "main_artist": "Main", "main_artist_id": None,
+                "featured_artists": list(featured), "album_name": album_name, "album_id": "a1"}
+    return make
+
+@pytest.fixture
+def make_features():
+    """Factory for the audio feature dicts the importer hands to db.write_batch"""
+    def make(track_id, top_genre="pop", other_genres="", topic="love", language="en", year="2020", featured=""):
+        return {"track_id": track_id, "release_date": year, "main_artist": "Main", "featured_artists": featured,
+                "language": language, "song_length": 200, "top_genre": top_genre, "other_genres": other_genres,
+                "genre_finished": True, "language_level": "standard", "topic": topic}
+    return make
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "songs.db")
+
+@pytest.fixture
+def database(db_path):
+    """A fresh, migrated songs.db"""
+    from src.database.track_attributes import db
+    return db(db_path)
+
+@pytest.fixture
+def no_lyric_attributes(monkeypatch):
+    """Feature matrix rows without the AI lyric attributes (no lyrics store or lyric attribute cache needed)"""
+    from src.database import feature_matrix
+    monkeypatch.setattr(feature_matrix, "get_lyric_attribute_cache", lambda schema: None)
+    monkeypatch.setattr(feature_matrix.FeatureMatrix, "_lyric_attributes", staticmethod(lambda track_id, lyric_cache: None))
@@ -0,0 +1,26 @@
+from src.database import feature_matrix
+from src.database.candidates import CandidateIndex
+from src.database.feature_matrix import FeatureMatrix
+
+
+def test_matrix_neighbours_join_the_candidates(tmp_path, db_path, database, make_track, make_features, no_lyric_attributes):
+    database.write_batch(
+        [make_track("seed", "Seed"), make_track("same", "Same Genre"), make_track("close", "Close"), make_track("far", "Far")],
+        [make_features("seed", "rap", topic="love", language="de", year="2001"),
+         make_features("same", "rap", topic="", language="en", year="1960"),
+         make_features("close", "trap", topic="love", language="de", year="2001"),
+         make_features("far", "jazz", topic="", language="fr", year="1955")])
+    matrix = FeatureMatrix(db_path, str(tmp_path / "features.npy"))
+    matrix.add_tracks(["seed", "same", "close", "far"])
+
+    index = CandidateIndex(db_path, feature_matrix=matrix)
+    seed = index.stored_seed("seed")
+    ranked = [c.track_id for c in index.candidates(seed, k=3)]
+    assert ranked == ["same", "close", "far"]  # "far" shares no genre, topic or language, only the matrix finds it
+    assert "far" not in [c.track_id for c in index.candidates(dict(seed, track_id=None), k=3)]
+    assert [c.track_id for c in index.candidates(seed, k=3, exclude={"same"})] == ["close", "far"]
+
+def test_year_scale_is_fixed(tmp_path, db_path, database, make_track, make_features, no_lyric_attributes):
+    database.write_batch([make_track("t1")], [make_features("t1", year="1990")])
+    features = FeatureMatrix(db_path, str(tmp_path / "features.npy")).track_features(["t1"])["t1"]
+    assert features["year"] == (1990 - feature_matrix.YEAR_MIN) / (feature_matrix.YEAR_MAX - feature_matrix.YEAR_MIN)
@@ -0,0 +1,24 @@
+from src.database import discography
+from src.database.discography import DiscographyCache, crawl_discography
+
+
+class FakeSpotify:
+    """artist_albums lists a1 and a2, sp.albums answers a2 relinked as a2-market"""
+    def artist_albums(self, artist_id, include_groups=None, limit=None, offset=0):
+        return {"total": 2, "items": [{"id": "a1", "album_group": "album"}, {"id": "a2", "album_group": "single"}]}
+
+    def albums(self, ids):
+        return {"albums": [self._album(album_id) for album_id in ids]}
+
+    @staticmethod
+    def _album(album_id):
+        track = {"artists": [{"id": "artist"}]}
+        return {"id": "a2-market" if album_id == "a2" else album_id, "name": f"Name {album_id}", "release_date": "2020",
+                "total_tracks": 1, "tracks": {"items": [track], "next": None}}
+
+
+def test_relinked_album_is_kept_under_its_listed_id(database, db_path, monkeypatch):
+    monkeypatch.setattr(discography, "_cache", DiscographyCache(db_path))
+    result = crawl_discography(FakeSpotify(), "artist")
+    assert result == {"album_names": ["Name a1"], "number_of_albums": 1, "number_of_tracks": 2}
+    assert discography.get_discography_cache().album_ids("artist") == {"a1", "a2"}
@@ -0,0 +1,18 @@
+import numpy as np
+from src.database.feature_matrix import FeatureMatrix
+
+
+def test_instances_see_each_others_rows(tmp_path, db_path, database, make_track, make_features, no_lyric_attributes):
+    database.write_batch([make_track(t) for t in "abc"],
+                         [make_features("a", "rap"), make_features("b", "jazz", topic="war"), make_features("c", "rap")])
+    matrix_path = str(tmp_path / "features.npy")
+    first, second = FeatureMatrix(db_path, matrix_path), FeatureMatrix(db_path, matrix_path)
+    first.add_tracks(["a"])
+    second.add_tracks(["b"])  # the file isn't replaced, only the layout in songs.db tells about the new row
+    b_row = np.array(first.matrix[second.rows["b"]])
+
+    assert [track_id for track_id, _ in second.similar("a")] == ["b"]
+    first.add_tracks(["c"])  # must not reuse b's row
+    assert len({first.rows["a"], first.rows["b"], first.rows["c"]}) == 3
+    assert np.array_equal(first.matrix[first.rows["b"]], b_row)
+    assert [track_id for track_id, _ in second.similar("a")] == ["c", "b"]
@@ -0,0 +1,80 @@
+"""
+Ranking of Genius search hits against saved search responses (data/fixtures/genius_search.json).
+Run as a script to print the benchmark, or to add a case from a live search:
+    python -m tests.test_genius_ranking
+    python -m tests.test_genius_ranking record "<artist>" "<title>" <expected genius id or null>
+"""
+import json
+import sys
+import pytest
+from src.genius import best_hit
+
+FIXTURE_PATH = 'data/fixtures/genius_search.json'
+
+
+def load_cases(fixture_path=FIXTURE_PATH):
+    """Returns: list of {"artist", "title", "expected_id", "response"}, response is the body of the /search request"""
+    with open(fixture_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def hits_of(case):
+    return case['response'].get('response', {}).get('hits', [])
+
+
+def benchmark_ranking(cases):
+    """
+    Compare the correct-match rate of the ranking with just taking the first hit
+    Returns:
+        dict: number of cases and the correct-match rate of both
+    """
+    ranked_correct = first_hit_correct = 0
+    for case in cases:
+        hits = hits_of(case)
+        genius_id, _ = best_hit(hits, case['artist'], case['title'])
+        first_hit = hits[0].get('result', {}).get('id') if hits else None
+        ranked_correct += genius_id == case['expected_id']
+        first_hit_correct += first_hit == case['expected_id']
+        if genius_id != case['expected_id']:
+            print(f"❌ {case['title']} by {case['artist']}: got {genius_id}, expected {case['expected_id']}")
+
+    results = {
+        "cases": len(cases),
+        "ranked": ranked_correct / len(cases) if cases else 0.0,
+        "first_hit": first_hit_correct / len(cases) if cases else 0.0,
+    }
+    print(f"📊 Genius matching over {results['cases']} cases: ranked {results['ranked']:.0%}, first hit {results['first_hit']:.0%}")
+    return results
+
+
+def record_case(artist, title, expected_id, fixture_path=FIXTURE_PATH):
+    """Search Genius like get_genius_track_id does and append the raw response as a new case"""
+    from src.genius import get_genius_token
+    from src.http_client import get_session
+    response = get_session().get('https://api.genius.com/search', params={'q': f"{artist.strip()} {title.strip()}"},
+                                 headers={'Authorization': f'Bearer {get_genius_token()}'})
+    response.raise_for_status()
+    cases = load_cases(fixture_path)
+    cases.append({"artist": artist, "title": title, "source": "api", "query": f"{artist.strip()} {title.strip()}",
+                  "expected_id": expected_id, "response": response.json()})
+    with open(fixture_path, 'w', encoding='utf-8') as f:
+        json.dump(cases, f, ensure_ascii=False, indent=2)
+    print(f"✅ Recorded {len(hits_of(cases[-1]))} hits for {title} by {artist}")
+
+
+@pytest.mark.parametrize("case", load_cases(), ids=lambda case: f"{case['artist']} - {case['title']}")
+def test_best_hit(case):
+    genius_id, _ = best_hit(hits_of(case), case['artist'], case['title'])
+    assert genius_id == case['expected_id'], case.get('note')
+
+
+def test_ranking_beats_first_hit():
+    results = benchmark_ranking(load_cases())
+    assert results["ranked"] > results["first_hit"]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["record"]:
+        artist, title, expected = sys.argv[2:5]
+        record_case(artist, title, None if expected == "null" else int(expected))
+    else:
+        benchmark_ranking(load_cases())
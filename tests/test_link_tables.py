@@ -0,0 +1,64 @@
+from src.database import factory
+
+
+def genres_of(database, track_id):
+    return sorted(database.conn.execute('''
+        SELECT genres.name, track_genres.is_top FROM track_genres JOIN genres ON genres.id = track_genres.genre_id
+        WHERE track_id = ?
+    ''', (track_id,)).fetchall())
+
+def featured_of(database, track_id):
+    return [row[0] for row in database.conn.execute(
+        'SELECT artist_name FROM track_featured_artists WHERE track_id = ? ORDER BY position', (track_id,))]
+
+
+def test_genre_lists_are_stored_with_separator(database, make_track, make_features):
+    database.write_batch(audio_features=[make_features("t1", ["hip hop", "rap"], ["trap", "pop rap"])])
+    assert database.conn.execute('SELECT top_genre, other_genres FROM audio_features').fetchone() == ("hip hop, rap", "trap, pop rap")
+    assert genres_of(database, "t1") == [("hip hop", 1), ("pop rap", 0), ("rap", 1), ("trap", 0)]
+
+
+def test_backfill_keeps_links_written_by_the_import(database, make_track, make_features):
+    database.write_batch(
+        tracks=[make_track("t1", featured=["Tyler, The Creator", "Kali Uchis"])],
+        audio_features=[make_features("t1", ["hip hop", "rap"], [], featured="Tyler, The Creator, Kali Uchis")],
+    )
+    database.backfill_links()
+    assert genres_of(database, "t1") == [("hip hop", 1), ("rap", 1)]
+    assert featured_of(database, "t1") == ["Tyler, The Creator", "Kali Uchis"]
+
+
+def test_backfill_splits_rows_without_links(database, make_track, make_features):
+    database.write_batch(tracks=[make_track("t0", featured=["Tyler, The Creator"])])  # makes the name known
+    database.write_batch(audio_features=[make_features("t2", "soul", "r&b, funk", featured="Tyler, The Creator, Kali Uchis")])
+    database.conn.execute('DELETE FROM track_genres WHERE track_id = ?', ("t2",))
+    database.conn.execute('DELETE FROM track_featured_artists WHERE track_id = ?', ("t2",))
+    database.conn.commit()
+
+    database.backfill_links()
+    assert genres_of(database, "t2") == [("funk", 0), ("r&b", 0), ("soul", 1)]
+    assert featured_of(database, "t2") == ["Tyler, The Creator", "Kali Uchis"]
+
+
+def test_genre_spellings_are_one_genre(database, make_track, make_features):
+    database.write_batch(audio_features=[make_features("t1", "Hip-Hop", "R&B"), make_features("t2", "hip hop", "r&b")])
+    assert genres_of(database, "t1") == [("hip hop", 1), ("r&b", 0)]
+    assert sorted(database.tracks_with_genre("Hip-Hop")) == ["t1", "t2"]
+
+
+def test_migration_merges_old_genre_spellings(database, make_track, make_features):
+    database.write_batch(audio_features=[make_features("t1", "hip hop", "")])
+    with database.conn:  # links written before the names were normalized
+        database.conn.execute("INSERT INTO genres (name) VALUES ('hip-hop'), ('lo-fi')")
+        database.conn.execute('''
+            INSERT INTO track_genres (track_id, genre_id, is_top)
+            SELECT 't2', id, 1 FROM genres WHERE name = 'hip-hop' UNION ALL SELECT 't2', id, 0 FROM genres WHERE name = 'lo-fi'
+        ''')
+    version, _, statements = factory.MIGRATIONS[5]
+    assert version == 6
+    with database.conn:
+        for statement in statements:
+            database.conn.execute(statement)
+    assert [name for (name,) in database.conn.execute('SELECT name FROM genres ORDER BY name')] == ["hip hop", "lo fi"]
+    assert genres_of(database, "t2") == [("hip hop", 1), ("lo fi", 0)]
+    assert sorted(database.tracks_with_genre("hip hop", top_only=True)) == ["t1", "t2"]
@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+from src import ai
+from src.database.lyric_attributes_cache import LyricAttributeCache
+
+
+def test_fallback_counts_one_miss_per_track(db_path, monkeypatch, capsys):
+    schema = ai.load_lyric_attributes_schema()
+    cache = LyricAttributeCache(schema, db_path)
+    cache.put(ai.lyrics_to_text(["[Chorus]\nknown"]), ai.GEMINI_MODEL_NAME, {"cached": True})
+    monkeypatch.setattr(ai, "get_lyric_attribute_cache", lambda schema: cache)
+    # the batch request fails, every track goes through the single track fallback
+    monkeypatch.setattr(ai, "analyze_lyrics_batch", lambda lyrics_list, single, **kwargs: [single(l) for l in lyrics_list])
+    monkeypatch.setattr(ai, "model", SimpleNamespace(generate_content=lambda text: SimpleNamespace(text='{"new": true}')))
+
+    results = ai.get_lyric_attributes_ai_batch([["[Chorus]\nknown"], ["[Verse]\nnew one"], None, ["[Verse]\nnew two"]])
+    assert results == [{"cached": True}, {"new": True}, None, {"new": True}]
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert "(1 cached)" in capsys.readouterr().out  # the track without lyrics isn't cached
@@ -0,0 +1,72 @@
+import os
+import pytest
+import src.cache_manager as cache_manager
+import src.lyrics_extractor as lyrics_extractor
+from src.cache_manager import CacheStore
+from src.lyrics_extractor import extract_lyrics
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fixtures")
+
+# one saved page per Genius layout, named after the strategy that has to pick it up
+EXPECTED = {
+    "data_attribute": (
+        "[Verse 1]\nI wrote this line for the & test\nan annotated line\nan italic line\n\n"
+        "[Chorus]\nChorus line, it's here\n[Verse 2]\nSecond container line\nLast line"
+    ),
+    "preloaded_state": "[Intro]\nOnly in the state, don't miss it\nannotated & escaped\n[Outro]\n\"Quoted\" last line",
+    "legacy_class": "[Verse 1]\nLegacy line one\nLegacy annotated line\n\n[Chorus]\nLegacy chorus",
+    "bjajog_class": "[Verse 1]\nBjajog line one\nBjajog annotated\n\n[Bridge]\nBjajog bridge",
+}
+
+
+def page(layout):
+    with open(os.path.join(FIXTURES, f"genius_{layout}.html"), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A cache.json of its own, so the remembered strategy of one test doesn't leak into the next"""
+    store = CacheStore(str(tmp_path / "cache.json"))
+    monkeypatch.setattr(cache_manager, "_cache", store)
+    monkeypatch.setattr(lyrics_extractor, "strategy_stats", {name: 0 for name in lyrics_extractor.STRATEGIES})
+    return store
+
+
+@pytest.mark.parametrize("layout", list(EXPECTED))
+def test_extracts_every_layout(cache, layout):
+    assert extract_lyrics(page(layout)) == EXPECTED[layout]
+    assert cache.lyrics_strategy == layout
+    assert lyrics_extractor.strategy_stats[layout] == 1
+
+
+def test_no_lyrics_on_page(cache):
+    assert extract_lyrics("<html><body><div class=\"other\">nothing here</div></body></html>") is None
+    assert cache.lyrics_strategy is None
+
+
+def test_last_strategy_is_tried_first(cache, monkeypatch):
+    extract_lyrics(page("legacy_class"))
+    tried = []
+    for name, strategy in list(lyrics_extractor.STRATEGIES.items()):
+        monkeypatch.setitem(lyrics_extractor.STRATEGIES, name,
+                            lambda html, name=name, strategy=strategy: tried.append(name) or strategy(html))
+    assert extract_lyrics(page("legacy_class")) == EXPECTED["legacy_class"]
+    assert tried == ["legacy_class"]
+
+
+def test_last_strategy_survives_a_restart(cache, monkeypatch):
+    extract_lyrics(page("bjajog_class"))
+    cache.flush()
+    monkeypatch.setattr(cache_manager, "_cache", CacheStore(cache.path))  # a new process reads the file
+    assert cache_manager.get_cache().lyrics_strategy == "bjajog_class"
+
+
+def test_sections_keep_every_line(cache):
+    from src.genius import split_sections
+    sections = split_sections(extract_lyrics(page("data_attribute")))
+    assert sections[0].startswith("[Verse 1]") and len(sections) == 3
+    assert "".join(sections) == EXPECTED["data_attribute"]
+    assert split_sections("Intro line\n[Chorus]\nla la") == ["Intro line\n", "[Chorus]\nla la"]
+    assert split_sections("A song without section headers") == ["A song without section headers"]
+    assert split_sections("") == [] and split_sections(None) == []
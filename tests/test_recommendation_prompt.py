@@ -0,0 +1,15 @@
+import re
+from src.ai import build_recommendation_prompt
+
+
+def rule_numbers(prompt):
+    return [int(number) for number in re.findall(r'^\s*(\d+)\. ', prompt, re.MULTILINE)]
+
+
+def test_rules_are_numbered_without_gaps():
+    shortlist = [("Yesterday", "The Beatles")]
+    assert rule_numbers(build_recommendation_prompt("similar", "origin", 5, {}, {})) == [1, 2, 3]
+    assert rule_numbers(build_recommendation_prompt("similar", "origin", 5, {}, {}, candidates=shortlist)) == [1, 2, 3, 4]
+    prompt = build_recommendation_prompt("similar", "origin", 5, {}, {}, exclude=[("Hey Jude", "The Beatles")], candidates=shortlist)
+    assert rule_numbers(prompt) == [1, 2, 3, 4, 5]
+    assert "4. DO NOT recommend" in prompt and "5. Prefer tracks from this shortlist" in prompt
@@ -0,0 +1,34 @@
+import threading
+from src import recommendations
+from src.recommendations import Recommendation, iter_recommendations, parse_recommendations
+
+ANSWER = '[{"title": "Bohemian Rhapsody", "artist": "Queen"}, {"title": "Yesterday", "artist": "The Beatles"}]'
+EXPECTED = [Recommendation("Bohemian Rhapsody", "Queen"), Recommendation("Yesterday", "The Beatles")]
+
+
+def test_array():
+    assert parse_recommendations("```json\n" + ANSWER + "\n```") == EXPECTED
+
+
+def test_wrapped_array():
+    assert parse_recommendations('{"recommendations": ' + ANSWER + '}') == EXPECTED
+    assert parse_recommendations('```json\n{\n  "songs": ' + ANSWER + '\n}\n```') == EXPECTED
+
+
+def test_wrapped_array_streamed_in_pieces():
+    text = '{"recommendations": ' + ANSWER + '}'
+    assert list(iter_recommendations(text[i:i + 7] for i in range(0, len(text), 7))) == EXPECTED
+
+
+def test_error_answer_has_no_entries():
+    assert parse_recommendations('{"error": "Invalid input combination"}') == []
+
+
+def test_counters_are_exact_across_threads(monkeypatch):
+    monkeypatch.setattr(recommendations, "parse_stats", {name: 0 for name in recommendations.parse_stats})
+    threads = [threading.Thread(target=lambda: [parse_recommendations(ANSWER) for _ in range(200)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert recommendations.parse_stats == {"responses": 1600, "entries": 3200, "invalid_entries": 0, "failed_responses": 0}
@@ -0,0 +1,39 @@
+import pytest
+from src.database.resolution_index import ResolutionIndex, title_key, version_markers
+
+
+@pytest.fixture
+def index(db_path):
+    return ResolutionIndex(db_path)
+
+
+@pytest.mark.parametrize("title, markers", [
+    ("Mask Off (Remix)", ["remix"]),
+    ("Hello - Live", ["live"]),
+    ("Smells Like Teen Spirit (Live at Reading)", ["live"]),
+    ("Song (Pt. II)", ["part 2"]),
+    ("Song - Part 2", ["part 2"]),
+    ("Bohemian Rhapsody - Remastered 2011", []),
+    ("Get Lucky (feat. Pharrell Williams) - Radio Edit", []),
+    ("Lose Yourself - From \"8 Mile\" Soundtrack", []),
+])
+def test_version_markers(title, markers):
+    assert version_markers(title) == markers
+
+
+def test_versions_resolve_separately(index):
+    index.add("Mask Off", "Future", "original")
+    index.add("Mask Off - Remix", "Future", "remix")
+    assert index.lookup("Mask Off (Remix)", "Future")["track_id"] == "remix"
+    assert index.lookup("Mask Off", "Future")["track_id"] == "original"
+    assert index.lookup("Mask Off - 2017 Remaster", "Future")["track_id"] == "original"
+    assert index.lookup("Hello - Live", "Adele") is None
+    index.add("Hello", "Adele", "studio")
+    assert index.lookup("Hello - Live", "Adele") is None  # no fuzzy hit on another version either
+
+
+def test_fuzzy_match_keeps_numbers_apart(index):
+    index.add("Symphony of Destruction Part I", "Band", "part1")
+    assert index.lookup("Symphony of Destruction Part II", "Band") is None
+    assert index.lookup("Symphony of Destructon Part I", "Band")["track_id"] == "part1"  # typo, same part
+    assert title_key("Song (Pt. 2)") == title_key("Song - Part II")
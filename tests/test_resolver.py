@@ -0,0 +1,76 @@
+import threading
+import time
+import pytest
+from src import resolver
+
+
+def fake_search(sp, name, artist):
+    return f"spotify:track:{name}"
+
+
+def test_results_dont_wait_for_the_next_pair(monkeypatch):
+    monkeypatch.setattr(resolver, "search_track", fake_search)
+    released = threading.Event()
+    waited = []
+
+    def slow_stream():  # like a model that takes its time for the second recommendation
+        yield ("first", "Artist")
+        waited.append(released.wait(timeout=2))
+        yield ("second", "Artist")
+
+    results = resolver.resolve_results(None, slow_stream())
+    assert next(results) == (("first", "Artist"), "spotify:track:first")
+    released.set()  # only now the second pair arrives
+    assert list(results) == [(("second", "Artist"), "spotify:track:second")]
+    assert waited == [True]
+
+
+def test_stream_errors_reach_the_caller_after_the_finished_searches(monkeypatch):
+    monkeypatch.setattr(resolver, "search_track", fake_search)
+
+    def broken_stream():
+        yield ("first", "Artist")
+        raise ConnectionError("stream broke")
+
+    results = resolver.resolve_results(None, broken_stream())
+    assert next(results)[1] == "spotify:track:first"
+    with pytest.raises(ConnectionError):
+        next(results)
+
+
+def test_stopping_early_stops_reading(monkeypatch):
+    monkeypatch.setattr(resolver, "search_track", fake_search)
+    read = []
+
+    def endless_stream():
+        for i in range(1000):
+            read.append(i)
+            time.sleep(0.001)
+            yield (f"song {i}", "Artist")
+
+    for _ in resolver.resolve_results(None, endless_stream()):
+        break
+    time.sleep(0.05)
+    assert len(read) < 1000
+
+
+def test_batches_are_given_out_while_the_stream_arrives():
+    released = threading.Event()
+    waited = []
+
+    def slow_uris():
+        yield "spotify:track:1"
+        yield "spotify:track:2"
+        waited.append(released.wait(timeout=2))
+        yield "spotify:track:3"
+
+    batches = resolver.batched_stream(slow_uris(), size=100, linger=0.05)
+    assert next(batches) == ["spotify:track:1", "spotify:track:2"]  # after the linger, not at the end of the stream
+    released.set()
+    assert list(batches) == [["spotify:track:3"]]
+    assert waited == [True]
+
+
+def test_full_batches_dont_linger():
+    batches = list(resolver.batched_stream(iter(range(5)), size=2, linger=10))
+    assert batches == [[0, 1], [2, 3], [4]]
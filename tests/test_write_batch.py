@@ -0,0 +1,56 @@
+from src.database.track_attributes import data
+
+
+def stored_ids(database, table):
+    return {row[0] for row in database.conn.execute(f'SELECT track_id FROM {table}')}
+
+
+def test_whole_batch_in_one_go(database, make_track, make_features):
+    written = database.write_batch([make_track("t1"), make_track("t2")], [make_features("t1"), make_features("t2")])
+    assert written == {"artists": set(), "tracks": {"t1", "t2"}, "audio_features": {"t1", "t2"}}
+    assert stored_ids(database, "tracks") == {"t1", "t2"}
+
+
+def test_failing_record_only_loses_itself(database, make_track, make_features):
+    bad = make_track("t2", album_name={"not": "bindable"})  # sqlite3 can't store a dict, the batch fails
+    written = database.write_batch([make_track("t1"), bad, make_track("t3")],
+                                   [make_features("t1"), make_features("t2"), make_features("t3")])
+    assert written["tracks"] == {"t1", "t3"}
+    assert written["audio_features"] == {"t1", "t3"}  # t2's features go with its track
+    assert stored_ids(database, "tracks") == {"t1", "t3"}
+    assert stored_ids(database, "audio_features") == {"t1", "t3"}
+
+
+def test_broken_dict_is_skipped(database, make_track, make_features):
+    written = database.write_batch([make_track("t1"), {"track_id": "t2"}], [make_features("t1")])
+    assert written["tracks"] == {"t1"}
+    assert stored_ids(database, "tracks") == {"t1"}
+
+
+def test_writer_never_fetches_missing_facts(monkeypatch):
+    def no_network(*args):
+        raise AssertionError("the writer must not call an API")
+    for loader in ("get_song_metadata", "get_song_genre", "get_song_lyrics", "get_main_artist_id"):
+        monkeypatch.setattr(data, loader, no_network)
+    track = data("Main", "Song", "t1", lyrics="la la")
+    track._facts["metadata"] = {"featured_artists": [], "album_name": "Album", "album_id": "a1"}  # the genre stage failed
+    track.fetched_only()
+    assert track.audio_features_to_dict() is None
+    assert track.track_data_to_dict()["main_artist_id"] is None
+
+
+def test_failed_artist_is_tried_again(monkeypatch):
+    from src.database.db import fetch_artist
+    answers = iter([RuntimeError("scraping failed"), None, {"id": "a1", "name": "Main"}])
+
+    def artist_to_dict(self):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    monkeypatch.setattr(data, "artist_to_dict", artist_to_dict)
+
+    stage = fetch_artist(known_artist_ids=[])
+    tracks = [data("Main", f"Song {i}", f"t{i}", artist_id="a1") for i in range(4)]
+    assert [stage(track).artist_dict for track in tracks] == [None, None, {"id": "a1", "name": "Main"}, None]
+    assert stage.known == {"a1"}  # loaded once it worked, the last track doesn't load it again